@@ -0,0 +1,589 @@
+###############################################################################
+# Micro-benchmarks for the different stages of the Pinky toolchain.
+#
+# Usage:
+#
+#   python3 bench.py lexer [--scale N] [--repeat N] [scripts...]
+#   python3 bench.py stream [--scale N] [scripts...]
+#   python3 bench.py tokens [--scale N] [--repeat N] [scripts...]
+#   python3 bench.py rss [--scale N] [scripts...]
+#   python3 bench.py run [--repeat N] [scripts...]
+#   python3 bench.py parser [--scale N] [--repeat N] [scripts...]
+#   python3 bench.py nesting [--repeat N]
+#   python3 bench.py cache [--scale N] [--repeat N] [scripts...]
+#   python3 bench.py ast [--scale N] [--repeat N] [scripts...]
+#   python3 bench.py flat [--scale N] [--repeat N] [scripts...]
+#   python3 bench.py walkers [--scale N] [--repeat N] [scripts...]
+#   python3 bench.py calls [--repeat N]
+#   python3 bench.py values [--repeat N] [scripts...]
+#   python3 bench.py scopes [--repeat N] [scripts...]
+#   python3 bench.py loops [--repeat N]
+#   python3 bench.py profile [--repeat N] [scripts...]
+#   python3 bench.py output [--repeat N]
+#   python3 bench.py strings [--repeat N]
+#
+# Every benchmark reports the best time out of --repeat runs, so the numbers
+# are comparable between machines only as ratios.
+###############################################################################
+import io
+import os
+import sys
+import subprocess
+import glob
+import random
+import time
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+from compiler import *
+from vm import *
+from model import *
+from cache import *
+from flat import *
+from closures import *
+from untagged import *
+from pyast import *
+from resolver import *
+from memo import *
+from profiler import *
+import rope
+
+def best_time(func, repeat):
+  best = float('inf')
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    best = min(best, time.perf_counter() - start)
+  return best
+
+def load_sources(filenames, scale):
+  sources = []
+  for filename in filenames:
+    with open(filename) as file:
+      sources.append((filename, '\n'.join([file.read()] * scale)))
+  return sources
+
+def bench_lexer(args):
+  print(f'{"script":40} {"tokens":>8} {"classic":>10} {"regex":>10} {"speedup":>8}')
+  for filename, source in load_sources(args.scripts, args.scale):
+    classic_tokens = Lexer(source).tokenize()
+    regex_tokens = RegexLexer(source).tokenize()
+    if repr(classic_tokens) != repr(regex_tokens):
+      raise SystemExit(f'{filename}: the lexers produced different tokens')
+    classic = best_time(lambda: Lexer(source).tokenize(), args.repeat)
+    regex = best_time(lambda: RegexLexer(source).tokenize(), args.repeat)
+    print(f'{filename:40} {len(classic_tokens):>8} {classic*1000:>8.2f}ms {regex*1000:>8.2f}ms {classic/regex:>7.1f}x')
+
+def peak_memory(func):
+  tracemalloc.start()
+  try:
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    return result, elapsed, tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+def retained_memory(func):
+  tracemalloc.start()
+  try:
+    result = func()
+    return result, tracemalloc.get_traced_memory()[0]
+  finally:
+    tracemalloc.stop()
+
+def bench_stream(args):
+  print(f'{"script":40} {"size":>9} {"mode":>14} {"tokens":>9} {"time":>10} {"peak memory":>12}')
+  for filename, source in load_sources(args.scripts, args.scale):
+    with tempfile.NamedTemporaryFile('w', suffix='.pinky', delete=False) as file:
+      file.write(source)
+    del source
+    try:
+      def read_all():
+        with open(file.name) as stream:
+          return len(RegexLexer(stream.read()).tokenize())
+      def iterate():
+        with open(file.name) as stream:
+          return sum(1 for token in RegexLexer(stream).iter_tokens())
+      size = os.path.getsize(file.name)
+      for mode, func in [('tokenize()', read_all), ('iter_tokens()', iterate)]:
+        count, elapsed, peak = peak_memory(func)
+        print(f'{filename:40} {size/2**20:>7.1f}MB {mode:>14} {count:>9} {elapsed*1000:>8.0f}ms {peak/2**20:>10.1f}MB')
+    finally:
+      os.unlink(file.name)
+
+def bench_tokens(args):
+  print(f'{"script":40} {"tokens":>8} {"mode":>8} {"bytes/token":>12} {"lex":>10} {"parse":>10}')
+  for filename, source in load_sources(args.scripts, args.scale):
+    modes = [
+      ('objects', lambda: RegexLexer(source).tokenize(), Parser),
+      ('compact', lambda: RegexLexer(source).tokenize_compact(), CompactParser),
+    ]
+    for mode, lex, parser_class in modes:
+      tokens, size = retained_memory(lex)
+      lexing = best_time(lex, args.repeat)
+      parsing = best_time(lambda: parser_class(tokens).parse(), args.repeat)
+      print(f'{filename:40} {len(tokens):>8} {mode:>8} {size/len(tokens):>12.1f} {lexing*1000:>8.2f}ms {parsing*1000:>8.2f}ms')
+
+# Each mode runs in a fresh interpreter so that its peak RSS is not shared with the others
+RSS_MODES = {
+  'startup': 'tokens = []',
+  'read + tokenize()': 'tokens = RegexLexer(open(filename).read()).tokenize()',
+  'read + compact': 'tokens = RegexLexer(open(filename).read()).tokenize_compact()',
+  'mmap + compact': 'file = open(filename, "rb"); tokens = RegexLexer(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)).tokenize_compact()',
+}
+
+def bench_rss(args):
+  print(f'{"script":40} {"size":>9} {"mode":>18} {"tokens":>9} {"time":>10} {"peak RSS":>10}')
+  for filename, source in load_sources(args.scripts, args.scale):
+    with tempfile.NamedTemporaryFile('w', suffix='.pinky', delete=False) as file:
+      file.write(source)
+    del source
+    try:
+      size = os.path.getsize(file.name)
+      for mode, statement in RSS_MODES.items():
+        code = f'import mmap, time; from lexer import *; filename = {file.name!r}; start = time.perf_counter(); {statement}; print(len(tokens), time.perf_counter() - start)'
+        child = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, text=True)
+        output = child.stdout.read().split()
+        _, status, usage = os.wait4(child.pid, 0)
+        if status != 0:
+          raise SystemExit(f'{filename}: {mode} failed')
+        count, elapsed = int(output[0]), float(output[1])
+        print(f'{filename:40} {size/2**20:>7.1f}MB {mode:>18} {count:>9} {elapsed*1000:>8.0f}ms {usage.ru_maxrss/2**10:>8.1f}MB')
+    finally:
+      os.unlink(file.name)
+
+class NullOutput(io.TextIOBase):
+  '''A stdout replacement that throws the text away and only counts it'''
+  def __init__(self):
+    self.size = 0
+
+  def write(self, text):
+    self.size += len(text)
+    return len(text)
+
+def bench_run(args):
+  print(f'{"script":40} {"engine":>12} {"output":>9} {"time":>10}')
+  for filename, source in load_sources(args.scripts, 1):
+    ast = Parser(Lexer(source).tokenize()).parse()
+    resolved = Resolver().resolve(Parser(Lexer(source).tokenize()).parse())
+    code = Compiler().generate_code(ast)
+    engines = [
+      ('interpreter', lambda: Interpreter().interpret_ast(ast)),
+      ('resolved', lambda: Interpreter().interpret_ast(resolved)),
+      ('untagged', lambda: UntaggedInterpreter().interpret_ast(resolved)),
+      ('closures', lambda: ClosureInterpreter().interpret_ast(resolved)),
+      ('python', lambda: PythonCompiler().interpret_ast(ast)),
+      ('vm', lambda: VM().run(code)),
+    ]
+    for engine, run in engines:
+      # The output is discarded, but its size is reported to check that the engine did the work
+      output = NullOutput()
+      with contextlib.redirect_stdout(output):
+        elapsed = best_time(run, args.repeat)
+      print(f'{filename:40} {engine:>12} {output.size//args.repeat:>9} {elapsed*1000:>8.1f}ms')
+
+def random_expression(rand, depth):
+  if depth == 0 or rand.random() < 0.2:
+    return rand.choice(['x', 'y', '1', '2.5', '"str"', 'true', 'f(x)'])
+  kind = rand.random()
+  if kind < 0.1:
+    return rand.choice(['-', '~']) + ' ' + random_expression(rand, depth - 1)
+  if kind < 0.2:
+    return '(' + random_expression(rand, depth - 1) + ')'
+  if kind < 0.25:
+    return f'g({random_expression(rand, depth - 1)}, {random_expression(rand, depth - 1)})'
+  op = rand.choice(['+', '-', '*', '/', '%', '^', '==', '~=', '<', '>', '<=', '>=', 'and', 'or'])
+  left, right = random_expression(rand, depth - 1), random_expression(rand, depth - 1)
+  if op == '^' and right[0] in '-~':
+    right = f'({right})' # The right operand of '^' cannot be a unary operation
+  return f'{left} {op} {right}'
+
+def expression_source(lines):
+  '''An expression-heavy program: one random assignment per line'''
+  rand = random.Random(0)
+  return '\n'.join(f'x := {random_expression(rand, 6)}' for _ in range(lines))
+
+def bench_parser(args):
+  print(f'{"script":40} {"tokens":>8} {"recursive":>10} {"pratt":>10} {"tokens/s":>10} {"speedup":>8}')
+  sources = load_sources(args.scripts, args.scale) + [('<expressions>', expression_source(200 * args.scale))]
+  for filename, source in sources:
+    tokens = Lexer(source).tokenize()
+    if repr(Parser(tokens).parse()) != repr(PrattParser(tokens).parse()):
+      raise SystemExit(f'{filename}: the parsers produced different trees')
+    recursive = best_time(lambda: Parser(tokens).parse(), args.repeat)
+    pratt = best_time(lambda: PrattParser(tokens).parse(), args.repeat)
+    print(f'{filename:40} {len(tokens):>8} {recursive*1000:>8.2f}ms {pratt*1000:>8.2f}ms {len(tokens)/pratt/1e6:>9.2f}M {recursive/pratt:>7.1f}x')
+
+def nested_sources(depth):
+  return [
+    ('parentheses', 'x := ' + '(' * depth + '1' + ')' * depth),
+    ('unary', 'x := ' + '- ' * depth + '1'),
+    ('exponent', 'x := ' + '2 ^ ' * depth + '1'),
+    ('calls', 'func f(a) ret a end x := ' + 'f(' * depth + '0' + ')' * depth),
+    ('ifs', 'if true then ' * depth + 'println 1' + ' end' * depth),
+    ('else-ifs', 'x := 0 ' + ''.join(f'if x == {i} then println {i} else ' for i in range(depth)) + 'println 0' + ' end' * depth),
+  ]
+
+def bench_nesting(args):
+  '''Parse and compile deeply nested programs with the recursive and the explicit stack front ends'''
+  print(f'{"construct":12} {"depth":>8} {"recursive":>14} {"stack":>10}')
+  front_ends = [(Parser, Compiler), (StackParser, StackCompiler)]
+  for depth in [100, 1_000, 10_000, 100_000]:
+    for construct, source in nested_sources(depth):
+      tokens = Lexer(source).tokenize()
+      times = []
+      for parser_class, compiler_class in front_ends:
+        try:
+          times.append(f'{best_time(lambda: compiler_class().generate_code(parser_class(tokens).parse()), args.repeat)*1000:.1f}ms')
+        except RecursionError:
+          times.append('RecursionError')
+      print(f'{construct:12} {depth:>8} {times[0]:>14} {times[1]:>10}')
+
+def bench_cache(args):
+  print(f'{"script":40} {"tokens":>8} {"lex+parse":>10} {"cache hit":>10} {"speedup":>8}')
+  for filename, source in load_sources(args.scripts, args.scale):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, os.path.basename(filename))
+      with open(path, 'w') as file:
+        file.write(source)
+      def parse():
+        with open(path) as file:
+          return Parser(Lexer(file.read()).tokenize()).parse()
+      ParseCache(path).store(parse())
+      if repr(ParseCache(path).load()) != repr(parse()):
+        raise SystemExit(f'{filename}: the cached tree is different')
+      parsing = best_time(parse, args.repeat)
+      loading = best_time(lambda: ParseCache(path).load(), args.repeat)
+      print(f'{filename:40} {len(Lexer(source).tokenize()):>8} {parsing*1000:>8.2f}ms {loading*1000:>8.2f}ms {parsing/loading:>7.1f}x')
+
+def bench_ast(args):
+  print(f'{"script":40} {"nodes":>8} {"bytes/node":>11} {"parse":>10} {"verify":>10}')
+  sources = load_sources(args.scripts, args.scale) + [('<expressions>', expression_source(200 * args.scale))]
+  for filename, source in sources:
+    tokens = Lexer(source).tokenize()
+    # Everything allocated by the parser and still alive is the tree (nodes, lists and their values)
+    ast, size = retained_memory(lambda: Parser(tokens).parse())
+    nodes = sum(1 for node in walk(ast))
+    parsing = best_time(lambda: Parser(tokens).parse(), args.repeat)
+    verifying = best_time(lambda: verify(ast), args.repeat)
+    print(f'{filename:40} {nodes:>8} {size/nodes:>11.1f} {parsing*1000:>8.2f}ms {verifying*1000:>8.2f}ms')
+
+def bench_flat(args):
+  print(f'{"script":40} {"nodes":>8} {"objects":>9} {"flat":>9} {"flatten":>10} {"to_model":>10}')
+  sources = load_sources(args.scripts, args.scale) + [('<expressions>', expression_source(200 * args.scale))]
+  for filename, source in sources:
+    tokens = Lexer(source).tokenize()
+    ast, objects_size = retained_memory(lambda: Parser(tokens).parse())
+    # The tree is parsed inside the measurement too, so the literals kept in the pools are counted
+    flat_ast, flat_size = retained_memory(lambda: FlatAST(Parser(tokens).parse()))
+    if repr(flat_ast.to_model()) != repr(ast):
+      raise SystemExit(f'{filename}: the flat tree does not round-trip')
+    flattening = best_time(lambda: FlatAST(ast), args.repeat)
+    rebuilding = best_time(flat_ast.to_model, args.repeat)
+    print(f'{filename:40} {len(flat_ast):>8} {objects_size/len(flat_ast):>8.1f}B {flat_size/len(flat_ast):>8.1f}B {flattening*1000:>8.2f}ms {rebuilding*1000:>8.2f}ms')
+
+def bench_walkers(args):
+  '''Time the tree walkers: the interpreter (a run of the program), the compiler and the LLVM IR generator'''
+  try:
+    from llvm import LLVMGenerator
+  except ImportError:
+    LLVMGenerator = None # llvmlite is not installed
+  print(f'{"script":40} {"walker":>12} {"time":>10}')
+  for filename, source in load_sources(args.scripts, args.scale):
+    ast = Parser(Lexer(source).tokenize()).parse()
+    walkers = [
+      ('interpreter', lambda: Interpreter().interpret_ast(ast)),
+      ('compiler', lambda: Compiler().generate_code(ast)),
+    ]
+    if LLVMGenerator:
+      walkers.append(('llvm', lambda: LLVMGenerator().generate_main(ast)))
+    for walker, run in walkers:
+      try:
+        with contextlib.redirect_stdout(NullOutput()):
+          elapsed = best_time(run, args.repeat)
+      except SystemExit:
+        print(f'{filename:40} {walker:>12} {"error":>10}')
+        continue
+      print(f'{filename:40} {walker:>12} {elapsed*1000:>8.2f}ms')
+
+# Call-heavy programs: most of their time goes into calls and returns
+CALL_SOURCES = [
+  ('fib(20)', '''
+    func fib(n)
+      if n < 2 then ret n end
+      ret fib(n - 1) + fib(n - 2)
+    end
+    println fib(20)
+  '''),
+  ('factorial x2000', '''
+    func factorial(n)
+      if n <= 1 then ret 1 end
+      ret n * factorial(n - 1)
+    end
+    total := 0
+    for i := 1, 2000 do total := factorial(20) end
+    println total
+  '''),
+]
+
+def bench_calls(args):
+  '''
+  Run recursive programs with the AST engines (fib, factorial, and the dragon curve at several levels),
+  and with the interpreter memoizing the calls to their pure functions
+  '''
+  with open('scripts/dragon.pinky') as file:
+    dragon = file.read()
+  sources = CALL_SOURCES + [(f'dragon level {level}', dragon.replace('dragon(60, 12, 1)', f'dragon(60, {level}, 1)')) for level in (12, 14)]
+  print(f'{"program":20} {"engine":>12} {"time":>10}')
+  for program, source in sources:
+    resolver = Resolver()
+    ast = resolver.resolve(Parser(Lexer(source).tokenize()).parse())
+    Purity(resolver.bindings).analyze(ast)
+    engines = [
+      ('interpreter', lambda: Interpreter().interpret_ast(ast)),
+      ('memoized', lambda: Interpreter(MemoCache(1024)).interpret_ast(ast)),
+      ('closures', lambda: ClosureInterpreter().interpret_ast(ast)),
+    ]
+    for engine, run in engines:
+      with contextlib.redirect_stdout(NullOutput()):
+        elapsed = best_time(run, args.repeat)
+      print(f'{program:20} {engine:>12} {elapsed*1000:>8.1f}ms')
+
+class Stop(Exception):
+  pass
+
+def allocations(interpreter_class, ast, operations):
+  '''
+  The memory blocks and bytes allocated while a program evaluates its first
+  expressions. The value of every expression is kept alive until the end, so
+  tracemalloc also sees the values that are thrown away right after their use
+  '''
+  values = [None] * operations
+  count = 0
+  class Recorder(interpreter_class):
+    def interpret(self, node, env):
+      nonlocal count, snapshot
+      value = super().interpret(node, env)
+      if isinstance(node, Expr):
+        values[count] = value
+        count += 1
+        if count == operations:
+          snapshot = tracemalloc.take_snapshot()
+          raise Stop()
+      return value
+  snapshot = None
+  tracemalloc.start()
+  try:
+    with contextlib.redirect_stdout(NullOutput()):
+      Recorder().interpret_ast(ast)
+  except Stop:
+    pass
+  finally:
+    tracemalloc.stop()
+  stats = snapshot.statistics('filename') if snapshot else []
+  return sum(stat.count for stat in stats) / count, sum(stat.size for stat in stats) / count
+
+def bench_values(args):
+  '''Allocations per evaluated expression and run time, with tagged (type, value) tuples and with untagged values'''
+  print(f'{"script":40} {"engine":>12} {"blocks/op":>10} {"bytes/op":>9} {"time":>10}')
+  scripts = args.scripts if args.scripts != DEFAULT_SCRIPTS else ['scripts/mandel.pinky']
+  for filename, source in load_sources(scripts, 1):
+    ast = Resolver().resolve(Parser(Lexer(source).tokenize()).parse())
+    for engine, interpreter_class in [('tagged', Interpreter), ('untagged', UntaggedInterpreter)]:
+      blocks, size = allocations(interpreter_class, ast, 200_000)
+      with contextlib.redirect_stdout(NullOutput()):
+        elapsed = best_time(lambda: interpreter_class().interpret_ast(ast), args.repeat)
+      print(f'{filename:40} {engine:>12} {blocks:>10.2f} {size:>8.1f}B {elapsed*1000:>8.1f}ms')
+
+def count_environments(func):
+  '''The number of Environment objects created by a function'''
+  init = Environment.__init__
+  count = 0
+  def counting_init(env, *args, **kwargs):
+    nonlocal count
+    count += 1
+    init(env, *args, **kwargs)
+  Environment.__init__ = counting_init
+  try:
+    func()
+  finally:
+    Environment.__init__ = init
+  return count
+
+def bench_scopes(args):
+  '''Environments created by a run of the resolved programs (blocks that bind no names run in the enclosing one)'''
+  print(f'{"script":40} {"engine":>12} {"envs":>9} {"time":>10}')
+  for filename, source in load_sources(args.scripts, 1):
+    ast = Resolver().resolve(Parser(Lexer(source).tokenize()).parse())
+    engines = [
+      ('interpreter', lambda: Interpreter().interpret_ast(ast)),
+      ('closures', lambda: ClosureInterpreter().interpret_ast(ast)),
+    ]
+    for engine, run in engines:
+      with contextlib.redirect_stdout(NullOutput()):
+        environments = count_environments(run)
+        elapsed = best_time(run, args.repeat)
+      print(f'{filename:40} {engine:>12} {environments:>9} {elapsed*1000:>8.1f}ms')
+
+# Nested for loops, with bodies that do little else
+LOOP_SOURCES = [
+  ('empty 300000', '''
+    for i := 1, 300000 do end
+  '''),
+  ('nested 300x300', '''
+    n := 0
+    for i := 1, 300 do
+      for j := 300, 1 do
+        n := n + 1
+      end
+    end
+    println n
+  '''),
+  ('nested steps', '''
+    n := 0
+    for i := -500, 500, 7 do
+      for j := 0, 100, 0.5 do
+        n := n + 1
+      end
+    end
+    println n
+  '''),
+]
+
+def bench_loops(args):
+  '''Run loop-heavy programs with the AST engines (nested for loops and the mandelbrot set)'''
+  with open('scripts/mandel.pinky') as file:
+    sources = LOOP_SOURCES + [('mandel', file.read())]
+  print(f'{"program":20} {"engine":>12} {"time":>10}')
+  for program, source in sources:
+    ast = Resolver().resolve(Parser(Lexer(source).tokenize()).parse())
+    engines = [
+      ('interpreter', lambda: Interpreter().interpret_ast(ast)),
+      ('untagged', lambda: UntaggedInterpreter().interpret_ast(ast)),
+      ('closures', lambda: ClosureInterpreter().interpret_ast(ast)),
+    ]
+    for engine, run in engines:
+      with contextlib.redirect_stdout(NullOutput()):
+        elapsed = best_time(run, args.repeat)
+      print(f'{program:20} {engine:>12} {elapsed*1000:>8.1f}ms')
+
+def bench_profile(args):
+  '''Run the scripts with the interpreter, and with the interpreter profiling them'''
+  print(f'{"script":40} {"plain":>10} {"profiled":>10} {"overhead":>9}')
+  for filename in args.scripts:
+    with open(filename) as file:
+      ast = Resolver().resolve(Parser(Lexer(file.read()).tokenize()).parse())
+    def profiled():
+      interpreter = Interpreter()
+      Profiler(interpreter, ast)
+      interpreter.interpret_ast(ast)
+    try:
+      with contextlib.redirect_stdout(NullOutput()):
+        plain = best_time(lambda: Interpreter().interpret_ast(ast), args.repeat)
+        profiled = best_time(profiled, args.repeat)
+    except SystemExit:
+      print(f'{filename:40} {"error":>10}')
+      continue
+    print(f'{filename:40} {plain*1000:>8.1f}ms {profiled*1000:>8.1f}ms {profiled / plain:>8.2f}x')
+
+def bench_output(args):
+  '''Print the dragon curve and the mandelbrot set to a file, with a buffered Output and with a write for every print'''
+  with open('scripts/dragon.pinky') as file:
+    dragon = file.read()
+  with open('scripts/mandel.pinky') as file:
+    mandel = file.read()
+  # (the compiler has no for loops, so the mandelbrot set only runs in the interpreter)
+  sources = [(f'dragon level {level}', dragon.replace('dragon(60, 12, 1)', f'dragon(60, {level}, 1)'), True) for level in (12, 14)]
+  sources.append(('mandel', mandel, False))
+  print(f'{"program":20} {"engine":>12} {"output":>10} {"time":>10} {"throughput":>12}')
+  for program, source, compiled in sources:
+    ast = Resolver().resolve(Parser(Lexer(source).tokenize()).parse())
+    engines = [('interpreter', lambda output: Interpreter(output=output).interpret_ast(ast))]
+    if compiled:
+      code = Compiler().generate_code(ast)
+      engines.append(('vm', lambda output: VM(output).run(code)))
+    for engine, run in engines:
+      for mode, size in (('buffered', BUFFER_SIZE), ('unbuffered', 1)):
+        with tempfile.TemporaryFile('w+') as file:
+          elapsed = best_time(lambda: run(Output(file, size)), args.repeat)
+          kilobytes = file.tell() / args.repeat / 1024
+        print(f'{program:20} {engine:>12} {mode:>10} {elapsed*1000:>8.1f}ms {kilobytes / elapsed:>8.1f}KB/s')
+
+# String concatenations: a string of 1MB built by appending to it, and short strings printed right away
+STRING_SOURCES = [
+  ('append 1MB', '''
+    s := ""
+    i := 0
+    while i < 65536 do
+      s := s + "0123456789abcdef"
+      i := i + 1
+    end
+    println s == s + ""
+  '''),
+  ('short strings', '''
+    i := 0
+    while i < 20000 do
+      println "line " + i + " " + (i * 2)
+      i := i + 1
+    end
+  '''),
+]
+
+def bench_strings(args):
+  '''Run string concatenations with the interpreter and the VM, with Ropes and with Python strings only'''
+  print(f'{"program":20} {"engine":>12} {"strings":>8} {"time":>10}')
+  for program, source in STRING_SOURCES:
+    ast = Resolver().resolve(Parser(Lexer(source).tokenize()).parse())
+    code = Compiler().generate_code(ast)
+    engines = [
+      ('interpreter', lambda: Interpreter().interpret_ast(ast)),
+      ('vm', lambda: VM().run(code)),
+    ]
+    for engine, run in engines:
+      for strings, threshold in (('ropes', rope.ROPE_THRESHOLD), ('python', float('inf'))):
+        saved, rope.ROPE_THRESHOLD = rope.ROPE_THRESHOLD, threshold
+        try:
+          with contextlib.redirect_stdout(NullOutput()):
+            elapsed = best_time(run, args.repeat)
+        finally:
+          rope.ROPE_THRESHOLD = saved
+        print(f'{program:20} {engine:>12} {strings:>8} {elapsed*1000:>8.1f}ms')
+
+DEFAULT_SCRIPTS = sorted(glob.glob('scripts/*.pinky'))
+
+BENCHMARKS = {
+  'lexer': bench_lexer,
+  'stream': bench_stream,
+  'tokens': bench_tokens,
+  'rss': bench_rss,
+  'run': bench_run,
+  'parser': bench_parser,
+  'nesting': bench_nesting,
+  'cache': bench_cache,
+  'ast': bench_ast,
+  'flat': bench_flat,
+  'walkers': bench_walkers,
+  'calls': bench_calls,
+  'values': bench_values,
+  'scopes': bench_scopes,
+  'loops': bench_loops,
+  'profile': bench_profile,
+  'output': bench_output,
+  'strings': bench_strings,
+}
+
+if __name__ == '__main__':
+  argparser = argparse.ArgumentParser(prog='bench.py', description='Benchmark the Pinky toolchain.')
+  argparser.add_argument('benchmark', choices=BENCHMARKS)
+  argparser.add_argument('scripts', nargs='*', default=DEFAULT_SCRIPTS)
+  argparser.add_argument('--scale', type=int, default=1, help='concatenate each script N times')
+  argparser.add_argument('--repeat', type=int, default=5, help='number of timed runs (best one is reported)')
+  args = argparser.parse_intermixed_args()
+  BENCHMARKS[args.benchmark](args)
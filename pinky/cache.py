@@ -0,0 +1,91 @@
+###############################################################################
+# On-disk cache of parsed programs.
+#
+# The AST of a script is pickled into a __pinkycache__ directory next to it
+# (the same idea as Python's __pycache__), so that running an unchanged script
+# again can skip the Lexer and the Parser entirely.
+#
+# An entry is keyed by a hash of:
+#  - FORMAT_VERSION (bump it when the layout of the cache files changes),
+#  - the source code of the front end modules (lexer, parser, model, ...), so
+#    any change to how programs are lexed, parsed or represented invalidates
+#    every entry automatically,
+#  - the Python version (pickles of our classes are not guaranteed to be
+#    portable across versions),
+#  - the bytes of the script itself.
+#
+# Entries are written atomically (temp file + rename), and every problem when
+# reading one (missing, truncated, corrupted, written for another key) is just
+# a cache miss. Problems when writing one (read-only directory, a tree too deep
+# for pickle) are ignored: the cache is an optimization and never an error.
+# Like __pycache__, the cache directory must not be writable by untrusted users,
+# since loading a pickle can run arbitrary code.
+###############################################################################
+import os
+import sys
+import pickle
+import hashlib
+import tempfile
+
+CACHE_DIR = '__pinkycache__'
+FORMAT_VERSION = 4
+FRONT_END_MODULES = ['tokens', 'lexer', 'model', 'parser', 'utils', 'defs']
+
+front_end_hash = None
+
+def get_front_end_hash():
+  '''A hash of the source code of the modules that turn a script into an AST'''
+  global front_end_hash
+  if front_end_hash is None:
+    digest = hashlib.sha256()
+    for name in FRONT_END_MODULES:
+      with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name + '.py'), 'rb') as file:
+        digest.update(file.read())
+    front_end_hash = digest.digest()
+  return front_end_hash
+
+class ParseCache:
+  '''
+  The cache entry of one script. The key is computed from the current contents
+  of the file, so the entry can never be stale.
+  '''
+  def __init__(self, filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+      for chunk in iter(lambda: file.read(1 << 16), b''):
+        digest.update(chunk)
+    digest.update(f'{FORMAT_VERSION}:{sys.version_info[0]}.{sys.version_info[1]}'.encode())
+    digest.update(get_front_end_hash())
+    self.key = digest.hexdigest()
+    self.directory = os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR)
+    self.prefix = os.path.basename(filename) + '.'
+    self.path = os.path.join(self.directory, self.prefix + self.key[:32] + '.ast')
+
+  def load(self):
+    '''Return the cached AST, or None if there is no valid entry'''
+    try:
+      with open(self.path, 'rb') as file:
+        key, ast = pickle.load(file)
+    except Exception:
+      return None
+    return ast if key == self.key else None
+
+  def store(self, ast):
+    '''Save the AST, replacing the entries of previous versions of the script'''
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+      data = pickle.dumps((self.key, ast), protocol=pickle.HIGHEST_PROTOCOL)
+      fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=self.prefix, suffix='.tmp')
+      try:
+        with os.fdopen(fd, 'wb') as file:
+          file.write(data)
+        os.replace(temp_path, self.path)
+      except BaseException:
+        os.unlink(temp_path)
+        raise
+      for entry in os.listdir(self.directory):
+        stale = entry.startswith(self.prefix) and entry.endswith('.ast') and len(entry) == len(os.path.basename(self.path))
+        if stale and entry != os.path.basename(self.path):
+          os.unlink(os.path.join(self.directory, entry))
+    except (OSError, RecursionError, pickle.PicklingError):
+      pass
@@ -0,0 +1,328 @@
+###############################################################################
+# Closure-compiling execution engine.
+#
+# The tree-walking Interpreter dispatches on the type of every node each time
+# it evaluates it. This engine walks the tree only once, turning every node
+# into a Python closure that does the work of that node and calls the closures
+# of its children directly:
+#
+#   BinOp(+, x, 1)  -->  def add(env):
+#                          return (TYPE_NUMBER, left(env)[1] + right(env)[1])
+#
+# Closures are specialized when the compiler can tell something statically:
+# an arithmetic operation whose operands can only be numbers skips the type
+# checks, and the other ones test the common numeric case inline before
+# falling back to the operator handlers.
+#
+# Variables and functions live in the same Environment objects, and names
+# that the resolver resolved statically are read from their slot directly.
+###############################################################################
+import itertools
+from defs import *
+from utils import *
+from model import *
+from tokens import *
+from state import *
+from visitor import *
+from interpreter import *
+from optimizer import is_number
+
+def block_env(env, scope):
+  '''A new child environment to run a block in (or the same one, if the block binds no names)'''
+  if scope is not None and scope.elided:
+    return env
+  return Environment(env, scope)
+
+class Function:
+  '''
+  A compiled function declaration: the names of its params and the closure of its body
+  '''
+  def __init__(self, name, params, slots, body, scope):
+    self.name = name
+    self.params = params
+    self.slots = slots # the slots of the params (None if not resolved)
+    self.body = body
+    self.scope = scope
+
+
+class ClosureInterpreter(Visitor):
+  prefix = 'closure_'
+
+  def __init__(self, output=None):
+    self.output = output or Output() # where the print statements write
+
+  def closure(self, node):
+    '''Compile a node (and all its children) into a closure that takes the environment'''
+    return self.methods[type(node)](self, node)
+
+  def ignore(self, node):
+    def nothing(env):
+      return None
+    return nothing
+
+  def closure_Integer(self, node):
+    value = (TYPE_NUMBER, float(node.value))
+    return lambda env: value
+
+  def closure_Float(self, node):
+    value = (TYPE_NUMBER, float(node.value))
+    return lambda env: value
+
+  def closure_String(self, node):
+    value = (TYPE_STRING, str(node.value))
+    return lambda env: value
+
+  def closure_Bool(self, node):
+    value = (TYPE_BOOL, node.value)
+    return lambda env: value
+
+  def closure_Grouping(self, node):
+    return self.closure(node.value)
+
+  def closure_Identifier(self, node):
+    name, line, depth, slot = node.name, node.line, node.depth, node.slot
+    # A statically resolved name is certainly bound in its slot
+    if depth == 0:
+      return lambda env: env.values[slot]
+    if depth == 1:
+      return lambda env: env.parent.values[slot]
+    if depth is not None:
+      return lambda env: env.ancestor(depth).values[slot]
+    def identifier(env):
+      value = env.get_var(name)
+      if value is None:
+        runtime_error(f'Undeclared identifier {name!r}', line)
+      if value[1] is None:
+        runtime_error(f'Uninitialized identifier {name!r}', line)
+      return value
+    return identifier
+
+  def closure_Assignment(self, node):
+    name, right, depth, slot = node.left.name, self.closure(node.right), node.depth, node.slot
+    if depth == 0:
+      def assignment(env):
+        env.values[slot] = right(env)
+    elif depth is not None:
+      def assignment(env):
+        env.ancestor(depth).values[slot] = right(env)
+    else:
+      def assignment(env):
+        env.set_var(name, right(env))
+    return assignment
+
+  def closure_LocalAssignment(self, node):
+    name, right, slot = node.left.name, self.closure(node.right), node.slot
+    if slot is not None:
+      def local_assignment(env):
+        env.values[slot] = right(env)
+    else:
+      def local_assignment(env):
+        env.set_local(name, right(env))
+    return local_assignment
+
+  def closure_BinOp(self, node):
+    left, right = self.closure(node.left), self.closure(node.right)
+    op = node.op.token_type
+    handler = BINOPS[op]
+    resulttype, operation = NUMBER_OPS[op]
+    # A number literal on either side is captured as a constant, instead of calling its closure
+    if isinstance(node.right, (Integer, Float)) and not (op == TOK_SLASH and node.right.value == 0):
+      rightval = float(node.right.value)
+      def binop_number_right(env):
+        lefttype, leftval = left(env)
+        if lefttype == TYPE_NUMBER:
+          return (resulttype, operation(leftval, rightval))
+        return handler(node, lefttype, leftval, TYPE_NUMBER, rightval)
+      return binop_number_right
+    if isinstance(node.left, (Integer, Float)) and op != TOK_SLASH:
+      leftval = float(node.left.value)
+      def binop_number_left(env):
+        righttype, rightval = right(env)
+        if righttype == TYPE_NUMBER:
+          return (resulttype, operation(leftval, rightval))
+        return handler(node, TYPE_NUMBER, leftval, righttype, rightval)
+      return binop_number_left
+    if op == TOK_SLASH:
+      # The handler reports the division by zero (which is checked before the types)
+      def division(env):
+        lefttype, leftval = left(env)
+        righttype, rightval = right(env)
+        if rightval != 0 and lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+          return (TYPE_NUMBER, leftval / rightval)
+        return handler(node, lefttype, leftval, righttype, rightval)
+      return division
+    if is_number(node.left) and is_number(node.right):
+      def number_binop(env):
+        return (resulttype, operation(left(env)[1], right(env)[1]))
+      return number_binop
+    def binop(env):
+      lefttype, leftval = left(env)
+      righttype, rightval = right(env)
+      if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+        return (resulttype, operation(leftval, rightval))
+      return handler(node, lefttype, leftval, righttype, rightval)
+    return binop
+
+  def closure_UnOp(self, node):
+    operand = self.closure(node.operand)
+    handler = UNOPS[node.op.token_type]
+    if node.op.token_type == TOK_MINUS and is_number(node.operand):
+      def negation(env):
+        return (TYPE_NUMBER, -operand(env)[1])
+      return negation
+    def unop(env):
+      operandtype, operandval = operand(env)
+      return handler(node, operandtype, operandval)
+    return unop
+
+  def closure_LogicalOp(self, node):
+    left, right = self.closure(node.left), self.closure(node.right)
+    if node.op.token_type == TOK_OR:
+      def logical_or(env):
+        value = left(env)
+        if value[1]:
+          return value
+        return right(env)
+      return logical_or
+    def logical_and(env):
+      value = left(env)
+      if not value[1]:
+        return value
+      return right(env)
+    return logical_and
+
+  def block(self, node):
+    '''Compile a block into a closure that runs it in a new child scope (if it has one)'''
+    stmts, scope = self.closure(node), node.scope
+    if scope is not None and scope.elided:
+      return stmts
+    def child_block(env):
+      return stmts(Environment(env, scope))
+    return child_block
+
+  def closure_Stmts(self, node):
+    stmts = [self.closure(stmt) for stmt in node.stmts]
+    # As in the Interpreter, a statement closure returns None, or the value of the ret that ended the block
+    def block(env):
+      for stmt in stmts:
+        result = stmt(env)
+        if result is not None:
+          return result
+    return block
+
+  def closure_PrintStmt(self, node):
+    value, end, write = self.closure(node.value), node.end, self.output.write
+    def print_stmt(env):
+      exprtype, exprval = value(env)
+      write(stringify(exprval) + end)
+    return print_stmt
+
+  def closure_IfStmt(self, node):
+    test, then_stmts, line = self.closure(node.test), self.block(node.then_stmts), node.line
+    else_stmts = self.block(node.else_stmts) if node.else_stmts is not None else None
+    def if_stmt(env):
+      testtype, testval = test(env)
+      if testtype != TYPE_BOOL:
+        runtime_error("Condition test is not a boolean expression.", line)
+      if testval:
+        return then_stmts(env)
+      elif else_stmts is not None:
+        return else_stmts(env)
+    return if_stmt
+
+  def closure_WhileStmt(self, node):
+    test, body_stmts, line, scope = self.closure(node.test), self.closure(node.body_stmts), node.line, node.body_stmts.scope
+    def while_stmt(env):
+      new_env = block_env(env, scope)
+      while True:
+        testtype, testval = test(env)
+        if testtype != TYPE_BOOL:
+          runtime_error(f'While test is not a boolean expression.', line)
+        if not testval:
+          break
+        result = body_stmts(new_env)
+        if result is not None:
+          return result
+    return while_stmt
+
+  def closure_ForStmt(self, node):
+    ident = node.ident
+    start, end, body_stmts = self.closure(node.start), self.closure(node.end), self.closure(node.body_stmts)
+    step = self.closure(node.step) if node.step is not None else None
+    scope = node.body_stmts.scope
+    def for_stmt(env):
+      itype, i = start(env)
+      endtype, endval = end(env)
+      block_new_env = block_env(env, scope)
+      up = i < endval
+      if step is None:
+        stepval = 1 if up else -1
+      else:
+        stepval = step(env)[1]
+      values, slot = loop_slot(env, ident)
+      for value in zip(itertools.repeat(TYPE_NUMBER), loop_values(i, endval, stepval, up)):
+        if values is None:
+          env.set_var(ident.name, value)
+        else:
+          values[slot] = value
+        result = body_stmts(block_new_env)
+        if result is not None:
+          return result
+    return for_stmt
+
+  def closure_FuncDecl(self, node):
+    slots = [param.slot for param in node.params]
+    function = Function(node.name, [param.name for param in node.params], None if None in slots else slots,
+                        self.closure(node.body_stmts), node.body_stmts.scope)
+    slot = node.slot
+    # We also store the environment in which the function was declared
+    if slot is not None:
+      def func_decl(env):
+        env.values[slot] = (function, env)
+    else:
+      def func_decl(env):
+        env.set_func(function.name, (function, env))
+    return func_decl
+
+  def closure_FuncCall(self, node):
+    name, line, depth, slot = node.name, node.line, node.depth, node.slot
+    args = [self.closure(arg) for arg in node.args]
+    def func_call(env):
+      func = env.get_func(name) if depth is None else env.ancestor(depth).values[slot]
+      if not func:
+        runtime_error(f'Function {name!r} not declared.', line)
+      function, func_env = func
+      if len(args) != len(function.params):
+        runtime_error(f'Function {function.name!r} expected {len(function.params)} params but {len(args)} args were passed.', line)
+      argvals = [arg(env) for arg in args]
+      new_func_env = block_env(func_env, function.scope)
+      if function.slots is not None:
+        for param_slot, argval in zip(function.slots, argvals):
+          new_func_env.values[param_slot] = argval
+      else:
+        for param, argval in zip(function.params, argvals):
+          new_func_env.set_local(param, argval)
+      result = function.body(new_func_env)
+      if result is None:
+        return (TYPE_NUMBER, 0)
+      return result
+    return func_call
+
+  def closure_FuncCallStmt(self, node):
+    expr = self.closure(node.expr)
+    def func_call_stmt(env):
+      expr(env) # the value is discarded: it is not the one of a ret
+    return func_call_stmt
+
+  def closure_RetStmt(self, node):
+    return self.closure(node.value)
+
+  def interpret_ast(self, node):
+    # Compile the whole program first, then run it in a brand new global environment
+    program = self.closure(node)
+    try:
+      result = program(Environment(scope=node.scope))
+    finally:
+      self.output.flush()
+    if result is not None:
+      raise Return(result) # a ret outside of any function, as in the Interpreter
@@ -2,10 +2,40 @@ from defs import *
 from model import *
 from tokens import *
 from utils import *
+from visitor import *
 
 SYM_VAR  = 'SYM_VAR'
 SYM_FUNC = 'SYM_FUNC'
 
+# The instructions of each operator, by token type
+BINOP_CODE = {
+  TOK_PLUS: ('ADD',),
+  TOK_MINUS: ('SUB',),
+  TOK_STAR: ('MUL',),
+  TOK_SLASH: ('DIV',),
+  TOK_CARET: ('EXP',),
+  TOK_MOD: ('MOD',),
+  TOK_LT: ('LT',),
+  TOK_GT: ('GT',),
+  TOK_LE: ('LE',),
+  TOK_GE: ('GE',),
+  TOK_EQEQ: ('EQ',),
+  TOK_NE: ('NE',),
+}
+
+UNOP_CODE = {
+  TOK_MINUS: [('NEG',)],
+  TOK_NOT: [('PUSH', (TYPE_BOOL, True)), ('XOR',)],
+  TOK_PLUS: [],
+}
+
+LOGICALOP_CODE = {
+  TOK_AND: ('AND',),
+  TOK_OR: ('OR',),
+}
+
+NO_CHILDREN = iter(())
+
 class Symbol:
   def __init__(self, name, symtype=SYM_VAR, depth=0, arity=0):
     self.name = name
@@ -13,7 +43,9 @@ class Symbol:
     self.symtype = symtype
     self.arity = arity
 
-class Compiler:
+class Compiler(Visitor):
+  prefix = 'compile_'
+
   def __init__(self):
     self.code = []
     self.locals = []
@@ -64,193 +96,174 @@ class Compiler:
       i -= 1
 
   def compile(self, node):
-    if isinstance(node, Integer):
-      value = (TYPE_NUMBER, float(node.value))
-      self.emit(('PUSH', value))
-
-    elif isinstance(node, Float):
-      value = (TYPE_NUMBER, float(node.value))
-      self.emit(('PUSH', value))
-
-    elif isinstance(node, Bool):
-      value = (TYPE_BOOL, True if node.value == True or node.value == 'true' else False)
-      self.emit(('PUSH', value))
-
-    elif isinstance(node, String):
-      value = (TYPE_STRING, stringify(node.value))
-      self.emit(('PUSH', value))
-
-    elif isinstance(node, BinOp):
-      self.compile(node.left)
-      self.compile(node.right)
-      if node.op.token_type == TOK_PLUS:
-        self.emit(('ADD',))
-      elif node.op.token_type == TOK_MINUS:
-        self.emit(('SUB',))
-      elif node.op.token_type == TOK_STAR:
-        self.emit(('MUL',))
-      elif node.op.token_type == TOK_SLASH:
-        self.emit(('DIV',))
-      elif node.op.token_type == TOK_CARET:
-        self.emit(('EXP',))
-      elif node.op.token_type == TOK_MOD:
-        self.emit(('MOD',))
-      elif node.op.token_type == TOK_LT:
-        self.emit(('LT',))
-      elif node.op.token_type == TOK_GT:
-        self.emit(('GT',))
-      elif node.op.token_type == TOK_LE:
-        self.emit(('LE',))
-      elif node.op.token_type == TOK_GE:
-        self.emit(('GE',))
-      elif node.op.token_type == TOK_EQEQ:
-        self.emit(('EQ',))
-      elif node.op.token_type == TOK_NE:
-        self.emit(('NE',))
-
-    elif isinstance(node, UnOp):
-      self.compile(node.operand)
-      if node.op.token_type == TOK_MINUS:
-        self.emit(('NEG',))
-      elif node.op.token_type == TOK_NOT:
-        self.emit(('PUSH', (TYPE_BOOL, True)))
-        self.emit(('XOR',))
-
-    elif isinstance(node, LogicalOp):
-      self.compile(node.left)
-      self.compile(node.right)
-      if node.op.token_type == TOK_AND:
-        self.emit(('AND',))
-      elif node.op.token_type == TOK_OR:
-        self.emit(('OR',))
-
-    elif isinstance(node, Grouping):
-      self.compile(node.value)
-
-    elif isinstance(node, PrintStmt):
-      self.compile(node.value)
-      if node.end == '':
-        self.emit(('PRINT',))
-      else:
-        self.emit(('PRINTLN',))
-
-    elif isinstance(node, IfStmt):
-      self.compile(node.test)
-      then_label = self.make_label()
-      else_label = self.make_label()
-      exit_label = self.make_label()
-      self.emit(('JMPZ', else_label))  # Branch directly to else_label if top of stack is EQUAL to ZERO (a.k.a. False)
-      self.emit(('LABEL', then_label))
-      self.begin_block()
-      self.compile(node.then_stmts)
-      self.end_block()
-      self.emit(('JMP', exit_label))
-      self.emit(('LABEL', else_label))
-      if node.else_stmts:
-        self.begin_block()
-        self.compile(node.else_stmts)
-        self.end_block()
-      self.emit(('LABEL', exit_label))
-
-    elif isinstance(node, WhileStmt):
-      test_label = self.make_label()
-      body_label = self.make_label()
-      exit_label = self.make_label()
-      self.emit(('LABEL', test_label))
-      self.compile(node.test)
-      self.emit(('JMPZ', exit_label))  # Branch directly to exit_label if top of stack is EQUAL to ZERO (a.k.a. False)
-      self.emit(('LABEL', body_label))
+    for child in self.compile_node(node):
+      self.compile(child)
+
+  def compile_node(self, node):
+    '''
+    Emit the code for a node. Child nodes are not compiled here: they are yielded,
+    in order, to the caller that drives the compilation (see compile). Nodes
+    without children are compiled by plain methods, which emit right away.
+    '''
+    return self.methods[type(node)](self, node) or NO_CHILDREN
+
+  def compile_Integer(self, node):
+    value = (TYPE_NUMBER, float(node.value))
+    self.emit(('PUSH', value))
+
+  def compile_Float(self, node):
+    value = (TYPE_NUMBER, float(node.value))
+    self.emit(('PUSH', value))
+
+  def compile_Bool(self, node):
+    value = (TYPE_BOOL, True if node.value == True or node.value == 'true' else False)
+    self.emit(('PUSH', value))
+
+  def compile_String(self, node):
+    value = (TYPE_STRING, stringify(node.value))
+    self.emit(('PUSH', value))
+
+  def compile_BinOp(self, node):
+    yield node.left
+    yield node.right
+    self.emit(BINOP_CODE[node.op.token_type])
+
+  def compile_UnOp(self, node):
+    yield node.operand
+    for instruction in UNOP_CODE[node.op.token_type]:
+      self.emit(instruction)
+
+  def compile_LogicalOp(self, node):
+    yield node.left
+    yield node.right
+    self.emit(LOGICALOP_CODE[node.op.token_type])
+
+  def compile_Grouping(self, node):
+    yield node.value
+
+  def compile_PrintStmt(self, node):
+    yield node.value
+    if node.end == '':
+      self.emit(('PRINT',))
+    else:
+      self.emit(('PRINTLN',))
+
+  def compile_IfStmt(self, node):
+    yield node.test
+    then_label = self.make_label()
+    else_label = self.make_label()
+    exit_label = self.make_label()
+    self.emit(('JMPZ', else_label))  # Branch directly to else_label if top of stack is EQUAL to ZERO (a.k.a. False)
+    self.emit(('LABEL', then_label))
+    self.begin_block()
+    yield node.then_stmts
+    self.end_block()
+    self.emit(('JMP', exit_label))
+    self.emit(('LABEL', else_label))
+    if node.else_stmts:
       self.begin_block()
-      self.compile(node.body_stmts)
+      yield node.else_stmts
       self.end_block()
-      self.emit(('JMP', test_label))
-      self.emit(('LABEL', exit_label))
-
-    elif isinstance(node, Stmts):
-      for stmt in node.stmts:
-        self.compile(stmt)
-
-    elif isinstance(node, Assignment):
-      self.compile(node.right)
-      symbol = self.get_var_symbol(node.left.name)
-      if not symbol:
-        new_symbol = Symbol(node.left.name, symtype=SYM_VAR, depth=self.scope_depth)
-        if self.scope_depth == 0:
-          self.globals.append(new_symbol)
-          new_global_slot = len(self.globals) - 1
-          self.emit(('STORE_GLOBAL', new_global_slot))
-        else:
-          self.locals.append(new_symbol)
-          self.emit(('SET_SLOT', str(len(self.locals) - 1) + f" ({new_symbol.name})"))
+    self.emit(('LABEL', exit_label))
+
+  def compile_WhileStmt(self, node):
+    test_label = self.make_label()
+    body_label = self.make_label()
+    exit_label = self.make_label()
+    self.emit(('LABEL', test_label))
+    yield node.test
+    self.emit(('JMPZ', exit_label))  # Branch directly to exit_label if top of stack is EQUAL to ZERO (a.k.a. False)
+    self.emit(('LABEL', body_label))
+    self.begin_block()
+    yield node.body_stmts
+    self.end_block()
+    self.emit(('JMP', test_label))
+    self.emit(('LABEL', exit_label))
+
+  def compile_Stmts(self, node):
+    return iter(node.stmts)
+
+  def compile_Assignment(self, node):
+    yield node.right
+    symbol = self.get_var_symbol(node.left.name)
+    if not symbol:
+      new_symbol = Symbol(node.left.name, symtype=SYM_VAR, depth=self.scope_depth)
+      if self.scope_depth == 0:
+        self.globals.append(new_symbol)
+        new_global_slot = len(self.globals) - 1
+        self.emit(('STORE_GLOBAL', new_global_slot))
+      else:
+        self.locals.append(new_symbol)
+        self.emit(('SET_SLOT', str(len(self.locals) - 1) + f" ({new_symbol.name})"))
+    else:
+      sym, slot = symbol
+      if sym.depth == 0:
+        self.emit(('STORE_GLOBAL', slot))
+      else:
+        self.emit(('STORE_LOCAL', slot))
+
+  def compile_LocalAssignment(self, node):
+    yield node.right
+    new_symbol = Symbol(name=node.left.name, symtype=SYM_VAR, depth=self.scope_depth)
+    self.locals.append(new_symbol)
+    self.emit(('SET_SLOT', str(len(self.locals) - 1) + " (" + str(new_symbol.name) + ")"))
+
+  def compile_Identifier(self, node):
+    symbol = self.get_var_symbol(node.name)
+    if not symbol:
+      compile_error(f'Variable {node.name} is not defined.', node.line)
+    else:
+      sym, slot = symbol
+      if sym.depth == 0:
+        self.emit(('LOAD_GLOBAL', slot))
       else:
-        sym, slot = symbol
-        if sym.depth == 0:
-          self.emit(('STORE_GLOBAL', slot))
-        else:
-          self.emit(('STORE_LOCAL', slot))
-
-    elif isinstance(node, LocalAssignment):
-      self.compile(node.right)
-      new_symbol = Symbol(name=node.left.name, symtype=SYM_VAR, depth=self.scope_depth)
+        self.emit(('LOAD_LOCAL', slot))
+
+  def compile_FuncDecl(self, node):
+    var = self.get_var_symbol(node.name)
+    func = self.get_func_symbol(node.name)
+    if func:
+      compile_error(f'A function with the name {node.name} was already declared.', node.line)
+    if var:
+      compile_error(f'A variable with the name {node.name} was already defined in this scope.', node.line)
+    new_func = Symbol(node.name, symtype=SYM_FUNC, depth=self.scope_depth, arity=len(node.params))
+    self.functions.append(new_func)
+
+    end_label = self.make_label()
+    self.emit(('JMP', end_label))
+    self.emit(('LABEL', new_func.name))
+    self.begin_block()
+    # Set params as local variables
+    for param in node.params:
+      new_symbol = Symbol(name=param.name, symtype=SYM_VAR, depth=self.scope_depth)
       self.locals.append(new_symbol)
       self.emit(('SET_SLOT', str(len(self.locals) - 1) + " (" + str(new_symbol.name) + ")"))
+    yield node.body_stmts
+    self.end_block()
+    self.emit(('PUSH', (TYPE_NUMBER, 0)))
+    self.emit(('RTS',))
+    self.emit(('LABEL', end_label))
 
-    elif isinstance(node, Identifier):
-      symbol = self.get_var_symbol(node.name)
-      if not symbol:
-        compile_error(f'Variable {node.name} is not defined.', node.line)
-      else:
-        sym, slot = symbol
-        if sym.depth == 0:
-          self.emit(('LOAD_GLOBAL', slot))
-        else:
-          self.emit(('LOAD_LOCAL', slot))
-
-    elif isinstance(node, FuncDecl):
-      var = self.get_var_symbol(node.name)
-      func = self.get_func_symbol(node.name)
-      if func:
-        compile_error(f'A function with the name {node.name} was already declared.', node.line)
-      if var:
-        compile_error(f'A variable with the name {node.name} was already defined in this scope.', node.line)
-      new_func = Symbol(node.name, symtype=SYM_FUNC, depth=self.scope_depth, arity=len(node.params))
-      self.functions.append(new_func)
-
-      end_label = self.make_label()
-      self.emit(('JMP', end_label))
-      self.emit(('LABEL', new_func.name))
-      self.begin_block()
-      # Set params as local variables
-      for param in node.params:
-        new_symbol = Symbol(name=param.name, symtype=SYM_VAR, depth=self.scope_depth)
-        self.locals.append(new_symbol)
-        self.emit(('SET_SLOT', str(len(self.locals) - 1) + " (" + str(new_symbol.name) + ")"))
-      self.compile(node.body_stmts)
-      self.end_block()
-      self.emit(('PUSH', (TYPE_NUMBER, 0)))
-      self.emit(('RTS',))
-      self.emit(('LABEL', end_label))
-
-    elif isinstance(node, FuncCall):
-      func = self.get_func_symbol(node.name)
-      if not func:
-        compile_error(f'Not found declaration for function {node.name}', node.line)
-      if func.arity != len(node.args):
-        compile_error(f'Function expected {func.arity} params but {len(node.args)} args were passed', node.line)
-      # Evaluate all args
-      for arg in node.args:
-        self.compile(arg)
-      numargs = (TYPE_NUMBER, len(node.args))
-      self.emit(('PUSH', numargs))
-      self.emit(('JSR', node.name))
-
-    elif isinstance(node, RetStmt):
-      self.compile(node.value)
-      self.emit(('RTS',))
-
-    elif isinstance(node, FuncCallStmt):
-      self.compile(node.expr)
-      self.emit(('POP',)) # <-- Pop the value from the top of the stack, since we are not capturing that return
+  def compile_FuncCall(self, node):
+    func = self.get_func_symbol(node.name)
+    if not func:
+      compile_error(f'Not found declaration for function {node.name}', node.line)
+    if func.arity != len(node.args):
+      compile_error(f'Function expected {func.arity} params but {len(node.args)} args were passed', node.line)
+    # Evaluate all args
+    for arg in node.args:
+      yield arg
+    numargs = (TYPE_NUMBER, len(node.args))
+    self.emit(('PUSH', numargs))
+    self.emit(('JSR', node.name))
+
+  def compile_RetStmt(self, node):
+    yield node.value
+    self.emit(('RTS',))
+
+  def compile_FuncCallStmt(self, node):
+    yield node.expr
+    self.emit(('POP',)) # <-- Pop the value from the top of the stack, since we are not capturing that return
 
   def print_code(self):
     i = 0
@@ -274,3 +287,19 @@ class Compiler:
     self.compile(node)
     self.emit(('HALT',))
     return self.code
+
+
+class StackCompiler(Compiler):
+  '''
+  A compiler that does not recurse on the Python stack: the nodes being compiled
+  are kept as a stack of compile_node generators, so the nesting depth of the
+  program is only limited by memory. It emits exactly the same code as Compiler.
+  '''
+  def compile(self, node):
+    stack = [self.compile_node(node)]
+    while stack:
+      child = next(stack[-1], None)
+      if child is None:
+        stack.pop()
+      else:
+        stack.append(self.compile_node(child))
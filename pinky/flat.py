@@ -0,0 +1,353 @@
+###############################################################################
+# Flat, array-backed AST.
+#
+# Instead of one Python object per node, the whole tree is kept in a handful
+# of typed arrays, and a node is just an integer id (its index in them):
+#
+#   kinds[id]     what the node is (K_INTEGER, K_BINOP, ...)
+#   values[id]    an index into a pool: constants (numbers, strings, names) for
+#                 literals and declarations, ops (the operator tokens) for
+#                 UnOp/BinOp/LogicalOp, or 0/1 for Bool
+#   firsts[id]    where the ids of its children start in the children array
+#   counts[id]    how many children it has
+#
+# Children are stored contiguously, so the statements of a Stmts node (and the
+# args of a call, the params of a function) are just a range of the children
+# array. A missing optional child (else block, for step) is -1.
+#
+# Ids are given in pre-order, so the line of consecutive nodes rarely changes,
+# and lines are kept run-length encoded: line_ids holds the first id of every
+# run and line_numbers its line.
+#
+# FlatAST(node) flattens a tree of model.py objects, and to_model() rebuilds an
+# identical one. FlatInterpreter and FlatCompiler run a FlatAST directly. The
+# node kinds that run the most (literals, names, binary operators, blocks, and
+# assignments in the interpreter) are read from the arrays by methods of their
+# own. The other ones are materialized one node at a time, with ids for
+# children, and handed to the regular Interpreter and Compiler, so the
+# semantics and the generated code are exactly the same ones. A bounded
+# NodeCache keeps the most recent of those nodes, so hot loops are not
+# materialized again on every iteration.
+###############################################################################
+from array import array
+from bisect import bisect_right
+from model import *
+from interpreter import *
+from compiler import *
+
+ROOT = 0
+NO_NODE = -1
+
+# Number of materialized nodes kept by node(), so that loops and function bodies
+# are not rebuilt on every iteration (a power of two)
+NODE_CACHE_SIZE = 4096
+
+NODE_KINDS = [Integer, Float, Bool, String, Identifier, UnOp, BinOp, LogicalOp, Grouping, Stmts, PrintStmt,
+              IfStmt, WhileStmt, Assignment, LocalAssignment, ForStmt, FuncDecl, Param, FuncCall, FuncCallStmt, RetStmt]
+(K_INTEGER, K_FLOAT, K_BOOL, K_STRING, K_IDENTIFIER, K_UNOP, K_BINOP, K_LOGICALOP, K_GROUPING, K_STMTS, K_PRINT,
+ K_IF, K_WHILE, K_ASSIGNMENT, K_LOCAL_ASSIGNMENT, K_FOR, K_FUNCDECL, K_PARAM, K_FUNCCALL, K_FUNCCALLSTMT, K_RET) = range(len(NODE_KINDS))
+KIND_OF = {node_class: kind for kind, node_class in enumerate(NODE_KINDS)}
+
+def node_children(node):
+  '''The children of a model node, in the order they are stored (None for a missing optional child)'''
+  if isinstance(node, UnOp):
+    return [node.operand]
+  if isinstance(node, (BinOp, LogicalOp, Assignment, LocalAssignment)):
+    return [node.left, node.right]
+  if isinstance(node, (Grouping, PrintStmt, RetStmt)):
+    return [node.value]
+  if isinstance(node, Stmts):
+    return node.stmts
+  if isinstance(node, IfStmt):
+    return [node.test, node.then_stmts, node.else_stmts]
+  if isinstance(node, WhileStmt):
+    return [node.test, node.body_stmts]
+  if isinstance(node, ForStmt):
+    return [node.ident, node.start, node.end, node.step, node.body_stmts]
+  if isinstance(node, FuncDecl):
+    return [node.body_stmts] + node.params
+  if isinstance(node, FuncCall):
+    return node.args
+  if isinstance(node, FuncCallStmt):
+    return [node.expr]
+  return []
+
+
+class FlatAST:
+  def __init__(self, node):
+    self.kinds = array('B')
+    self.values = array('I')
+    self.firsts = array('I')
+    self.counts = array('I')
+    self.children = array('i')
+    self.line_ids = array('I')
+    self.line_numbers = array('I')
+    self.constants = []
+    self.ops = []
+    self.flatten(node)
+
+  def __len__(self):
+    return len(self.kinds)
+
+  def __repr__(self):
+    return repr(self.to_model())
+
+  def flatten(self, root):
+    '''Append the nodes of a tree in pre-order, without recursion'''
+    constant_ids, op_ids = {}, {}
+    def pool(items, ids, key, item):
+      if key not in ids:
+        ids[key] = len(items)
+        items.append(item)
+      return ids[key]
+    pending = [(root, NO_NODE)] # (node, index in the children array to patch with its id)
+    while pending:
+      node, slot = pending.pop()
+      id = len(self.kinds)
+      if slot != NO_NODE:
+        self.children[slot] = id
+      if isinstance(node, (UnOp, BinOp, LogicalOp)):
+        op = node.op
+        value = pool(self.ops, op_ids, (op.token_type, op.lexeme, op.line), op)
+      elif isinstance(node, Bool):
+        value = int(node.value)
+      elif isinstance(node, (Integer, Float, String)):
+        # repr() tells apart 1 from 1.0 and 0.0 from -0.0
+        value = pool(self.constants, constant_ids, (type(node.value), repr(node.value)), node.value)
+      elif isinstance(node, (Identifier, Param, FuncDecl, FuncCall)):
+        value = pool(self.constants, constant_ids, (str, repr(node.name)), node.name)
+      elif isinstance(node, PrintStmt):
+        value = pool(self.constants, constant_ids, (str, repr(node.end)), node.end)
+      else:
+        value = 0
+      children = node_children(node)
+      self.kinds.append(KIND_OF[type(node)])
+      self.values.append(value)
+      self.firsts.append(len(self.children))
+      self.counts.append(len(children))
+      # A FuncCallStmt has no line of its own: it just continues the current run
+      line = getattr(node, 'line', None)
+      if line is not None and (not self.line_numbers or self.line_numbers[-1] != line):
+        self.line_ids.append(id)
+        self.line_numbers.append(line)
+      first = len(self.children)
+      self.children.extend([NO_NODE] * len(children))
+      for index in reversed(range(len(children))):
+        if children[index] is not None:
+          pending.append((children[index], first + index))
+
+  def line(self, id):
+    return self.line_numbers[bisect_right(self.line_ids, id) - 1]
+
+  def child_ids(self, id):
+    first = self.firsts[id]
+    return self.children[first:first + self.counts[id]].tolist()
+
+  def node(self, id):
+    '''
+    A model node for one id. Its children are ids (or None), except for the
+    names in assignments, for loops and parameter lists, which are nodes.
+    '''
+    kind, value, first, line = self.kinds[id], self.values[id], self.firsts[id], self.line(id)
+    children = self.children
+    if kind in (K_INTEGER, K_FLOAT, K_STRING, K_IDENTIFIER, K_PARAM):
+      return NODE_KINDS[kind](self.constants[value], line=line)
+    if kind == K_BOOL:
+      return Bool(bool(value), line=line)
+    if kind == K_UNOP:
+      return UnOp(self.ops[value], children[first], line=line)
+    if kind in (K_BINOP, K_LOGICALOP):
+      return NODE_KINDS[kind](self.ops[value], children[first], children[first + 1], line=line)
+    if kind == K_GROUPING:
+      return Grouping(children[first], line=line)
+    if kind == K_STMTS:
+      return Stmts(self.child_ids(id), line=line)
+    if kind == K_PRINT:
+      return PrintStmt(children[first], self.constants[value], line=line)
+    if kind == K_IF:
+      else_stmts = children[first + 2]
+      return IfStmt(children[first], children[first + 1], None if else_stmts == NO_NODE else else_stmts, line=line)
+    if kind == K_WHILE:
+      return WhileStmt(children[first], children[first + 1], line=line)
+    if kind in (K_ASSIGNMENT, K_LOCAL_ASSIGNMENT):
+      return NODE_KINDS[kind](self.node(children[first]), children[first + 1], line=line)
+    if kind == K_FOR:
+      step = children[first + 3]
+      return ForStmt(self.node(children[first]), children[first + 1], children[first + 2], None if step == NO_NODE else step, children[first + 4], line=line)
+    if kind == K_FUNCDECL:
+      params = [self.node(param) for param in self.child_ids(id)[1:]]
+      return FuncDecl(self.constants[value], params, children[first], line=line)
+    if kind == K_FUNCCALL:
+      return FuncCall(self.constants[value], self.child_ids(id), line=line)
+    if kind == K_FUNCCALLSTMT:
+      return FuncCallStmt(children[first])
+    return RetStmt(children[first], line=line)
+
+  def to_model(self):
+    '''Rebuild the tree of model objects, without recursion'''
+    nodes = [None] * len(self.kinds)
+    # Children always have greater ids than their parents, so build from the last id to the first one
+    for id in reversed(range(len(self.kinds))):
+      node = self.node(id)
+      for field in CHILD_FIELDS.get(type(node), ()):
+        child = getattr(node, field)
+        if isinstance(child, list):
+          setattr(node, field, [nodes[item] for item in child])
+        elif child is not None:
+          setattr(node, field, nodes[child])
+      nodes[id] = node
+    return nodes[ROOT]
+
+
+class NodeCache:
+  '''
+  The most recently materialized nodes of a FlatAST, in a direct-mapped cache,
+  so that loops and function bodies are not rebuilt on every iteration while
+  the memory used stays bounded. The nodes are shared and must not be modified.
+  '''
+  def __init__(self, flat_ast, size=NODE_CACHE_SIZE):
+    self.ast = flat_ast
+    self.mask = size - 1
+    self.ids = array('i', [NO_NODE]) * size
+    self.nodes = [None] * size
+
+  def node(self, id):
+    slot = id & self.mask
+    if self.ids[slot] != id:
+      self.ids[slot] = id
+      self.nodes[slot] = self.ast.node(id)
+    return self.nodes[slot]
+
+
+def kind_table(cls, prefix):
+  '''The methods of a flat walker for each node kind (None for the kinds that it materializes)'''
+  return [getattr(cls, prefix + node_class.__name__, None) for node_class in NODE_KINDS]
+
+
+class FlatInterpreter(Interpreter):
+  '''
+  Interprets a FlatAST. The node kinds that run the most (literals, names,
+  operators, blocks and assignments) are run from the arrays, and the other
+  ones are materialized and run by the Interpreter
+  '''
+  def interpret(self, id, env):
+    method = self.kind_methods[self.kinds[id]]
+    if method is None:
+      return super().interpret(self.nodes.node(id), env)
+    return method(self, id, env)
+
+  def flat_Integer(self, id, env):
+    return (TYPE_NUMBER, float(self.constants[self.values[id]]))
+
+  flat_Float = flat_Integer
+
+  def flat_String(self, id, env):
+    return (TYPE_STRING, str(self.constants[self.values[id]]))
+
+  def flat_Bool(self, id, env):
+    return (TYPE_BOOL, bool(self.values[id]))
+
+  def flat_Identifier(self, id, env):
+    value = env.get_var(self.constants[self.values[id]])
+    if value is None or value[1] is None:
+      return self.interpret_Identifier(self.nodes.node(id), env) # reports the error
+    return value
+
+  def flat_Grouping(self, id, env):
+    return self.interpret(self.children[self.firsts[id]], env)
+
+  def flat_BinOp(self, id, env):
+    first = self.firsts[id]
+    lefttype, leftval = self.interpret(self.children[first], env)
+    righttype, rightval = self.interpret(self.children[first + 1], env)
+    # The inline caches are kept by id, with the node that the handlers take (for their error messages)
+    cache = self.caches.get(id)
+    if cache is not None and cache[0] == lefttype and cache[1] == righttype:
+      self.cache_hits += 1
+      return cache[2](cache[3], leftval, rightval)
+    self.cache_misses += 1
+    node = self.nodes.node(id)
+    handler = specialize_binop(node.op.token_type, lefttype, righttype)
+    self.caches[id] = (lefttype, righttype, handler, node)
+    return handler(node, leftval, rightval)
+
+  def flat_Stmts(self, id, env):
+    children = self.children
+    first = self.firsts[id]
+    for index in range(first, first + self.counts[id]):
+      result = self.interpret(children[index], env)
+      if result is not None:
+        return result
+
+  def flat_Assignment(self, id, env):
+    first = self.firsts[id]
+    value = self.interpret(self.children[first + 1], env)
+    env.set_var(self.constants[self.values[self.children[first]]], value)
+
+  def scope(self, id):
+    return None # not resolved: names are looked up at runtime
+
+  def interpret_ast(self, flat_ast):
+    self.nodes = NodeCache(flat_ast)
+    self.kinds, self.values, self.firsts, self.counts = flat_ast.kinds, flat_ast.values, flat_ast.firsts, flat_ast.counts
+    self.children, self.constants = flat_ast.children, flat_ast.constants
+    self.caches = {} # BinOp id -> (lefttype, righttype, handler, node)
+    self.run(ROOT, Environment())
+
+FlatInterpreter.kind_methods = kind_table(FlatInterpreter, 'flat_')
+
+
+class FlatCompiler(Compiler):
+  '''
+  Compiles a FlatAST into the same code as Compiler: the node kinds that are
+  the most common are compiled from the arrays, and the other ones are
+  materialized and compiled by the Compiler
+  '''
+  def compile_node(self, id):
+    method = self.kind_methods[self.kinds[id]]
+    if method is None:
+      return super().compile_node(self.nodes.node(id))
+    return method(self, id) or NO_CHILDREN
+
+  def flat_Integer(self, id):
+    self.emit(('PUSH', (TYPE_NUMBER, float(self.constants[self.values[id]]))))
+
+  flat_Float = flat_Integer
+
+  def flat_String(self, id):
+    self.emit(('PUSH', (TYPE_STRING, stringify(self.constants[self.values[id]]))))
+
+  def flat_Bool(self, id):
+    self.emit(('PUSH', (TYPE_BOOL, bool(self.values[id]))))
+
+  def flat_Identifier(self, id):
+    symbol = self.get_var_symbol(self.constants[self.values[id]])
+    if not symbol:
+      return super().compile_node(self.nodes.node(id)) # reports the error
+    sym, slot = symbol
+    self.emit(('LOAD_GLOBAL' if sym.depth == 0 else 'LOAD_LOCAL', slot))
+
+  def flat_Grouping(self, id):
+    return iter((self.children[self.firsts[id]],))
+
+  def flat_BinOp(self, id):
+    first = self.firsts[id]
+    yield self.children[first]
+    yield self.children[first + 1]
+    self.emit(BINOP_CODE[self.ops[self.values[id]].token_type])
+
+  def flat_Stmts(self, id):
+    first = self.firsts[id]
+    return iter(self.children[first:first + self.counts[id]])
+
+  def generate_code(self, flat_ast):
+    self.nodes = NodeCache(flat_ast)
+    self.kinds, self.values, self.firsts, self.counts = flat_ast.kinds, flat_ast.values, flat_ast.firsts, flat_ast.counts
+    self.children, self.constants, self.ops = flat_ast.children, flat_ast.constants, flat_ast.ops
+    return super().generate_code(ROOT)
+
+FlatCompiler.kind_methods = kind_table(FlatCompiler, 'flat_')
+
+
+class FlatStackCompiler(FlatCompiler, StackCompiler):
+  pass
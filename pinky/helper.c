@@ -1,4 +1,25 @@
 #include <stdio.h>
+#include <stdlib.h>
+
+/*
+ * The output of the program is written in large blocks: stdout gets a full
+ * buffer, which stdio writes when it is full and when the program exits
+ * (main returns to the C runtime, whose exit() flushes it, so the generated
+ * code never has to).
+ * If PINKY_OUTPUT names a file, the output goes to it instead of stdout.
+ */
+#define OUTPUT_BUFFER_SIZE (1 << 16)
+
+static char output_buffer[OUTPUT_BUFFER_SIZE];
+
+__attribute__((constructor)) static void init_output(void) {
+  const char *filename = getenv("PINKY_OUTPUT");
+  if (filename && !freopen(filename, "w", stdout)) {
+    perror(filename);
+    exit(1);
+  }
+  setvbuf(stdout, output_buffer, _IOFBF, sizeof output_buffer);
+}
 
 void print_i32(int val) {
   printf("print_i32: %d\n", val);
@@ -1,258 +1,531 @@
+import math
+import operator
+import itertools
 from defs import *
 from utils import *
 from model import *
 from tokens import *
 from state import *
-import codecs
+from visitor import *
+from rope import *
+
+###############################################################################
+# Operator handlers, looked up by the token type of the operator. They receive
+# the node (for error messages) and the tagged values of the operands.
+###############################################################################
+def unsupported_binop(node, lefttype, righttype):
+  runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
+
+def unsupported_unop(node, operandtype):
+  runtime_error(f'Unsupported operator {node.op.lexeme!r} with {operandtype}.', node.op.line)
+
+def binop_add(node, lefttype, leftval, righttype, rightval):
+  if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+    return (TYPE_NUMBER, leftval + rightval)
+  elif lefttype == TYPE_STRING or righttype == TYPE_STRING:
+    return (TYPE_STRING, stringify(leftval) + stringify(rightval))
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_sub(node, lefttype, leftval, righttype, rightval):
+  if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+    return (TYPE_NUMBER, leftval - rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_mul(node, lefttype, leftval, righttype, rightval):
+  if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+    return (TYPE_NUMBER, leftval * rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_div(node, lefttype, leftval, righttype, rightval):
+  if rightval == 0:
+    runtime_error(f'Division by zero.', node.line)
+  if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+    return (TYPE_NUMBER, leftval / rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_mod(node, lefttype, leftval, righttype, rightval):
+  if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+    return (TYPE_NUMBER, leftval % rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_exp(node, lefttype, leftval, righttype, rightval):
+  if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+    return (TYPE_NUMBER, leftval ** rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_gt(node, lefttype, leftval, righttype, rightval):
+  if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING):
+    return (TYPE_BOOL, leftval > rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_ge(node, lefttype, leftval, righttype, rightval):
+  if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING):
+    return (TYPE_BOOL, leftval >= rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_lt(node, lefttype, leftval, righttype, rightval):
+  if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING):
+    return (TYPE_BOOL, leftval < rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_le(node, lefttype, leftval, righttype, rightval):
+  if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING):
+    return (TYPE_BOOL, leftval <= rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_eq(node, lefttype, leftval, righttype, rightval):
+  if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING) or (lefttype == TYPE_BOOL and righttype == TYPE_BOOL):
+    return (TYPE_BOOL, leftval == rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def binop_ne(node, lefttype, leftval, righttype, rightval):
+  if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING) or (lefttype == TYPE_BOOL and righttype == TYPE_BOOL):
+    return (TYPE_BOOL, leftval != rightval)
+  unsupported_binop(node, lefttype, righttype)
+
+def unop_neg(node, operandtype, operandval):
+  if operandtype == TYPE_NUMBER:
+    return (TYPE_NUMBER, -operandval)
+  unsupported_unop(node, operandtype)
+
+def unop_pos(node, operandtype, operandval):
+  if operandtype == TYPE_NUMBER:
+    return (TYPE_NUMBER, operandval)
+  unsupported_unop(node, operandtype)
+
+def unop_not(node, operandtype, operandval):
+  if operandtype == TYPE_BOOL:
+    return (TYPE_BOOL, not operandval)
+  unsupported_unop(node, operandtype)
+
+# The operator handlers, by operator token. The other execution engines (the
+# untagged interpreter, the closure compiler, the Python back end) do the
+# common cases inline and fall back to these handlers for everything else,
+# so that their semantics and their runtime errors are exactly the ones of
+# the Interpreter.
+BINOPS = {
+  TOK_PLUS: binop_add,
+  TOK_MINUS: binop_sub,
+  TOK_STAR: binop_mul,
+  TOK_SLASH: binop_div,
+  TOK_MOD: binop_mod,
+  TOK_CARET: binop_exp,
+  TOK_GT: binop_gt,
+  TOK_GE: binop_ge,
+  TOK_LT: binop_lt,
+  TOK_LE: binop_le,
+  TOK_EQEQ: binop_eq,
+  TOK_NE: binop_ne,
+}
+
+UNOPS = {
+  TOK_MINUS: unop_neg,
+  TOK_PLUS: unop_pos,
+  TOK_NOT: unop_not,
+}
+
+# The Python operation of each arithmetic/comparison operator when both operands are numbers
+NUMBER_OPS = {
+  TOK_PLUS: (TYPE_NUMBER, operator.add),
+  TOK_MINUS: (TYPE_NUMBER, operator.sub),
+  TOK_STAR: (TYPE_NUMBER, operator.mul),
+  TOK_SLASH: (TYPE_NUMBER, operator.truediv),
+  TOK_MOD: (TYPE_NUMBER, operator.mod),
+  TOK_CARET: (TYPE_NUMBER, operator.pow),
+  TOK_GT: (TYPE_BOOL, operator.gt),
+  TOK_GE: (TYPE_BOOL, operator.ge),
+  TOK_LT: (TYPE_BOOL, operator.lt),
+  TOK_LE: (TYPE_BOOL, operator.le),
+  TOK_EQEQ: (TYPE_BOOL, operator.eq),
+  TOK_NE: (TYPE_BOOL, operator.ne),
+}
+
+###############################################################################
+# Specialized handlers, for the inline caches of the Interpreter. Each one is
+# the handler of an operator for a single pair of operand types, which does
+# not check them again: they receive the node and the values of the operands.
+###############################################################################
+def number_add(node, leftval, rightval):
+  return (TYPE_NUMBER, leftval + rightval)
+
+def number_sub(node, leftval, rightval):
+  return (TYPE_NUMBER, leftval - rightval)
+
+def number_mul(node, leftval, rightval):
+  return (TYPE_NUMBER, leftval * rightval)
+
+def number_div(node, leftval, rightval):
+  if rightval == 0:
+    runtime_error(f'Division by zero.', node.line)
+  return (TYPE_NUMBER, leftval / rightval)
+
+def number_mod(node, leftval, rightval):
+  return (TYPE_NUMBER, leftval % rightval)
+
+def number_exp(node, leftval, rightval):
+  return (TYPE_NUMBER, leftval ** rightval)
+
+def compare_gt(node, leftval, rightval):
+  return (TYPE_BOOL, leftval > rightval)
+
+def compare_ge(node, leftval, rightval):
+  return (TYPE_BOOL, leftval >= rightval)
+
+def compare_lt(node, leftval, rightval):
+  return (TYPE_BOOL, leftval < rightval)
+
+def compare_le(node, leftval, rightval):
+  return (TYPE_BOOL, leftval <= rightval)
+
+def compare_eq(node, leftval, rightval):
+  return (TYPE_BOOL, leftval == rightval)
+
+def compare_ne(node, leftval, rightval):
+  return (TYPE_BOOL, leftval != rightval)
+
+def string_concat(node, leftval, rightval):
+  return (TYPE_STRING, concat(leftval, rightval)) # (long strings are Ropes)
+
+def stringify_concat(node, leftval, rightval):
+  return (TYPE_STRING, concat_values(leftval, rightval))
+
+# (operator, lefttype, righttype) -> specialized handler
+SPECIALIZED_BINOPS = {
+  (TOK_PLUS, TYPE_NUMBER, TYPE_NUMBER): number_add,
+  (TOK_MINUS, TYPE_NUMBER, TYPE_NUMBER): number_sub,
+  (TOK_STAR, TYPE_NUMBER, TYPE_NUMBER): number_mul,
+  (TOK_SLASH, TYPE_NUMBER, TYPE_NUMBER): number_div,
+  (TOK_MOD, TYPE_NUMBER, TYPE_NUMBER): number_mod,
+  (TOK_CARET, TYPE_NUMBER, TYPE_NUMBER): number_exp,
+  (TOK_GT, TYPE_NUMBER, TYPE_NUMBER): compare_gt,
+  (TOK_GE, TYPE_NUMBER, TYPE_NUMBER): compare_ge,
+  (TOK_LT, TYPE_NUMBER, TYPE_NUMBER): compare_lt,
+  (TOK_LE, TYPE_NUMBER, TYPE_NUMBER): compare_le,
+  (TOK_EQEQ, TYPE_NUMBER, TYPE_NUMBER): compare_eq,
+  (TOK_NE, TYPE_NUMBER, TYPE_NUMBER): compare_ne,
+  (TOK_PLUS, TYPE_STRING, TYPE_STRING): string_concat,
+  (TOK_PLUS, TYPE_STRING, TYPE_NUMBER): stringify_concat,
+  (TOK_PLUS, TYPE_NUMBER, TYPE_STRING): stringify_concat,
+  (TOK_PLUS, TYPE_STRING, TYPE_BOOL): stringify_concat,
+  (TOK_PLUS, TYPE_BOOL, TYPE_STRING): stringify_concat,
+  (TOK_GT, TYPE_STRING, TYPE_STRING): compare_gt,
+  (TOK_GE, TYPE_STRING, TYPE_STRING): compare_ge,
+  (TOK_LT, TYPE_STRING, TYPE_STRING): compare_lt,
+  (TOK_LE, TYPE_STRING, TYPE_STRING): compare_le,
+  (TOK_EQEQ, TYPE_STRING, TYPE_STRING): compare_eq,
+  (TOK_NE, TYPE_STRING, TYPE_STRING): compare_ne,
+  (TOK_EQEQ, TYPE_BOOL, TYPE_BOOL): compare_eq,
+  (TOK_NE, TYPE_BOOL, TYPE_BOOL): compare_ne,
+}
+
+def specialize_binop(op, lefttype, righttype):
+  '''The handler of an operator for a pair of operand types (the generic one, if the operation is not supported)'''
+  handler = SPECIALIZED_BINOPS.get((op, lefttype, righttype))
+  if handler is None:
+    generic = BINOPS[op]
+    def handler(node, leftval, rightval):
+      return generic(node, lefttype, leftval, righttype, rightval) # reports the runtime error
+  return handler
+
+###############################################################################
+# The same operations on untagged values (plain Python floats, strings and
+# bools, as the UntaggedInterpreter and the Python back end represent them)
+###############################################################################
+def type_tag(value):
+  '''The Pinky type of a Python value'''
+  if type(value) is bool:
+    return TYPE_BOOL
+  if type(value) is str:
+    return TYPE_STRING
+  return TYPE_NUMBER
+
+def untagged_binop(node, leftval, rightval):
+  return BINOPS[node.op.token_type](node, type_tag(leftval), leftval, type_tag(rightval), rightval)[1]
+
+def untagged_unop(node, operandval):
+  return UNOPS[node.op.token_type](node, type_tag(operandval), operandval)[1]
+
+###############################################################################
+# Counted loops: the values of the variable of a for loop, from the start to
+# the end (included), going up if the start is below the end and down if not.
+###############################################################################
+MAX_EXACT = 2 ** 53 # the integers up to this one are exact floats
+
+def loop_values(start, end, step, up):
+  '''An iterator on the values of the variable of a for loop (untagged)'''
+  if (type(start) is float and start.is_integer() and type(step) in (int, float) and float(step).is_integer()
+      and type(end) is float and math.isfinite(end) and (step > 0 if up else step < 0)
+      and max(abs(start), abs(end)) + abs(step) < MAX_EXACT):
+    # The common case: every value is an integer, so adding the step to a float is exact, and
+    # the loop is a range of integers (converted to floats in C, without running any bytecode)
+    if up:
+      return map(float, range(int(start), math.floor(end) + 1, int(step)))
+    return map(float, range(int(start), math.ceil(end) - 1, int(step)))
+  return stepped_values(start, end, step, up)
+
+def stepped_values(start, end, step, up):
+  '''The same values, adding the step and comparing with the end on every iteration'''
+  value = start
+  while (value <= end) if up else (value >= end):
+    yield value
+    value = value + step
+
+def loop_slot(env, ident):
+  '''The values and the slot of the variable of a for loop, if the resolver found it (None, None if not)'''
+  if ident.depth is None:
+    return None, None
+  return env.ancestor(ident.depth).values, ident.slot
+
+def memoizable(value):
+  '''
+  Whether calls with an argument can share the value of a call with an equal one: not the
+  integer 0 (the value of a call without a ret) and -0.0, which are equal to 0.0 but print
+  or divide differently
+  '''
+  if type(value) is float:
+    return math.copysign(1, value) > 0 or value != 0
+  return type(value) is not int
+
+class Interpreter(Visitor):
+  prefix = 'interpret_'
+  nothing = (TYPE_NUMBER, 0) # the value of a call that ends without a ret
+
+  def __init__(self, memo=None, output=None):
+    # Inline caches of the operations: hits run the specialized handler of the cache of the
+    # node directly, misses are the first time the node runs, or a new pair of operand types
+    self.cache_hits = 0
+    self.cache_misses = 0
+    # The values of the calls to the pure functions (a MemoCache, None to always run their body)
+    self.memo = memo
+    self.output = output or Output() # where the print statements write
 
-class Interpreter:
   def interpret(self, node, env):
-    if isinstance(node, Integer):
-      return (TYPE_NUMBER, float(node.value))
-
-    elif isinstance(node, Float):
-      return (TYPE_NUMBER, float(node.value))
-
-    elif isinstance(node, String):
-      return (TYPE_STRING, str(node.value))
-
-    elif isinstance(node, Bool):
-      return (TYPE_BOOL, node.value)
-
-    elif isinstance(node, Grouping):
-      return self.interpret(node.value, env)
-
-    elif isinstance(node, Identifier):
-      value = env.get_var(node.name)
-      if value is None:
-        runtime_error(f'Undeclared identifier {node.name!r}', node.line)
-      if value[1] is None:
-        runtime_error(f'Uninitialized identifier {node.name!r}', node.line)
-      return value
-
-    elif isinstance(node, Assignment):
-      # Evaluate the right-hand side expression
-      righttype, rightval = self.interpret(node.right, env)
-      # Update the value of the left-hand side variable or create a new one
+    return self.methods[type(node)](self, node, env)
+
+  def interpret_Integer(self, node, env):
+    return (TYPE_NUMBER, float(node.value))
+
+  def interpret_Float(self, node, env):
+    return (TYPE_NUMBER, float(node.value))
+
+  def interpret_String(self, node, env):
+    return (TYPE_STRING, str(node.value))
+
+  def interpret_Bool(self, node, env):
+    return (TYPE_BOOL, node.value)
+
+  def interpret_Grouping(self, node, env):
+    return self.interpret(node.value, env)
+
+  def scope(self, stmts):
+    '''The scope of the environments of a block (None if the program was not resolved)'''
+    return stmts.scope
+
+  def block_env(self, stmts, env):
+    '''A new child environment to run a block in (or the same one, if the block binds no names)'''
+    scope = self.scope(stmts)
+    if scope is not None and scope.elided:
+      return env
+    return env.new_env(scope)
+
+  def interpret_Identifier(self, node, env):
+    if node.depth is None:
+      value = env.get_var(node.name) # resolved at runtime
+    else:
+      value = env.ancestor(node.depth).values[node.slot]
+    if value is None:
+      runtime_error(f'Undeclared identifier {node.name!r}', node.line)
+    if value[1] is None:
+      runtime_error(f'Uninitialized identifier {node.name!r}', node.line)
+    return value
+
+  def interpret_Assignment(self, node, env):
+    # Evaluate the right-hand side expression
+    righttype, rightval = self.interpret(node.right, env)
+    # Update the value of the left-hand side variable or create a new one
+    if node.depth is None:
       env.set_var(node.left.name, (righttype, rightval))
-
-    elif isinstance(node, LocalAssignment):
-      # Evaluate the right-hand side expression
-      righttype, rightval = self.interpret(node.right, env)
-      # Always create a new variable in the current scope/environment
+    else:
+      env.ancestor(node.depth).values[node.slot] = (righttype, rightval)
+
+  def interpret_LocalAssignment(self, node, env):
+    # Evaluate the right-hand side expression
+    righttype, rightval = self.interpret(node.right, env)
+    # Always create a new variable in the current scope/environment
+    if node.slot is None:
       env.set_local(node.left.name, (righttype, rightval))
-
-    elif isinstance(node, BinOp):
-      lefttype, leftval  = self.interpret(node.left, env)
-      righttype, rightval = self.interpret(node.right, env)
-      if node.op.token_type == TOK_PLUS:
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, leftval + rightval)
-        elif lefttype == TYPE_STRING or righttype == TYPE_STRING:
-          return (TYPE_STRING, stringify(leftval) + stringify(rightval))
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_MINUS:
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, leftval - rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_STAR:
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, leftval * rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_SLASH:
-        if rightval == 0:
-          runtime_error(f'Division by zero.', node.line)
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, leftval / rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_MOD:
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, leftval % rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_CARET:
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, leftval ** rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_GT:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING):
-          return (TYPE_BOOL, leftval > rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_GE:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING):
-          return (TYPE_BOOL, leftval >= rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_LT:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING):
-          return (TYPE_BOOL, leftval < rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_LE:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING):
-          return (TYPE_BOOL, leftval <= rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_EQEQ:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING) or (lefttype == TYPE_BOOL and righttype == TYPE_BOOL):
-          return (TYPE_BOOL, leftval == rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      elif node.op.token_type == TOK_NE:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (lefttype == TYPE_STRING and righttype == TYPE_STRING) or (lefttype == TYPE_BOOL and righttype == TYPE_BOOL):
-          return (TYPE_BOOL, leftval != rightval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-    elif isinstance(node, UnOp):
-      operandtype, operandval = self.interpret(node.operand, env)
-      if node.op.token_type == TOK_MINUS:
-        if operandtype == TYPE_NUMBER:
-          return (TYPE_NUMBER, -operandval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} with {operandtype}.', node.op.line)
-
-      if node.op.token_type == TOK_PLUS:
-        if operandtype == TYPE_NUMBER:
-          return (TYPE_NUMBER, operandval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} with {operandtype}.', node.op.line)
-
-      elif node.op.token_type == TOK_NOT:
-        if operandtype == TYPE_BOOL:
-          return (TYPE_BOOL, not operandval)
-        else:
-          runtime_error(f'Unsupported operator {node.op.lexeme!r} with {operandtype}.', node.op.line)
-
-    elif isinstance(node, LogicalOp):
-      lefttype, leftval = self.interpret(node.left, env)
-      if node.op.token_type == TOK_OR:
-        if leftval:
-          return (lefttype, leftval)
-      elif node.op.token_type == TOK_AND:
-        if not leftval:
-          return (lefttype, leftval)
-      return self.interpret(node.right, env)
-
-    elif isinstance(node, Stmts):
-      #Evaluate statements in sequence, one after the other.
-      for stmt in node.stmts:
-        self.interpret(stmt, env)
-
-    elif isinstance(node, PrintStmt):
-      exprtype, exprval = self.interpret(node.value, env)
-      val = stringify(exprval)
-      print(codecs.escape_decode(bytes(val, "utf-8"))[0].decode("utf-8"), end=node.end)
-
-    elif isinstance(node, IfStmt):
+    else:
+      env.values[node.slot] = (righttype, rightval)
+
+  def interpret_BinOp(self, node, env):
+    lefttype, leftval  = self.interpret(node.left, env)
+    righttype, rightval = self.interpret(node.right, env)
+    cache = node.cache
+    if cache is not None and cache[0] == lefttype and cache[1] == righttype:
+      self.cache_hits += 1
+      return cache[2](node, leftval, rightval)
+    # The operand types changed (or it is the first run): specialize the node for the new ones
+    self.cache_misses += 1
+    handler = specialize_binop(node.op.token_type, lefttype, righttype)
+    node.cache = (lefttype, righttype, handler)
+    return handler(node, leftval, rightval)
+
+  def interpret_UnOp(self, node, env):
+    operandtype, operandval = self.interpret(node.operand, env)
+    return UNOPS[node.op.token_type](node, operandtype, operandval)
+
+  def interpret_LogicalOp(self, node, env):
+    lefttype, leftval = self.interpret(node.left, env)
+    if node.op.token_type == TOK_OR:
+      if leftval:
+        return (lefttype, leftval)
+    elif node.op.token_type == TOK_AND:
+      if not leftval:
+        return (lefttype, leftval)
+    return self.interpret(node.right, env)
+
+  def interpret_Stmts(self, node, env):
+    #Evaluate statements in sequence, one after the other.
+    # Statements return None, except a ret (and the statements that run it) which returns its value
+    for stmt in node.stmts:
+      result = self.interpret(stmt, env)
+      if result is not None:
+        return result
+
+  def interpret_PrintStmt(self, node, env):
+    exprtype, exprval = self.interpret(node.value, env)
+    self.output.write(stringify(exprval) + node.end)
+
+  def interpret_IfStmt(self, node, env):
+    testtype, testval = self.interpret(node.test, env)
+    if testtype != TYPE_BOOL:
+      runtime_error("Condition test is not a boolean expression.", node.line)
+    if testval:
+      return self.interpret(node.then_stmts, self.block_env(node.then_stmts, env)) # We must create a new child scope for the then-block
+    elif node.else_stmts is not None:
+      return self.interpret(node.else_stmts, self.block_env(node.else_stmts, env)) # We must create a new child scope for the else-block
+
+  def interpret_WhileStmt(self, node, env):
+    new_env = self.block_env(node.body_stmts, env)
+    while True:
       testtype, testval = self.interpret(node.test, env)
       if testtype != TYPE_BOOL:
-        runtime_error("Condition test is not a boolean expression.", node.line)
-      if testval:
-        self.interpret(node.then_stmts, env.new_env()) # We must create a new child scope for the then-block
-      else:
-        self.interpret(node.else_stmts, env.new_env()) # We must create a new child scope for the else-block
-
-    elif isinstance(node, WhileStmt):
-      new_env = env.new_env()
-      while True:
-        testtype, testval = self.interpret(node.test, env)
-        if testtype != TYPE_BOOL:
-          runtime_error(f'While test is not a boolean expression.', node.line)
-        if not testval:
-          break
-        self.interpret(node.body_stmts, new_env) # pass the new child environment for the scope of the while block
-
-    elif isinstance(node, ForStmt):
-      varname = node.ident.name
-      itype, i = self.interpret(node.start, env)
-      endtype, end = self.interpret(node.end, env)
-      block_new_env = env.new_env()
-      if i < end:
-        if node.step is None:
-          step = 1
-        else:
-          steptype, step = self.interpret(node.step, env)
-        while i <= end:
-          newval = (TYPE_NUMBER, i)
-          env.set_var(varname, newval)
-          self.interpret(node.body_stmts, block_new_env) # pass the new child environment for the scope of the while block
-          i = i + step
+        runtime_error(f'While test is not a boolean expression.', node.line)
+      if not testval:
+        break
+      result = self.interpret(node.body_stmts, new_env) # pass the new child environment for the scope of the while block
+      if result is not None:
+        return result
+
+  def interpret_ForStmt(self, node, env):
+    itype, i = self.interpret(node.start, env)
+    endtype, end = self.interpret(node.end, env)
+    block_new_env = self.block_env(node.body_stmts, env)
+    up = i < end
+    if node.step is None:
+      step = 1 if up else -1
+    else:
+      steptype, step = self.interpret(node.step, env)
+    # The loop variable is set in the current environment, or in the one where the resolver found it
+    values, slot = loop_slot(env, node.ident)
+    for newval in zip(itertools.repeat(TYPE_NUMBER), loop_values(i, end, step, up)):
+      if values is None:
+        env.set_var(node.ident.name, newval)
       else:
-        if node.step is None:
-          step = -1
-        else:
-          steptype, step = self.interpret(node.step, env)
-        while i >= end:
-          newval = (TYPE_NUMBER, i)
-          env.set_var(varname, newval)
-          self.interpret(node.body_stmts, block_new_env) # pass the new child environment for the scope of the while block
-          i = i + step
-
-    elif isinstance(node, FuncDecl):
-      env.set_func(node.name, (node, env)) # we also store the environment in which the function was declared
-
-    elif isinstance(node, FuncCall):
-      # We must make sure the function was declared
-      func = env.get_func(node.name)
-      if not func:
-        runtime_error(f'Function {node.name!r} not declared.', node.line)
-
-      # Fetch the function declaration
-      func_decl = func[0] #--> get the function declaration node that was saved in the environment
-      func_env  = func[1] #--> get the environment in which the function was originally declared
-
-      # Does the number of args match the expected number of params
-      if len(node.args) != len(func_decl.params):
-        runtime_error(f'Function {func_decl.name!r} expected {len(func_decl.params)} params but {len(node.args)} args were passed.', node.line)
-
-      # We need to evaluate all the args
-      args = []
-      for arg in node.args:
-        args.append(self.interpret(arg, env))
-
-      # Create a new nested block environment for the function
-      new_func_env = func_env.new_env()
-
-      # We must create local variables in the new child environment of the function for the parameters and bind the argument values to them!
-      for param, argval in zip(func_decl.params, args):
+        values[slot] = newval
+      result = self.interpret(node.body_stmts, block_new_env) # pass the new child environment for the scope of the for block
+      if result is not None:
+        return result
+
+  def interpret_FuncDecl(self, node, env):
+    # We also store the environment in which the function was declared
+    if node.slot is None:
+      env.set_func(node.name, (node, env))
+    else:
+      env.values[node.slot] = (node, env)
+
+  def interpret_FuncCall(self, node, env):
+    # We must make sure the function was declared
+    if node.depth is None:
+      func = env.get_func(node.name) # resolved at runtime
+    else:
+      func = env.ancestor(node.depth).values[node.slot]
+    if not func:
+      runtime_error(f'Function {node.name!r} not declared.', node.line)
+
+    # Fetch the function declaration
+    func_decl = func[0] #--> get the function declaration node that was saved in the environment
+    func_env  = func[1] #--> get the environment in which the function was originally declared
+
+    # Does the number of args match the expected number of params
+    if len(node.args) != len(func_decl.params):
+      runtime_error(f'Function {func_decl.name!r} expected {len(func_decl.params)} params but {len(node.args)} args were passed.', node.line)
+
+    # We need to evaluate all the args
+    args = []
+    for arg in node.args:
+      args.append(self.interpret(arg, env))
+
+    # A pure function called again with the same arguments returns the value of the first call
+    key = None
+    if self.memo is not None and func_decl.pure:
+      key = self.memo_key(func_decl, args)
+      if key is not None:
+        result = self.memo.get(key)
+        if result is not None:
+          return result
+
+    # Create a new nested block environment for the function
+    new_func_env = self.block_env(func_decl.body_stmts, func_env)
+
+    # We must create local variables in the new child environment of the function for the parameters and bind the argument values to them!
+    for param, argval in zip(func_decl.params, args):
+      if param.slot is None:
         new_func_env.set_local(param.name, argval)
-
-      # Finally, we ask to interpret the body_stmts of the function declaration
-      try:
-        self.interpret(func_decl.body_stmts, new_func_env)
-        return (TYPE_NUMBER, 0)
-      except Return as e:
-        return e.args[0] # <-- args is the arguments passed to the exception
-
-    elif isinstance(node, FuncCallStmt):
-      self.interpret(node.expr, env)
-
-    elif isinstance(node, RetStmt):
-      raise Return(self.interpret(node.value, env))
+      else:
+        new_func_env.values[param.slot] = argval
+
+    # Finally, we ask to interpret the body_stmts of the function declaration
+    result = self.interpret(func_decl.body_stmts, new_func_env)
+    if result is None:
+      result = self.nothing # the body ended without a ret
+    if key is not None:
+      self.memo.put(key, result)
+    return result # <-- the value of the ret statement that ended the body
+
+  def memo_key(self, func_decl, args):
+    '''The key of a call in the memo cache (None if it can not be memoized)'''
+    for argtype, argval in args:
+      if not memoizable(argval):
+        return None
+    return (func_decl, *args)
+
+  def interpret_FuncCallStmt(self, node, env):
+    self.interpret(node.expr, env)
+
+  def interpret_RetStmt(self, node, env):
+    # The value is handed back through the statements that enclose the ret, up to the function call
+    return self.interpret(node.value, env)
+
+  def print_cache_stats(self):
+    total = self.cache_hits + self.cache_misses
+    print(f'{"inline cache hits":24} {self.cache_hits:10} {self.cache_hits / total if total else 0:8.2%}')
+    print(f'{"inline cache misses":24} {self.cache_misses:10}')
+
+  def run(self, node, env):
+    '''Interpret a whole program in its global environment'''
+    try:
+      result = self.interpret(node, env)
+    finally:
+      self.output.flush()
+    if result is not None:
+      raise Return(result) # a ret outside of any function
 
   def interpret_ast(self, node):
     # Entry point of our interpreter creating a brand new global/parent environment
-    env = Environment()
-    self.interpret(node, env)
+    env = Environment(scope=node.scope)
+    self.run(node, env)
 
 
 class Return(Exception):
-  pass
+  '''Raised by a ret statement that is not in a function'''
@@ -1,13 +1,24 @@
+import io
+import re
 from utils import *
 from tokens import *
 
+CHUNK_SIZE = 64 * 1024 # Number of characters read at a time by iter_tokens()
+
+class IncompleteSource(Exception):
+  '''
+  Raised when a chunk of the source ends in the middle of a string (only while more input is on the way)
+  '''
+  pass
+
 class Lexer:
   def __init__(self, source):
-    self.source = source
+    self.source = source # A string, or a text stream when using iter_tokens()
     self.start = 0
     self.curr = 0
     self.line = 1
     self.tokens = []
+    self.at_eof = True   # False while iter_tokens() still has more chunks to read
 
   def advance(self):
     ch = self.source[self.curr]
@@ -47,6 +58,8 @@ class Lexer:
     while self.peek() != start_quote and not(self.curr >= len(self.source)):
       self.advance()
     if self.curr >= len(self.source):
+      if not self.at_eof:
+        raise IncompleteSource(self.start)
       lexing_error(f'Unterminated string.', self.line)
     self.advance() # Consume the ending quote
     self.add_token(TOK_STRING)
@@ -65,54 +78,326 @@ class Lexer:
   def add_token(self, token_type):
     self.tokens.append(Token(token_type, self.source[self.start:self.curr], self.line))
 
+  def scan_token(self):
+    '''
+    Scan a single token starting at self.start (whitespace and comments produce no token)
+    '''
+    ch = self.advance()
+    if ch == '\n': self.line = self.line + 1
+    elif ch == ' ': pass
+    elif ch == '\t': pass
+    elif ch == '\r': pass
+    elif ch == '(': self.add_token(TOK_LPAREN)
+    elif ch == ')': self.add_token(TOK_RPAREN)
+    elif ch == '{': self.add_token(TOK_LCURLY)
+    elif ch == '}': self.add_token(TOK_RCURLY)
+    elif ch == '[': self.add_token(TOK_LSQUAR)
+    elif ch == ']': self.add_token(TOK_RSQUAR)
+    elif ch == '.': self.add_token(TOK_DOT)
+    elif ch == ',': self.add_token(TOK_COMMA)
+    elif ch == '+': self.add_token(TOK_PLUS)
+    elif ch == '*': self.add_token(TOK_STAR)
+    elif ch == '^': self.add_token(TOK_CARET)
+    elif ch == '/': self.add_token(TOK_SLASH)
+    elif ch == ';': self.add_token(TOK_SEMICOLON)
+    elif ch == '?': self.add_token(TOK_QUESTION)
+    elif ch == '%': self.add_token(TOK_MOD)
+    elif ch == '-':
+      if self.match('-'):
+        while self.peek() != '\n' and not(self.curr >= len(self.source)):
+          self.advance()
+      else:
+        self.add_token(TOK_MINUS)
+    elif ch == '=':
+      if self.match('='):
+        self.add_token(TOK_EQEQ)
+      else:
+        self.add_token(TOK_EQ)
+    elif ch == '~':
+      self.add_token(TOK_NE if self.match('=') else TOK_NOT)
+    elif ch == '<':
+      self.add_token(TOK_LE if self.match('=') else TOK_LT)
+    elif ch == '>':
+      self.add_token(TOK_GE if self.match('=') else TOK_GT)
+    elif ch == ':':
+      self.add_token(TOK_ASSIGN if self.match('=') else TOK_COLON)
+    elif ch == '"' or ch == '\'':
+      self.handle_string(ch)
+    elif ch.isdigit():
+      self.handle_number()
+    elif ch.isalpha() or ch == '_':
+      self.handle_identifier()
+    else:
+      lexing_error(f'Error at {ch!r}: Unexpected character.', self.line)
+
   def tokenize(self):
     while self.curr < len(self.source):
       self.start = self.curr
-      ch = self.advance()
-      if ch == '\n': self.line = self.line + 1
-      elif ch == ' ': pass
-      elif ch == '\t': pass
-      elif ch == '\r': pass
-      elif ch == '(': self.add_token(TOK_LPAREN)
-      elif ch == ')': self.add_token(TOK_RPAREN)
-      elif ch == '{': self.add_token(TOK_LCURLY)
-      elif ch == '}': self.add_token(TOK_RCURLY)
-      elif ch == '[': self.add_token(TOK_LSQUAR)
-      elif ch == ']': self.add_token(TOK_RSQUAR)
-      elif ch == '.': self.add_token(TOK_DOT)
-      elif ch == ',': self.add_token(TOK_COMMA)
-      elif ch == '+': self.add_token(TOK_PLUS)
-      elif ch == '*': self.add_token(TOK_STAR)
-      elif ch == '^': self.add_token(TOK_CARET)
-      elif ch == '/': self.add_token(TOK_SLASH)
-      elif ch == ';': self.add_token(TOK_SEMICOLON)
-      elif ch == '?': self.add_token(TOK_QUESTION)
-      elif ch == '%': self.add_token(TOK_MOD)
-      elif ch == '-':
-        if self.match('-'):
-          while self.peek() != '\n' and not(self.curr >= len(self.source)):
-            self.advance()
-        else:
-          self.add_token(TOK_MINUS)
-      elif ch == '=':
-        if self.match('='):
-          self.add_token(TOK_EQEQ)
-        else:
-          self.add_token(TOK_EQ)
-      elif ch == '~':
-        self.add_token(TOK_NE if self.match('=') else TOK_NOT)
-      elif ch == '<':
-        self.add_token(TOK_LE if self.match('=') else TOK_LT)
-      elif ch == '>':
-        self.add_token(TOK_GE if self.match('=') else TOK_GT)
-      elif ch == ':':
-        self.add_token(TOK_ASSIGN if self.match('=') else TOK_COLON)
-      elif ch == '"' or ch == '\'':
-        self.handle_string(ch)
-      elif ch.isdigit():
-        self.handle_number()
-      elif ch.isalpha() or ch == '_':
-        self.handle_identifier()
+      self.scan_token()
+    return self.tokens
+
+  def iter_tokens(self, chunk_size=CHUNK_SIZE):
+    '''
+    Generator version of tokenize() that reads the source (a string or any text stream)
+    chunk_size characters at a time and yields tokens lazily, so only the tokens of one
+    chunk are ever held in memory.
+    Chunks are tokenized up to their last newline (no token but a string can span a newline),
+    and the leftover text is carried over to the next chunk. A string that is still open at
+    the end of a chunk is carried over as well, and is not lexed again before its closing
+    quote has been read. The carried text is kept as a list of parts, joined only when it
+    is tokenized, so a long line or string costs one join and not one per chunk.
+    '''
+    stream = io.StringIO(self.source) if isinstance(self.source, str) else self.source
+    pending = []   # the parts of the text carried over to the next chunk
+    closing = None # the quote that closes the string still open in the pending text
+    self.at_eof = False
+    while not self.at_eof:
+      chunk = stream.read(chunk_size)
+      if chunk:
+        start = 0
+        if closing:
+          start = chunk.find(closing) + 1
+          if start == 0:
+            pending.append(chunk)
+            continue
+          closing = None
+        cut = chunk.rfind('\n', start) + 1
+        if cut == 0:
+          pending.append(chunk)
+          continue
+        pending.append(chunk[:cut])
+        segment, pending = ''.join(pending), [chunk[cut:]]
       else:
-        lexing_error(f'Error at {ch!r}: Unexpected character.', self.line)
+        self.at_eof = True
+        segment, pending = ''.join(pending), []
+      self.source = segment
+      self.curr = 0
+      self.tokens = []
+      try:
+        self.tokenize()
+      except IncompleteSource as e:
+        rest = segment[e.args[0]:]
+        if rest[0] not in pending[0]:
+          closing = rest[0]
+        pending.insert(0, rest)
+      yield from self.tokens
+    self.tokens = []
+
+###############################################################################
+# Master pattern for the regex lexer. It splits the source into lexemes in one
+# pass (whitespace runs, comments, numbers, names, strings, two-char operators,
+# and any other single character), and the lexemes are then classified with
+# the tables below. Two-char operators must come before the catch-all '.'.
+###############################################################################
+LEXEME_PATTERN = r'''
+    [ \t\r]+                 # blanks
+  | \n[ \t\r\n]*            # newlines (and the blanks that follow them)
+  | --[^\n]*               # comments
+  | [0-9]+\.[0-9]+          # floats
+  | [0-9]+                  # integers
+  | [A-Za-z_]\w*            # identifiers and keywords
+  | "[^"]*" | \'[^\']*\'     # strings
+  | == | ~= | <= | >= | :=  # two-char operators
+  | .                       # everything else
+'''
+
+LEXEME_REGEX = re.compile(LEXEME_PATTERN, re.VERBOSE | re.DOTALL)
+
+# Token types for the lexemes that are fully determined by their text
+LEXEME_TYPES = {
+  '(': TOK_LPAREN, ')': TOK_RPAREN, '{': TOK_LCURLY, '}': TOK_RCURLY, '[': TOK_LSQUAR, ']': TOK_RSQUAR,
+  '.': TOK_DOT, ',': TOK_COMMA, '+': TOK_PLUS, '-': TOK_MINUS, '*': TOK_STAR, '^': TOK_CARET,
+  '/': TOK_SLASH, ';': TOK_SEMICOLON, '?': TOK_QUESTION, '%': TOK_MOD, '=': TOK_EQ, '~': TOK_NOT,
+  '<': TOK_LT, '>': TOK_GT, ':': TOK_COLON,
+  '==': TOK_EQEQ, '~=': TOK_NE, '<=': TOK_LE, '>=': TOK_GE, ':=': TOK_ASSIGN,
+  **keywords,
+}
+
+# Same table with the small integer kinds used by CompactTokens
+LEXEME_KINDS = {text: TOKEN_KINDS[token_type] for text, token_type in LEXEME_TYPES.items()}
+
+KIND_IDENTIFIER = TOKEN_KINDS[TOK_IDENTIFIER]
+KIND_STRING     = TOKEN_KINDS[TOK_STRING]
+KIND_INTEGER    = TOKEN_KINDS[TOK_INTEGER]
+KIND_FLOAT      = TOKEN_KINDS[TOK_FLOAT]
+
+BLANKS      = frozenset(' \t\r')
+DIGITS      = frozenset('0123456789')
+QUOTES      = frozenset('"\'')
+NAME_START  = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_')
+
+# The same pattern and tables for bytes-like sources (bytes, memoryview, mmap) holding UTF-8 text.
+# Single characters are kept as 1-byte slices, so they can be compared with lexeme[:1].
+LEXEME_REGEX_BYTES = re.compile(LEXEME_PATTERN.encode('ascii'), re.VERBOSE | re.DOTALL)
+LEXEME_KINDS_BYTES = {text.encode('ascii'): kind for text, kind in LEXEME_KINDS.items()}
+BLANKS_BYTES       = frozenset(ch.encode('ascii') for ch in BLANKS)
+DIGITS_BYTES       = frozenset(ch.encode('ascii') for ch in DIGITS)
+QUOTES_BYTES       = frozenset(ch.encode('ascii') for ch in QUOTES)
+NAME_START_BYTES   = frozenset(ch.encode('ascii') for ch in NAME_START)
+NON_ASCII_BYTES    = re.compile(rb'[^\x00-\x7f]')
+END_OF_LINE_BYTES  = re.compile(rb'\n|\Z')
+
+class RegexLexer(Lexer):
+  '''
+  A table-driven lexer that splits the source with one compiled master pattern
+  and classifies each lexeme with a dictionary lookup, instead of stepping
+  through the source one character at a time.
+  It produces exactly the same tokens as Lexer. Anything the master pattern
+  cannot decide on its own (non-ASCII letters or digits, unterminated strings,
+  unexpected characters) is handed back to Lexer.scan_token, so Unicode
+  classification and error messages stay identical.
+  '''
+  def scan_lexemes(self, pos, check_unicode):
+    '''
+    Tokenize from pos onward, returning the position where we stopped
+    (either the end of the source or right after a token that scan_token had to handle).
+    Matches are iterated one at a time, so stopping early does not match the rest of the source.
+    '''
+    source = self.source
+    append = self.tokens.append
+    types = LEXEME_TYPES
+    line = self.line
+    for match in LEXEME_REGEX.finditer(source, pos):
+      text = match.group()
+      pos = match.end()
+      token_type = types.get(text)
+      if token_type is not None:
+        append(Token(token_type, text, line))
+        continue
+      ch = text[0]
+      if ch in BLANKS or ch == '-':
+        continue # blanks and comments
+      if ch == '\n':
+        line += text.count('\n')
+        continue
+      if ch in NAME_START:
+        append(Token(TOK_IDENTIFIER, text, line))
+        continue
+      if ch in DIGITS and not (check_unicode and not source[pos:pos+2].isascii()):
+        append(Token(TOK_FLOAT if '.' in text else TOK_INTEGER, text, line))
+        continue
+      if ch in QUOTES and len(text) > 1:
+        append(Token(TOK_STRING, text, line))
+        continue
+      # Let the character-by-character scanner deal with this token
+      self.start = self.curr = match.start()
+      self.line = line
+      self.scan_token()
+      return self.curr
+    self.line = line
+    return len(source)
+
+  def tokenize(self):
+    check_unicode = not self.source.isascii()
+    pos = self.curr
+    while pos < len(self.source):
+      pos = self.scan_lexemes(pos, check_unicode)
+    self.curr = pos
     return self.tokens
+
+  def tokenize_compact(self):
+    '''
+    Same as tokenize(), but the tokens go into a CompactTokens stream (token kinds,
+    offsets and lines in arrays) instead of a list of Token objects.
+    The source can also be a bytes-like object with UTF-8 text (see tokenize_compact_bytes).
+    '''
+    source = self.source
+    if not isinstance(source, str):
+      return self.tokenize_compact_bytes()
+    tokens = CompactTokens(source)
+    add_kind, add_start, add_end, add_line = tokens.kinds.append, tokens.starts.append, tokens.ends.append, tokens.lines.append
+    kinds = LEXEME_KINDS
+    check_unicode = not source.isascii()
+    line = self.line
+    pos = self.curr
+    while pos < len(source):
+      for match in LEXEME_REGEX.finditer(source, pos):
+        text = match.group()
+        start, pos = match.span()
+        kind = kinds.get(text)
+        if kind is None:
+          ch = text[0]
+          if ch in BLANKS or ch == '-':
+            continue # blanks and comments
+          if ch == '\n':
+            line += text.count('\n')
+            continue
+          if ch in NAME_START:
+            kind = KIND_IDENTIFIER
+          elif ch in DIGITS and not (check_unicode and not source[pos:pos+2].isascii()):
+            kind = KIND_FLOAT if '.' in text else KIND_INTEGER
+          elif ch in QUOTES and len(text) > 1:
+            kind = KIND_STRING
+          else:
+            # Let the character-by-character scanner deal with this token, and match again after it
+            self.tokens = []
+            self.start = self.curr = start
+            self.line = line
+            self.scan_token()
+            for token in self.tokens:
+              tokens.add(TOKEN_KINDS[token.token_type], start, self.curr, token.line)
+            line = self.line
+            pos = self.curr
+            break
+        add_kind(kind)
+        add_start(start)
+        add_end(pos)
+        add_line(line)
+    self.curr = pos
+    self.line = line
+    self.tokens = tokens
+    return tokens
+
+  def tokenize_compact_bytes(self):
+    '''
+    tokenize_compact() for a bytes-like source (bytes, memoryview, mmap) holding UTF-8 text.
+    Nothing is copied out of the source: the stream records byte offsets and lexemes are only
+    decoded when the parser asks for them. Matches are iterated one at a time, so memory use
+    does not grow with the size of the file besides the token arrays themselves.
+    '''
+    source = self.source
+    tokens = CompactTokens(source)
+    add_kind, add_start, add_end, add_line = tokens.kinds.append, tokens.starts.append, tokens.ends.append, tokens.lines.append
+    kinds = LEXEME_KINDS_BYTES
+    line = self.line
+    pos = self.curr
+    while pos < len(source):
+      for match in LEXEME_REGEX_BYTES.finditer(source, pos):
+        text = match.group()
+        start, pos = match.span()
+        ch = text[:1]
+        kind = kinds.get(text)
+        # Multi-byte UTF-8 letters and digits are not covered by the pattern, so a name or a number
+        # followed by one (e.g. 'café', 'end²') must go through the character-by-character scanner
+        if kind is None or (ch in NAME_START_BYTES and NON_ASCII_BYTES.match(source, pos, pos+1)):
+          if ch in BLANKS_BYTES or ch == b'-':
+            continue # blanks and comments
+          if ch == b'\n':
+            line += text.count(b'\n')
+            continue
+          if ch in NAME_START_BYTES and not NON_ASCII_BYTES.match(source, pos, pos+1):
+            kind = KIND_IDENTIFIER
+          elif ch in DIGITS_BYTES and not NON_ASCII_BYTES.search(source, pos, pos+2):
+            kind = KIND_FLOAT if b'.' in text else KIND_INTEGER
+          elif ch in QUOTES_BYTES and len(text) > 1:
+            kind = KIND_STRING
+          else:
+            # Scan the decoded rest of the line. The only token that can span lines (a string)
+            # only gets here when it is unterminated, which is reported on its first line anyway
+            end_of_line = END_OF_LINE_BYTES.search(source, start).end()
+            lexer = Lexer(bytes(source[start:end_of_line]).decode('utf-8'))
+            lexer.line = line
+            lexer.scan_token()
+            pos = start + len(lexer.source[:lexer.curr].encode('utf-8'))
+            for token in lexer.tokens:
+              tokens.add(TOKEN_KINDS[token.token_type], start, pos, token.line)
+            line = lexer.line
+            break
+        add_kind(kind)
+        add_start(start)
+        add_end(pos)
+        add_line(line)
+    self.curr = pos
+    self.line = line
+    self.tokens = tokens
+    return tokens
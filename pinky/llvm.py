@@ -29,6 +29,8 @@ from utils import *
 from tokens import *
 from lexer import *
 from parser import *
+from optimizer import *
+from visitor import *
 from llvmlite import ir
 
 ############################################################
@@ -81,202 +83,197 @@ class LLVMModule:
       self.builder.store(value, llvmptr)
       self.vars[name] = (pinkytype, llvmptr)
 
+############################################################
+# Operator handlers, looked up by the token type of the
+# operator. They receive the node (for error messages),
+# the module and the typed operands.
+############################################################
+def unsupported_binop(node, lefttype, righttype):
+  compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
+
+def unsupported_unop(node, operandtype):
+  compile_error(f'Unsupported operator {node.op.lexeme!r} with {operandtype}.', node.op.line)
+
+def arithmetic(instruction):
+  def handler(node, module, lefttype, leftval, righttype, rightval):
+    if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+      return (TYPE_NUMBER, getattr(module.builder, instruction)(leftval, rightval))
+    else:
+      unsupported_binop(node, lefttype, righttype)
+  return handler
+
+fdiv = arithmetic('fdiv')
+
+def division(node, module, lefttype, leftval, righttype, rightval):
+  if rightval == 0:
+    compile_error(f'Division by zero.', node.line)
+  return fdiv(node, module, lefttype, leftval, righttype, rightval)
+
+def exponent(node, module, lefttype, leftval, righttype, rightval):
+  # TODO: Implement exponent operator using a sequence of multiplications
+  pass
+
+def comparison(cmpop, bools=False):
+  def handler(node, module, lefttype, leftval, righttype, rightval):
+    if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER):
+      return (TYPE_BOOL, module.builder.fcmp_ordered(cmpop, leftval, rightval))
+    elif bools and (lefttype == TYPE_BOOL and righttype == TYPE_BOOL):
+      return (TYPE_BOOL, module.builder.icmp_signed(cmpop, leftval, rightval))
+    else:
+      unsupported_binop(node, lefttype, righttype)
+  return handler
+
+def negation(node, module, operandtype, operandval):
+  if operandtype == TYPE_NUMBER:
+    return (TYPE_NUMBER, module.builder.fneg(operandval))
+  else:
+    unsupported_unop(node, operandtype)
+
+def identity(node, module, operandtype, operandval):
+  if operandtype == TYPE_NUMBER:
+    return (TYPE_NUMBER, operandval)
+  else:
+    unsupported_unop(node, operandtype)
+
+def complement(node, module, operandtype, operandval):
+  if operandtype == TYPE_BOOL:
+    return (TYPE_BOOL, module.builder.not_(operandval)) # Bitwise complement
+  else:
+    unsupported_unop(node, operandtype)
+
+BINOPS = {
+  TOK_PLUS: arithmetic('fadd'),
+  TOK_MINUS: arithmetic('fsub'),
+  TOK_STAR: arithmetic('fmul'),
+  TOK_SLASH: division,
+  TOK_MOD: arithmetic('frem'),
+  TOK_CARET: exponent,
+  TOK_GT: comparison('>'),
+  TOK_GE: comparison('>='),
+  TOK_LT: comparison('<'),
+  TOK_LE: comparison('<='),
+  TOK_EQEQ: comparison('==', bools=True),
+  TOK_NE: comparison('!=', bools=True),
+}
+
+UNOPS = {
+  TOK_MINUS: negation,
+  TOK_PLUS: identity,
+  TOK_NOT: complement,
+}
+
 ############################################################
 # Class to visit all nodes of the AST generating their IR
 ############################################################
-class LLVMGenerator:
+class LLVMGenerator(Visitor):
+  prefix = 'generate_'
+
   def generate(self, node, module):
-    if isinstance(node, Integer):
-      return (TYPE_NUMBER, ir.Constant(f64, float(node.value)))
-
-    if isinstance(node, Float):
-      return (TYPE_NUMBER, ir.Constant(f64, float(node.value)))
-
-    if isinstance(node, Bool):
-      return (TYPE_BOOL, ir.Constant(i1, int(node.value)))
-
-    if isinstance(node, String):
-      compile_error(f"Strings are not implemented in our current LLVM IR generator.", node.line)
-
-    if isinstance(node, Grouping):
-      return self.generate(node.value, module)
-
-    if isinstance(node, Identifier):
-      value = module.get_var(node.name)
-      if value is None:
-        compile_error(f'Undeclared identifier {node.name!r}', node.line)
-      if value[1] is None:
-        compile_error(f'Uninitialized identifier {node.name!r}', node.line)
-      return value
-
-    if isinstance(node, Assignment) or isinstance(node, LocalAssignment):
-      righttype, rightval = self.generate(node.right, module)
-      module.set_var(node.left.name, righttype, rightval)
-
-    if isinstance(node, BinOp):
-      lefttype, leftval = self.generate(node.left, module)
-      righttype, rightval = self.generate(node.right, module)
-      if node.op.token_type == TOK_PLUS:
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, module.builder.fadd(leftval, rightval))
-        else:
-          compile_error(f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.", node.op.line)
-
-      if node.op.token_type == TOK_MINUS:
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, module.builder.fsub(leftval, rightval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      if node.op.token_type == TOK_STAR:
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, module.builder.fmul(leftval, rightval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      if node.op.token_type == TOK_SLASH:
-        if rightval == 0:
-          compile_error(f'Division by zero.', node.line)
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, module.builder.fdiv(leftval, rightval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      if node.op.token_type == TOK_MOD:
-        if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-          return (TYPE_NUMBER, module.builder.frem(leftval, rightval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      if node.op.token_type == TOK_CARET:
-        # TODO: Implement exponent operator using a sequence of multiplications
-        pass
-
-      if node.op.token_type == TOK_GT:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER):
-          return (TYPE_BOOL, module.builder.fcmp_ordered('>', leftval, rightval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      if node.op.token_type == TOK_GE:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER):
-          return (TYPE_BOOL, module.builder.fcmp_ordered('>=', leftval, rightval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      if node.op.token_type == TOK_LT:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER):
-          return (TYPE_BOOL, module.builder.fcmp_ordered('<', leftval, rightval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      if node.op.token_type == TOK_LE:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER):
-          return (TYPE_BOOL, module.builder.fcmp_ordered('<=', leftval, rightval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      if node.op.token_type == TOK_EQEQ:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER):
-          return (TYPE_BOOL, module.builder.fcmp_ordered('==', leftval, rightval))
-        elif (lefttype == TYPE_BOOL and righttype == TYPE_BOOL):
-          return (TYPE_BOOL, module.builder.icmp_signed('==', leftval, rightval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-      if node.op.token_type == TOK_NE:
-        if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER):
-          return (TYPE_BOOL, module.builder.fcmp_ordered('!=', leftval, rightval))
-        elif (lefttype == TYPE_BOOL and righttype == TYPE_BOOL):
-          return (TYPE_BOOL, module.builder.icmp_signed('!=', leftval, rightval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.', node.op.line)
-
-    if isinstance(node, UnOp):
-      operandtype, operandval = self.generate(node.operand, module)
-      if node.op.token_type == TOK_MINUS:
-        if operandtype == TYPE_NUMBER:
-          return (TYPE_NUMBER, module.builder.fneg(operandval))
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} with {operandtype}.', node.op.line)
-
-      if node.op.token_type == TOK_PLUS:
-        if operandtype == TYPE_NUMBER:
-          return (TYPE_NUMBER, operandval)
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} with {operandtype}.', node.op.line)
-
-      elif node.op.token_type == TOK_NOT:
-        if operandtype == TYPE_BOOL:
-          return (TYPE_BOOL, module.builder.not_(operandval)) # Bitwise complement
-        else:
-          compile_error(f'Unsupported operator {node.op.lexeme!r} with {operandtype}.', node.op.line)
-
-    if isinstance(node, LogicalOp):
-      lefttype, leftval = self.generate(node.left, module)
-      righttype, rightval = self.generate(node.right, module)
-      if node.op.token_type == TOK_OR:
-        return (TYPE_BOOL, module.builder.or_(leftval, rightval))  # Bitwise OR
-      elif node.op.token_type == TOK_AND:
-        return (TYPE_BOOL, module.builder.and_(leftval, rightval)) # Bitwise AND
-
-    if isinstance(node, Stmts):
-      for stmt in node.stmts:
-        self.generate(stmt, module)
-
-    if isinstance(node, PrintStmt):
-      exprtype, exprval = self.generate(node.value, module)
-      if exprtype == TYPE_NUMBER:
-        module.builder.call(module.print_f64, [exprval])  # Call external "print_f64" function declared in a C file
-      if exprtype == TYPE_BOOL:
-        module.builder.call(module.print_i1, [exprval])  # Call external "print_i1" function declared in a C file
-
-    if isinstance(node, IfStmt):
-      testtype, testval = self.generate(node.test, module)
-      if testtype != TYPE_BOOL:
-        compile_error("Condition test is not a boolean expression.", node.line)
-      # Create LLVM blocks/labels for then, else, and exit
-      then_label = module.function.append_basic_block()
-      else_label = module.function.append_basic_block()
-      exit_label = module.function.append_basic_block()
-      # Test
-      module.builder.cbranch(testval, then_label, else_label)
-      # Then
-      module.builder.position_at_end(then_label)
-      self.generate(node.then_stmts, module)
-      module.builder.branch(exit_label)
-      module.builder.position_at_end(else_label)
-      # Else
-      if node.else_stmts:
-        self.generate(node.else_stmts, module)
-      module.builder.branch(exit_label)
-      # Exit
-      module.builder.position_at_end(exit_label)
-
-    elif isinstance(node, WhileStmt):
-      # Create LLVM blocks/labels for test, body, and exit
-      test_label = module.function.append_basic_block()
-      body_label = module.function.append_basic_block()
-      exit_label = module.function.append_basic_block()
-      # Test
-      module.builder.branch(test_label)
-      module.builder.position_at_end(test_label)
-      testtype, testval = self.generate(node.test, module)
-      if testtype != TYPE_BOOL:
-        compile_error("While test is not a boolean expression.", node.line)
-      module.builder.cbranch(testval, body_label, exit_label)
-      module.builder.position_at_end(body_label)
-      # Body
-      self.generate(node.body_stmts, module)
-      module.builder.branch(test_label)
-      # Exit
-      module.builder.position_at_end(exit_label)
-
-    if isinstance(node, FuncDecl):
-      compile_error(f"Function declarations are not implemented in the current LLVM IR generator.", node.line)
-
-    if isinstance(node, FuncCall):
-      compile_error(f"Function calls are not implemented in the current LLVM IR generator.", node.line)
+    return self.methods[type(node)](self, node, module)
+
+  def generate_Integer(self, node, module):
+    return (TYPE_NUMBER, ir.Constant(f64, float(node.value)))
+
+  def generate_Float(self, node, module):
+    return (TYPE_NUMBER, ir.Constant(f64, float(node.value)))
+
+  def generate_Bool(self, node, module):
+    return (TYPE_BOOL, ir.Constant(i1, int(node.value)))
+
+  def generate_String(self, node, module):
+    compile_error(f"Strings are not implemented in our current LLVM IR generator.", node.line)
+
+  def generate_Grouping(self, node, module):
+    return self.generate(node.value, module)
+
+  def generate_Identifier(self, node, module):
+    value = module.get_var(node.name)
+    if value is None:
+      compile_error(f'Undeclared identifier {node.name!r}', node.line)
+    if value[1] is None:
+      compile_error(f'Uninitialized identifier {node.name!r}', node.line)
+    return value
+
+  def generate_Assignment(self, node, module):
+    righttype, rightval = self.generate(node.right, module)
+    module.set_var(node.left.name, righttype, rightval)
+
+  generate_LocalAssignment = generate_Assignment
+
+  def generate_BinOp(self, node, module):
+    lefttype, leftval = self.generate(node.left, module)
+    righttype, rightval = self.generate(node.right, module)
+    return BINOPS[node.op.token_type](node, module, lefttype, leftval, righttype, rightval)
+
+  def generate_UnOp(self, node, module):
+    operandtype, operandval = self.generate(node.operand, module)
+    return UNOPS[node.op.token_type](node, module, operandtype, operandval)
+
+  def generate_LogicalOp(self, node, module):
+    lefttype, leftval = self.generate(node.left, module)
+    righttype, rightval = self.generate(node.right, module)
+    if node.op.token_type == TOK_OR:
+      return (TYPE_BOOL, module.builder.or_(leftval, rightval))  # Bitwise OR
+    elif node.op.token_type == TOK_AND:
+      return (TYPE_BOOL, module.builder.and_(leftval, rightval)) # Bitwise AND
+
+  def generate_Stmts(self, node, module):
+    for stmt in node.stmts:
+      self.generate(stmt, module)
+
+  def generate_PrintStmt(self, node, module):
+    exprtype, exprval = self.generate(node.value, module)
+    if exprtype == TYPE_NUMBER:
+      module.builder.call(module.print_f64, [exprval])  # Call external "print_f64" function declared in a C file
+    if exprtype == TYPE_BOOL:
+      module.builder.call(module.print_i1, [exprval])  # Call external "print_i1" function declared in a C file
+
+  def generate_IfStmt(self, node, module):
+    testtype, testval = self.generate(node.test, module)
+    if testtype != TYPE_BOOL:
+      compile_error("Condition test is not a boolean expression.", node.line)
+    # Create LLVM blocks/labels for then, else, and exit
+    then_label = module.function.append_basic_block()
+    else_label = module.function.append_basic_block()
+    exit_label = module.function.append_basic_block()
+    # Test
+    module.builder.cbranch(testval, then_label, else_label)
+    # Then
+    module.builder.position_at_end(then_label)
+    self.generate(node.then_stmts, module)
+    module.builder.branch(exit_label)
+    module.builder.position_at_end(else_label)
+    # Else
+    if node.else_stmts:
+      self.generate(node.else_stmts, module)
+    module.builder.branch(exit_label)
+    # Exit
+    module.builder.position_at_end(exit_label)
+
+  def generate_WhileStmt(self, node, module):
+    # Create LLVM blocks/labels for test, body, and exit
+    test_label = module.function.append_basic_block()
+    body_label = module.function.append_basic_block()
+    exit_label = module.function.append_basic_block()
+    # Test
+    module.builder.branch(test_label)
+    module.builder.position_at_end(test_label)
+    testtype, testval = self.generate(node.test, module)
+    if testtype != TYPE_BOOL:
+      compile_error("While test is not a boolean expression.", node.line)
+    module.builder.cbranch(testval, body_label, exit_label)
+    module.builder.position_at_end(body_label)
+    # Body
+    self.generate(node.body_stmts, module)
+    module.builder.branch(test_label)
+    # Exit
+    module.builder.position_at_end(exit_label)
+
+  def generate_FuncDecl(self, node, module):
+    compile_error(f"Function declarations are not implemented in the current LLVM IR generator.", node.line)
+
+  def generate_FuncCall(self, node, module):
+    compile_error(f"Function calls are not implemented in the current LLVM IR generator.", node.line)
 
   def generate_main(self, node):
     module = LLVMModule()
@@ -296,6 +293,7 @@ if __name__ == '__main__':
     source = file.read()
     tokens = Lexer(source).tokenize()
     ast = Parser(tokens).parse()
+    ast = Optimizer().optimize(ast)
 
     llvmgen = LLVMGenerator()
     mainll = llvmgen.generate_main(ast)
@@ -0,0 +1,175 @@
+###############################################################################
+# Memoization of pure functions.
+#
+# A call to a function that only computes a value from its arguments can
+# return the value of an earlier call with the same arguments, without
+# running the body again. The purity analysis works on a resolved program
+# (it needs the bindings of the Resolver) and marks a FuncDecl as pure when
+# its body:
+#
+#   - reads and assigns only its own variables (its parameters, and the names
+#     bound in its body or in the blocks inside it), never the ones of the
+#     enclosing blocks, which can change between two calls
+#   - prints nothing
+#   - calls only pure functions, where a single function of that name is
+#     declared in all the scopes the call may find it in (if it is not bound
+#     yet when the call runs, the program stops with an error)
+#
+# The functions that call each other are pure or not together, so they are
+# all assumed pure first and the ones that call an impure one are dropped
+# until nothing changes.
+#
+# The Interpreter keeps the values of the calls to the pure functions in a
+# MemoCache, with the least recently used ones evicted when it is full.
+###############################################################################
+from collections import OrderedDict
+from model import *
+from visitor import *
+
+class MemoCache:
+  '''The values returned by the calls to pure functions: {(FuncDecl, args...): value}, in LRU order'''
+  def __init__(self, size):
+    self.size = size
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, key):
+    '''The value of an earlier call (None if there is none)'''
+    value = self.entries.get(key)
+    if value is None:
+      self.misses += 1
+      return None
+    self.entries.move_to_end(key)
+    self.hits += 1
+    return value
+
+  def put(self, key, value):
+    self.entries[key] = value
+    if len(self.entries) > self.size:
+      self.entries.popitem(last=False)
+      self.evictions += 1
+
+  def print_stats(self):
+    total = self.hits + self.misses
+    print(f'{"memo hits":24} {self.hits:10} {self.hits / total if total else 0:8.2%}')
+    print(f'{"memo misses":24} {self.misses:10}')
+    print(f'{"memo evictions":24} {self.evictions:10}')
+    print(f'{"memo entries":24} {len(self.entries):10} (size {self.size})')
+
+
+class Purity(PendingVisitor):
+  prefix = 'check_'
+
+  def __init__(self, bindings):
+    self.bindings = bindings # the bindings of the Resolver of the program
+
+  def analyze(self, node):
+    '''Mark the pure functions of a resolved program (FuncDecl.pure), and return them'''
+    self.decls = {}      # (scope, name) -> the FuncDecls of that name declared in the scope
+    self.calls = {}      # FuncDecl -> the (scopes, name) of the functions called by its body
+    self.impure = set()
+    self.function = None # the innermost function being checked, and its scopes
+    self.scopes = set()
+    self.scope = None
+    self.run(lambda: self.block(node))
+
+    pure = {decl for decl in self.calls if decl not in self.impure}
+    changed = True
+    while changed:
+      changed = False
+      for decl in list(pure):
+        for scopes, name in self.calls[decl]:
+          callees = [callee for scope in scopes for callee in self.decls.get((scope, name), ())]
+          if len(callees) != 1 or callees[0] not in pure:
+            pure.discard(decl)
+            changed = True
+            break
+    for decl in self.calls:
+      decl.pure = decl in pure
+    return [decl for decl in self.calls if decl.pure]
+
+  def block(self, node):
+    scope = self.scope
+    self.scope = node.scope
+    if self.function is not None:
+      self.scopes.add(node.scope)
+    def restore():
+      self.scope = scope
+    self.then(*node.stmts, restore)
+
+  def access(self, node):
+    '''Check a node that reads or assigns a variable'''
+    if self.function is None:
+      return
+    if node not in self.bindings:
+      self.impure.add(self.function) # not resolved
+      return
+    checked, target = self.bindings[node]
+    if not set(checked).issubset(self.scopes) or (target is not None and target not in self.scopes):
+      self.impure.add(self.function)
+
+  def call(self, node):
+    '''Check a call, once its arguments are checked'''
+    if self.function is None:
+      return
+    if node not in self.bindings:
+      self.impure.add(self.function) # not resolved
+      return
+    checked, target = self.bindings[node]
+    self.calls[self.function].append((checked + (target,), node.name))
+
+  def check_UnOp(self, node):
+    self.then(node.operand)
+
+  def check_BinOp(self, node):
+    self.then(node.left, node.right)
+
+  def check_LogicalOp(self, node):
+    self.then(node.left, node.right)
+
+  def check_Grouping(self, node):
+    self.then(node.value)
+
+  def check_Identifier(self, node):
+    self.access(node)
+
+  def check_Assignment(self, node):
+    self.then(node.right, lambda: self.access(node))
+
+  def check_LocalAssignment(self, node):
+    self.then(node.right, lambda: self.access(node))
+
+  def check_PrintStmt(self, node):
+    if self.function is not None:
+      self.impure.add(self.function)
+    self.then(node.value)
+
+  def check_IfStmt(self, node):
+    else_block = None if node.else_stmts is None else lambda: self.block(node.else_stmts)
+    self.then(node.test, lambda: self.block(node.then_stmts), else_block)
+
+  def check_WhileStmt(self, node):
+    self.then(node.test, lambda: self.block(node.body_stmts))
+
+  def check_ForStmt(self, node):
+    self.then(node.start, node.end, node.step, lambda: self.access(node.ident), lambda: self.block(node.body_stmts))
+
+  def check_FuncDecl(self, node):
+    self.decls.setdefault((self.scope, node.name), []).append(node)
+    self.calls[node] = []
+    function, scopes = self.function, self.scopes
+    self.function, self.scopes = node, set()
+    def restore():
+      self.function, self.scopes = function, scopes
+    self.then(lambda: self.block(node.body_stmts), restore)
+
+  def check_FuncCall(self, node):
+    self.then(*node.args, lambda: self.call(node))
+
+  def check_FuncCallStmt(self, node):
+    self.then(node.expr)
+
+  def check_RetStmt(self, node):
+    self.then(node.value)
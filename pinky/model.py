@@ -4,34 +4,34 @@ class Node:
   '''
   The parent class for every node in the AST
   '''
-  pass
+  __slots__ = ()
 
 class Expr(Node):
   '''
   Expressions evaluate to a result, like x + (3 * y) >= 6
   '''
-  pass
+  __slots__ = ()
 
 
 class Stmt(Node):
   '''
   Statements perform an action
   '''
-  pass
+  __slots__ = ()
 
 
 class Decl(Stmt):
   '''
   Declarations are statements to declare a new name (in our case, functions)
   '''
-  pass
+  __slots__ = ()
 
 class Integer(Expr):
   '''
   Example: 17
   '''
+  __slots__ = ('value', 'line')
   def __init__(self, value, line):
-    assert isinstance(value, int), value
     self.value = value
     self.line = line
   def __repr__(self):
@@ -42,8 +42,8 @@ class Float(Expr):
   '''
   Example: 3.141592
   '''
+  __slots__ = ('value', 'line')
   def __init__(self, value, line):
-    assert isinstance(value, float), value
     self.value = value
     self.line = line
   def __repr__(self):
@@ -54,8 +54,8 @@ class Bool(Expr):
   '''
   Example: true, false
   '''
+  __slots__ = ('value', 'line')
   def __init__(self, value, line):
-    assert isinstance(value, bool), value
     self.value = value
     self.line = line
   def __repr__(self):
@@ -66,8 +66,8 @@ class String(Expr):
   '''
   Example: 'this is a string'
   '''
+  __slots__ = ('value', 'line')
   def __init__(self, value, line):
-    assert isinstance(value, str), value
     self.value = value
     self.line = line
   def __repr__(self):
@@ -78,9 +78,8 @@ class UnOp(Expr):
   '''
   Example: -operand
   '''
+  __slots__ = ('op', 'operand', 'line')
   def __init__(self, op: Token, operand: Expr, line):
-    assert isinstance(op, Token), op
-    assert isinstance(operand, Expr), operand
     self.op = op
     self.operand = operand
     self.line = line
@@ -92,14 +91,13 @@ class BinOp(Expr):
   '''
   Example: x + y
   '''
+  __slots__ = ('op', 'left', 'right', 'line', 'cache')
   def __init__(self, op: Token, left: Expr, right: Expr, line):
-    assert isinstance(op, Token), op
-    assert isinstance(left, Expr), left
-    assert isinstance(right, Expr), right
     self.op = op
     self.left = left
     self.right = right
     self.line = line
+    self.cache = None # inline cache of the Interpreter: (lefttype, righttype, specialized handler)
   def __repr__(self):
     return f'BinOp({self.op.lexeme!r}, {self.left}, {self.right})'
 
@@ -108,10 +106,8 @@ class LogicalOp(Expr):
   '''
   Example: x and y, x or y
   '''
+  __slots__ = ('op', 'left', 'right', 'line')
   def __init__(self, op: Token, left: Expr, right: Expr, line):
-    assert isinstance(op, Token), op
-    assert isinstance(left, Expr), left
-    assert isinstance(right, Expr), right
     self.op = op
     self.left = left
     self.right = right
@@ -124,8 +120,8 @@ class Grouping(Expr):
   '''
   Example: ( <expr> )
   '''
+  __slots__ = ('value', 'line')
   def __init__(self, value, line):
-    assert isinstance(value, Expr), value
     self.value = value
     self.line = line
   def __repr__(self):
@@ -136,10 +132,12 @@ class Identifier(Expr):
   '''
   Example: x, PI, _score, numLives, start_vel
   '''
+  __slots__ = ('name', 'line', 'depth', 'slot')
   def __init__(self, name, line):
-    assert isinstance(name, str), name
     self.name = name
     self.line = line
+    self.depth = None # set by the resolver when the name is statically resolved
+    self.slot = None
   def __repr__(self):
     return f'Identifier[{self.name!r}]'
 
@@ -148,10 +146,11 @@ class Stmts(Node):
   '''
   A list of statements
   '''
+  __slots__ = ('stmts', 'line', 'scope')
   def __init__(self, stmts, line):
-    assert all(isinstance(stmt, Stmt) for stmt in stmts), stmts
     self.stmts = stmts
     self.line = line
+    self.scope = None # set by the resolver
   def __repr__(self):
     return f'Stmts({self.stmts})'
 
@@ -160,8 +159,8 @@ class PrintStmt(Stmt):
   '''
   Example: print value, println value
   '''
+  __slots__ = ('value', 'end', 'line')
   def __init__(self, value, end, line):
-    assert isinstance(value, Expr), value
     self.value = value
     self.end = end
     self.line = line
@@ -173,10 +172,8 @@ class IfStmt(Stmt):
   '''
   "if" <expr> "then" <then_stmts> ("else" <else_stmts>)? "end"
   '''
+  __slots__ = ('test', 'then_stmts', 'else_stmts', 'line')
   def __init__(self, test, then_stmts, else_stmts, line):
-    assert isinstance(test, Expr), test
-    assert isinstance(then_stmts, Stmts), then_stmts
-    assert else_stmts is None or isinstance(else_stmts, Stmts), else_stmts
     self.test = test
     self.then_stmts = then_stmts
     self.else_stmts = else_stmts
@@ -189,9 +186,8 @@ class WhileStmt(Stmt):
   '''
   "while" <expr> "do" <body_stmts> "end"
   '''
+  __slots__ = ('test', 'body_stmts', 'line')
   def __init__(self, test, body_stmts, line):
-    assert isinstance(test, Expr), test
-    assert isinstance(body_stmts, Stmts), body_stmts
     self.test = test
     self.body_stmts = body_stmts
     self.line = line
@@ -203,12 +199,13 @@ class Assignment(Stmt):
   '''
   left := right
   '''
+  __slots__ = ('left', 'right', 'line', 'depth', 'slot')
   def __init__(self, left, right, line):
-    assert isinstance(left, Expr), left
-    assert isinstance(right, Expr), right
     self.left = left
     self.right = right
     self.line = line
+    self.depth = None # set by the resolver when the name is statically resolved
+    self.slot = None
   def __repr__(self):
     return f'Assignment({self.left}, {self.right})'
   
@@ -217,12 +214,13 @@ class LocalAssignment(Stmt):
   '''
   "local" left := right
   '''
+  __slots__ = ('left', 'right', 'line', 'depth', 'slot')
   def __init__(self, left, right, line):
-    assert isinstance(left, Expr), left
-    assert isinstance(right, Expr), right
     self.left = left
     self.right = right
     self.line = line
+    self.depth = None # set by the resolver when the name is statically resolved
+    self.slot = None
   def __repr__(self):
     return f'LocalAssignment({self.left}, {self.right})'
 
@@ -231,12 +229,8 @@ class ForStmt(Stmt):
   '''
   "for" <identifier> ":=" <start> "," <end> ("," <step>)? "do" <body_stmts> "end"
   '''
+  __slots__ = ('ident', 'start', 'end', 'step', 'body_stmts', 'line')
   def __init__(self, ident, start, end, step, body_stmts, line):
-    assert isinstance(ident, Identifier), ident
-    assert isinstance(start, Expr), start
-    assert isinstance(end, Expr), end
-    assert isinstance(step, Expr) or step is None, step
-    assert isinstance(body_stmts, Stmts), body_stmts
     self.ident = ident
     self.start = start
     self.end = end
@@ -251,13 +245,14 @@ class FuncDecl(Decl):
   '''
   "func" <name> "(" <params>? ")" <body_stmts> "end"
   '''
+  __slots__ = ('name', 'params', 'body_stmts', 'line', 'slot', 'pure')
   def __init__(self, name, params, body_stmts, line):
-    assert isinstance(name, str), name
-    assert all(isinstance(param, Param) for param in params), params
     self.name = name
     self.params = params
     self.body_stmts = body_stmts
     self.line = line
+    self.slot = None # set by the resolver
+    self.pure = False # set by the purity analysis
   def __repr__(self):
     return f'FuncDecl({self.name!r}, {self.params}, {self.body_stmts})'
 
@@ -266,10 +261,11 @@ class Param(Decl):
   '''
   A single function parameter
   '''
+  __slots__ = ('name', 'line', 'slot')
   def __init__(self, name, line):
-    assert isinstance(name, str), name
     self.name = name
     self.line = line
+    self.slot = None # set by the resolver
   def __repr__(self):
     return f'Param[{self.name!r}]'
 
@@ -279,10 +275,13 @@ class FuncCall(Expr):
   <func_call>  ::=  <name> "(" <args>? ")"
   <args> ::= <expr> ( ',' <expr> )*
   '''
+  __slots__ = ('name', 'args', 'line', 'depth', 'slot')
   def __init__(self, name, args, line):
     self.name = name
     self.args = args
     self.line = line
+    self.depth = None # set by the resolver when the name is statically resolved
+    self.slot = None
   def __repr__(self):
     return f'FuncCall({self.name!r}, {self.args})'
 
@@ -291,8 +290,8 @@ class FuncCallStmt(Stmt):
   '''
   A special type of statement used to wrap FuncCall expressions
   '''
+  __slots__ = ('expr',)
   def __init__(self, expr):
-    assert isinstance(expr, FuncCall), expr
     self.expr = expr
   def __repr__(self):
     return f'FuncCallStmt({self.expr})'
@@ -302,9 +301,90 @@ class RetStmt(Stmt):
   '''
   "ret" <expr>
   '''
+  __slots__ = ('value', 'line')
   def __init__(self, value, line):
-    assert isinstance(value, Expr), value
     self.value = value
     self.line = line
   def __repr__(self):
     return f'RetStmt[{self.value}]'
+
+
+###############################################################################
+# Debug verification of the AST.
+#
+# The node constructors do not check their arguments, so that building a large
+# tree stays cheap. verify() walks a whole tree and checks the type of every
+# field instead, to be run on demand (e.g. after the parser or the optimizer).
+###############################################################################
+OPTIONAL = type(None)
+
+# The expected types of the fields of each node class. A list means a list of
+# nodes of that type.
+FIELD_TYPES = {
+  Integer: {'value': int},
+  Float: {'value': float},
+  Bool: {'value': bool},
+  String: {'value': str},
+  UnOp: {'op': Token, 'operand': Expr},
+  BinOp: {'op': Token, 'left': Expr, 'right': Expr},
+  LogicalOp: {'op': Token, 'left': Expr, 'right': Expr},
+  Grouping: {'value': Expr},
+  Identifier: {'name': str},
+  Stmts: {'stmts': [Stmt]},
+  PrintStmt: {'value': Expr, 'end': str},
+  IfStmt: {'test': Expr, 'then_stmts': Stmts, 'else_stmts': (Stmts, OPTIONAL)},
+  WhileStmt: {'test': Expr, 'body_stmts': Stmts},
+  Assignment: {'left': Expr, 'right': Expr},
+  LocalAssignment: {'left': Expr, 'right': Expr},
+  ForStmt: {'ident': Identifier, 'start': Expr, 'end': Expr, 'step': (Expr, OPTIONAL), 'body_stmts': Stmts},
+  FuncDecl: {'name': str, 'params': [Param], 'body_stmts': Stmts},
+  Param: {'name': str},
+  FuncCall: {'name': str, 'args': [Expr]},
+  FuncCallStmt: {'expr': FuncCall},
+  RetStmt: {'value': Expr},
+}
+
+# The fields of each node class that hold child nodes (or lists of them), for
+# the passes that visit and rewrite the tree (the optimizer, the flattening of
+# flat.py). The left side of assignments, the for loop variable and the
+# parameters are names, not expressions that can be rewritten, so they are
+# left out.
+NAME_FIELDS = {(Assignment, 'left'), (LocalAssignment, 'left'), (ForStmt, 'ident'), (FuncDecl, 'params')}
+
+def holds_nodes(expected):
+  '''True if a field of the expected type (see FIELD_TYPES) holds nodes'''
+  if isinstance(expected, (list, tuple)):
+    return any(holds_nodes(item) for item in expected)
+  return issubclass(expected, Node)
+
+CHILD_FIELDS = {
+  nodetype: tuple(field for field, expected in fields.items() if holds_nodes(expected) and (nodetype, field) not in NAME_FIELDS)
+  for nodetype, fields in FIELD_TYPES.items()
+}
+
+def walk(node):
+  '''Yield every node of a tree, without recursion (trees can be very deep)'''
+  pending = [node]
+  while pending:
+    node = pending.pop()
+    yield node
+    for field in FIELD_TYPES.get(type(node), ()):
+      child = getattr(node, field, None)
+      if isinstance(child, list):
+        pending.extend(reversed(child))
+      elif isinstance(child, Node):
+        pending.append(child)
+
+def verify(node):
+  '''Check the type of every field of every node in a tree, raising TypeError on the first mismatch'''
+  for node in walk(node):
+    if type(node) not in FIELD_TYPES:
+      raise TypeError(f'unexpected node in the AST: {node!r}')
+    for field, expected in FIELD_TYPES[type(node)].items():
+      value = getattr(node, field, None)
+      if isinstance(expected, list):
+        ok = isinstance(value, list) and all(isinstance(item, expected[0]) for item in value)
+      else:
+        ok = isinstance(value, expected)
+      if not ok:
+        raise TypeError(f'{type(node).__name__}.{field} has an unexpected value: {value!r}')
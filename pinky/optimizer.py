@@ -0,0 +1,285 @@
+###############################################################################
+# AST optimizer.
+#
+# A sequence of passes that rewrite the tree produced by the parser before it
+# goes to any back end (Interpreter, Compiler/VM, LLVMGenerator):
+#
+#  1. Grouping removal: ( expr ) --> expr
+#  2. Constant folding of BinOp, UnOp and LogicalOp with literal operands
+#  3. Algebraic identities (x * 1, x + 0, ...), only when x is a number
+#  4. Dead branch removal of if/while statements with a constant test
+#
+# Every rewrite must behave exactly like the original tree in all back ends,
+# so the passes are conservative:
+#  - Operations that would fail at runtime (type errors, division by zero,
+#    overflow) are never folded, so the error still happens, at runtime.
+#  - 'and'/'or' are only folded when both sides are booleans, since the
+#    interpreter short-circuits and returns operand values, but the VM does not.
+#  - x + 0 --> x is wrong if x is a string ("a" + 0 is "a0"), so identities
+#    only apply when x is statically known to be a number.
+#  - A block is only spliced into the enclosing one if it does not bind any
+#    name (assignment, local, func, for), since blocks are scopes.
+###############################################################################
+from defs import *
+from utils import *
+from model import *
+from tokens import *
+
+LITERAL_NODES = (Integer, Float, String, Bool)
+
+def literal_value(node):
+  '''The tagged runtime value of a literal node'''
+  if isinstance(node, (Integer, Float)):
+    return (TYPE_NUMBER, float(node.value))
+  if isinstance(node, String):
+    return (TYPE_STRING, node.value)
+  return (TYPE_BOOL, node.value)
+
+def literal_node(value, line):
+  '''A literal node for a tagged runtime value'''
+  valtype, val = value
+  if valtype == TYPE_NUMBER:
+    return Float(val, line=line)
+  if valtype == TYPE_STRING:
+    return String(val, line=line)
+  return Bool(val, line=line)
+
+def is_number(node):
+  '''True if node can only evaluate to a number (or fail at runtime)'''
+  if isinstance(node, (Integer, Float)):
+    return True
+  if isinstance(node, BinOp):
+    if node.op.token_type == TOK_PLUS:
+      return is_number(node.left) and is_number(node.right)
+    return node.op.token_type in (TOK_MINUS, TOK_STAR, TOK_SLASH, TOK_MOD, TOK_CARET)
+  if isinstance(node, UnOp):
+    # Unary '+' is not checked by the VM, so it does not guarantee a number
+    return node.op.token_type == TOK_MINUS
+  return False
+
+def binds_names(stmts):
+  '''True if a block declares names in its own scope'''
+  return any(isinstance(stmt, (Assignment, LocalAssignment, FuncDecl, ForStmt)) for stmt in stmts.stmts)
+
+
+class OptimizerPass:
+  '''
+  A bottom-up rewrite of the tree: children are rewritten first, then the node
+  itself with rewrite(), which returns the node to use instead (or the same one).
+  A statement can also be replaced by None (removed) or by a Stmts (spliced).
+  '''
+  name = None
+
+  def __init__(self):
+    self.rewrites = 0
+    self.removed = 0
+
+  def run(self, node):
+    return self.visit(node)
+
+  def visit(self, node):
+    '''
+    Rewrites a tree without recursion (trees can be very deep): a node is
+    pushed again under its children, and rewritten when it comes back, with
+    its rewritten children waiting on a stack of results. The size of each
+    rewritten subtree is kept, so a rewrite counts the nodes it removes
+    without walking them again.
+    '''
+    sizes = {} # rewritten node -> number of nodes of its subtree
+    results = []
+    pending = [(node, False)]
+    while pending:
+      node, children_done = pending.pop()
+      fields = CHILD_FIELDS.get(type(node), ())
+      if not children_done:
+        pending.append((node, True))
+        for field in reversed(fields):
+          child = getattr(node, field)
+          if isinstance(child, list):
+            pending.extend((item, False) for item in reversed(child))
+          elif child is not None:
+            pending.append((child, False))
+        continue
+      # The results of the children are on the stack in order, so the last field comes first
+      size = 1
+      for field in reversed(fields):
+        child = getattr(node, field)
+        if child is None:
+          continue
+        if isinstance(child, list):
+          start = len(results) - len(child)
+          new_children = []
+          for new_item in results[start:]:
+            if isinstance(new_item, Stmts):
+              new_children.extend(new_item.stmts)
+              size += sizes[new_item] - 1
+            elif new_item is not None:
+              new_children.append(new_item)
+              size += sizes[new_item]
+          del results[start:]
+          setattr(node, field, new_children)
+        else:
+          new_child = results.pop()
+          setattr(node, field, new_child)
+          size += self.size(new_child, sizes)
+      new_node = self.rewrite(node)
+      if new_node is not node:
+        new_size = self.size(new_node, sizes)
+        self.rewrites += 1
+        self.removed += size - new_size
+        size = new_size
+      if new_node is not None:
+        sizes[new_node] = size
+      results.append(new_node)
+    return results.pop()
+
+  def size(self, node, sizes):
+    '''The number of nodes of a rewritten node, whose children are all rewritten nodes'''
+    if node is None:
+      return 0
+    if node in sizes:
+      return sizes[node]
+    count = 1
+    for field in CHILD_FIELDS.get(type(node), ()):
+      child = getattr(node, field)
+      for item in child if isinstance(child, list) else (child,):
+        if item is not None:
+          count += sizes[item] if item in sizes else 1 # (the new literals of the rewrites)
+    return count
+
+  def rewrite(self, node):
+    return node
+
+
+class GroupingRemoval(OptimizerPass):
+  name = 'grouping removal'
+
+  def rewrite(self, node):
+    if isinstance(node, Grouping):
+      return node.value
+    return node
+
+
+class ConstantFolding(OptimizerPass):
+  name = 'constant folding'
+
+  def rewrite(self, node):
+    if isinstance(node, BinOp) and isinstance(node.left, LITERAL_NODES) and isinstance(node.right, LITERAL_NODES):
+      value = self.fold_binop(node.op.token_type, literal_value(node.left), literal_value(node.right))
+    elif isinstance(node, UnOp) and isinstance(node.operand, LITERAL_NODES):
+      value = self.fold_unop(node.op.token_type, literal_value(node.operand))
+    elif isinstance(node, LogicalOp) and isinstance(node.left, Bool) and isinstance(node.right, Bool):
+      if node.op.token_type == TOK_AND:
+        value = (TYPE_BOOL, node.left.value and node.right.value)
+      else:
+        value = (TYPE_BOOL, node.left.value or node.right.value)
+    else:
+      return node
+    if value is None:
+      return node
+    return literal_node(value, node.line)
+
+  def fold_binop(self, op, left, right):
+    '''The result of a binary operation, or None if it must be left to the runtime'''
+    (lefttype, leftval), (righttype, rightval) = left, right
+    numbers = lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER
+    strings = lefttype == TYPE_STRING and righttype == TYPE_STRING
+    bools = lefttype == TYPE_BOOL and righttype == TYPE_BOOL
+    if op == TOK_PLUS:
+      if numbers:
+        return (TYPE_NUMBER, leftval + rightval)
+      if lefttype == TYPE_STRING or righttype == TYPE_STRING:
+        return (TYPE_STRING, stringify(leftval) + stringify(rightval))
+    elif op == TOK_MINUS and numbers:
+      return (TYPE_NUMBER, leftval - rightval)
+    elif op == TOK_STAR and numbers:
+      return (TYPE_NUMBER, leftval * rightval)
+    elif op == TOK_SLASH and numbers and rightval != 0:
+      return (TYPE_NUMBER, leftval / rightval)
+    elif op == TOK_MOD and numbers and rightval != 0:
+      return (TYPE_NUMBER, leftval % rightval)
+    elif op == TOK_CARET and numbers:
+      try:
+        result = leftval ** rightval
+      except (OverflowError, ZeroDivisionError):
+        return None
+      if isinstance(result, float): # and not complex
+        return (TYPE_NUMBER, result)
+    elif op in (TOK_LT, TOK_GT, TOK_LE, TOK_GE) and (numbers or strings):
+      return (TYPE_BOOL, {TOK_LT: leftval < rightval, TOK_GT: leftval > rightval, TOK_LE: leftval <= rightval, TOK_GE: leftval >= rightval}[op])
+    elif op == TOK_EQEQ and (numbers or strings or bools):
+      return (TYPE_BOOL, leftval == rightval)
+    elif op == TOK_NE and (numbers or strings or bools):
+      return (TYPE_BOOL, leftval != rightval)
+    return None
+
+  def fold_unop(self, op, operand):
+    '''The result of a unary operation, or None if it must be left to the runtime'''
+    operandtype, operandval = operand
+    if op == TOK_MINUS and operandtype == TYPE_NUMBER:
+      return (TYPE_NUMBER, -operandval)
+    if op == TOK_PLUS and operandtype == TYPE_NUMBER:
+      return (TYPE_NUMBER, operandval)
+    if op == TOK_NOT and operandtype == TYPE_BOOL:
+      return (TYPE_BOOL, not operandval)
+    return None
+
+
+class AlgebraicSimplification(OptimizerPass):
+  name = 'algebraic identities'
+
+  def rewrite(self, node):
+    if not isinstance(node, BinOp):
+      return node
+    op = node.op.token_type
+    left, right = node.left, node.right
+    if self.is_constant(right, 1) and op in (TOK_STAR, TOK_SLASH, TOK_CARET) and is_number(left):
+      return left # x * 1, x / 1, x ^ 1
+    if self.is_constant(right, 0) and op in (TOK_PLUS, TOK_MINUS) and is_number(left):
+      return left # x + 0, x - 0
+    if self.is_constant(left, 1) and op == TOK_STAR and is_number(right):
+      return right # 1 * x
+    if self.is_constant(left, 0) and op == TOK_PLUS and is_number(right):
+      return right # 0 + x
+    return node
+
+  def is_constant(self, node, value):
+    return isinstance(node, (Integer, Float)) and node.value == value
+
+
+class DeadBranchRemoval(OptimizerPass):
+  name = 'dead branch removal'
+
+  def rewrite(self, node):
+    if isinstance(node, WhileStmt) and isinstance(node.test, Bool) and not node.test.value:
+      return None
+    if not (isinstance(node, IfStmt) and isinstance(node.test, Bool)):
+      return node
+    taken = node.then_stmts if node.test.value else node.else_stmts
+    if taken is None:
+      return None
+    if not binds_names(taken):
+      return Stmts(taken.stmts, line=taken.line)
+    if node.test.value and node.else_stmts is None:
+      return node
+    # Keep the scope of the block that runs, but drop the other one
+    return IfStmt(Bool(True, line=node.test.line), taken, None, line=node.line)
+
+
+PASSES = [GroupingRemoval, ConstantFolding, AlgebraicSimplification, DeadBranchRemoval]
+
+class Optimizer:
+  '''
+  Runs all the passes over a tree, and keeps the statistics of each one
+  '''
+  def __init__(self, passes=PASSES):
+    self.passes = [pass_class() for pass_class in passes]
+
+  def optimize(self, node):
+    for optimizer_pass in self.passes:
+      node = optimizer_pass.run(node)
+    return node
+
+  def print_stats(self):
+    for optimizer_pass in self.passes:
+      print(f'{optimizer_pass.name:24} {optimizer_pass.rewrites:6} rewrites {optimizer_pass.removed:6} nodes removed')
@@ -0,0 +1,67 @@
+###############################################################################
+# Buffered output of the Pinky programs.
+#
+# A print statement used to be a print() call, which writes the text and the
+# end of line separately to sys.stdout, through all its layers, every time
+# (and mandel.pinky prints one character at a time). The engines write the
+# text of their print statements to an Output instead, which keeps it until
+# it has a large buffer of it, and writes the whole buffer at once:
+#
+#   - to sys.stdout (the one that is current when the buffer is written, so
+#     contextlib.redirect_stdout() catches it), or to a file
+#   - or to memory, with capture=True, where getvalue() returns all of it
+#
+# The engines flush their output when the program ends. The error functions
+# of utils flush all the outputs before printing the error, so the message
+# comes after what the program printed.
+###############################################################################
+import io
+import sys
+import atexit
+import weakref
+
+BUFFER_SIZE = 1 << 16 # characters
+
+# The outputs that may have text in their buffer
+OUTPUTS = weakref.WeakSet()
+
+class Output:
+  def __init__(self, file=None, size=BUFFER_SIZE, capture=False):
+    self.file = io.StringIO() if capture else file # None for sys.stdout
+    self.size = size
+    self.parts = []
+    self.pending = 0 # characters in the parts
+    OUTPUTS.add(self)
+
+  def write(self, text):
+    self.parts.append(text)
+    self.pending += len(text)
+    if self.pending >= self.size:
+      self.flush()
+
+  def flush(self):
+    if self.parts:
+      text = ''.join(self.parts)
+      self.parts.clear() # (before writing, so a write that fails is not repeated)
+      self.pending = 0
+      file = self.file or sys.stdout
+      file.write(text)
+      file.flush()
+
+  def close(self):
+    '''Flushes the output and closes its file (not sys.stdout)'''
+    self.flush()
+    if self.file:
+      self.file.close()
+
+  def getvalue(self):
+    '''Everything written to a capture output'''
+    self.flush()
+    return self.file.getvalue()
+
+
+def flush_outputs():
+  for output in list(OUTPUTS):
+    output.flush()
+
+atexit.register(flush_outputs)
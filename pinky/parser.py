@@ -15,13 +15,19 @@ class Parser:
   def peek(self):
     return self.tokens[self.curr]
 
+  def peek_type(self):
+    return self.peek().token_type
+
+  def at_end(self):
+    return self.curr >= len(self.tokens)
+
   def is_next(self, expected_type):
-    if self.curr >= len(self.tokens):
+    if self.at_end():
       return False
     return self.peek().token_type == expected_type
 
   def expect(self, expected_type):
-    if self.curr >= len(self.tokens):
+    if self.at_end():
       parse_error(f'Found {self.previous_token().lexeme!r} at the end of parsing', self.previous_token().line)
     elif self.peek().token_type == expected_type:
       token = self.advance()
@@ -33,11 +39,11 @@ class Parser:
     return self.tokens[self.curr - 1]
 
   def match(self, expected_type):
-    if self.curr >= len(self.tokens):
+    if self.at_end():
       return False
     if self.peek().token_type != expected_type:
       return False
-    self.curr = self.curr + 1 # If it is a match, we return True and also comsume that token
+    self.advance() # If it is a match, we return True and also comsume that token
     return True
 
   # <primary>  ::=  <integer>
@@ -56,7 +62,7 @@ class Parser:
     elif self.match(TOK_FALSE):
       return Bool(False, line=self.previous_token().line)
     elif self.match(TOK_STRING):
-      return String(str(self.previous_token().lexeme[1:-1]), line=self.previous_token().line) # Remove the quotes at the beginning and at the end of the lexeme
+      return String(decode_escapes(self.previous_token().lexeme[1:-1]), line=self.previous_token().line) # Remove the quotes at the beginning and at the end of the lexeme
     elif self.match(TOK_LPAREN):
       expr = self.expr()
       if (not self.match(TOK_RPAREN)):
@@ -262,21 +268,22 @@ class Parser:
   def stmt(self):
     # Predictive parsing, where the next token predicts what is the next statement
     # How far do we lookahead? Different algorithms: LL(1), LALR(1), LR(1), LR(2)
-    if self.peek().token_type == TOK_PRINT:
+    token_type = self.peek_type()
+    if token_type == TOK_PRINT:
       return self.print_stmt(end='')
-    if self.peek().token_type == TOK_PRINTLN:
+    if token_type == TOK_PRINTLN:
       return self.print_stmt(end='\n')
-    elif self.peek().token_type == TOK_IF:
+    elif token_type == TOK_IF:
       return self.if_stmt()
-    elif self.peek().token_type == TOK_WHILE:
+    elif token_type == TOK_WHILE:
       return self.while_stmt()
-    elif self.peek().token_type == TOK_FOR:
+    elif token_type == TOK_FOR:
       return self.for_stmt()
-    elif self.peek().token_type == TOK_FUNC:
+    elif token_type == TOK_FUNC:
       return self.func_decl()
-    elif self.peek().token_type == TOK_RET:
+    elif token_type == TOK_RET:
       return self.ret_stmt()
-    elif self.peek().token_type == TOK_LOCAL:
+    elif token_type == TOK_LOCAL:
       return self.local_assign()
     else:
       left = self.expr()
@@ -291,7 +298,7 @@ class Parser:
   def stmts(self):
     stmts = []
     # Loop all statements of the current block (meaning until we find an "end", or "else", or EOF
-    while self.curr < len(self.tokens) and not self.is_next(TOK_ELSE) and not self.is_next(TOK_END):
+    while not self.at_end() and not self.is_next(TOK_ELSE) and not self.is_next(TOK_END):
       stmt = self.stmt()
       stmts.append(stmt)
     return Stmts(stmts, line=self.previous_token().line)
@@ -304,3 +311,331 @@ class Parser:
   def parse(self):
     ast = self.program()
     return ast
+
+
+class StreamingParser(Parser):
+  '''
+  A parser that pulls tokens one at a time from an iterator (e.g. Lexer.iter_tokens)
+  instead of indexing a list. Our grammar only needs one token of lookahead and
+  the previous token, so those are the only two tokens we keep alive.
+  '''
+  def __init__(self, tokens):
+    self.tokens = iter(tokens)
+    self.prev = None
+    self.next = next(self.tokens, None)
+
+  def advance(self):
+    self.prev = self.next
+    self.next = next(self.tokens, None)
+    return self.prev
+
+  def peek(self):
+    return self.next
+
+  def at_end(self):
+    return self.next is None
+
+  def previous_token(self):
+    return self.prev if self.prev is not None else self.next
+
+
+class CompactParser(Parser):
+  '''
+  A parser that reads a CompactTokens stream directly. Token types are checked
+  with integer comparisons against the kinds array, and Token objects are only
+  materialized for the tokens whose lexeme or line the parser actually uses.
+  '''
+  def __init__(self, tokens):
+    self.tokens = tokens
+    self.kinds = tokens.kinds
+    self.curr = 0
+    self.prev_index = None # The grammar asks for the previous token several times in a row,
+    self.prev_token = None # so we keep the last one we materialized
+
+  def previous_token(self):
+    if self.prev_index != self.curr - 1:
+      self.prev_index = self.curr - 1
+      self.prev_token = self.tokens[self.prev_index]
+    return self.prev_token
+
+  def peek_type(self):
+    return self.tokens.token_type(self.curr)
+
+  def at_end(self):
+    return self.curr >= len(self.kinds)
+
+  def is_next(self, expected_type):
+    return self.curr < len(self.kinds) and self.kinds[self.curr] == TOKEN_KINDS[expected_type]
+
+  def expect(self, expected_type):
+    if self.curr >= len(self.kinds):
+      parse_error(f'Found {self.previous_token().lexeme!r} at the end of parsing', self.previous_token().line)
+    elif self.kinds[self.curr] == TOKEN_KINDS[expected_type]:
+      self.curr = self.curr + 1
+      return self.previous_token()
+    else:
+      parse_error(f'Expected {expected_type!r}, found {self.peek().lexeme!r}.', self.peek().line)
+
+  def match(self, expected_type):
+    if self.curr < len(self.kinds) and self.kinds[self.curr] == TOKEN_KINDS[expected_type]:
+      self.curr = self.curr + 1
+      return True
+    return False
+
+
+###############################################################################
+# Pratt (binding power) parsing of expressions.
+#
+# Instead of descending through one method per precedence level for every
+# operand, each binary operator gets a binding power, and expr() keeps folding
+# operators into the left operand while they bind tighter than its caller.
+# The binding powers reproduce the levels of the recursive descent grammar:
+#
+#   or < and < (== ~=) < (> >= < <=) < (+ -) < (* /) < % < unary (~ - +) < ^
+#
+# All binary operators are left-associative, except '^' which is right-associative
+# and, as in the grammar, only takes a primary (and not a unary) on its right.
+###############################################################################
+BINARY_OPS = {
+  TOK_OR:    (1, LogicalOp),
+  TOK_AND:   (2, LogicalOp),
+  TOK_EQEQ:  (3, BinOp),
+  TOK_NE:    (3, BinOp),
+  TOK_GT:    (4, BinOp),
+  TOK_GE:    (4, BinOp),
+  TOK_LT:    (4, BinOp),
+  TOK_LE:    (4, BinOp),
+  TOK_PLUS:  (5, BinOp),
+  TOK_MINUS: (5, BinOp),
+  TOK_STAR:  (6, BinOp),
+  TOK_SLASH: (6, BinOp),
+  TOK_MOD:   (7, BinOp),
+  TOK_CARET: (9, BinOp),
+}
+
+UNARY_OPS = {TOK_NOT, TOK_MINUS, TOK_PLUS}
+
+UNARY_BP    = 8 # The operand of a unary operator only takes '^' operations
+EXPONENT_BP = 8 # Right operand of '^' (one less than '^' itself, to make it right-associative)
+
+class PrattParser(Parser):
+  '''
+  A parser for the full grammar that parses expressions with binding powers
+  (see above) and builds exactly the same nodes as Parser. Statements are
+  still parsed by recursive descent. It only relies on the token access methods,
+  so it can be combined with the streaming and compact token sources too.
+  '''
+  def expr(self, rbp=0):
+    if not self.at_end() and self.peek_type() in UNARY_OPS:
+      self.advance()
+      op = self.previous_token()
+      operand = self.expr(UNARY_BP)
+      left = UnOp(op, operand, line=op.line)
+    else:
+      left = self.primary()
+    return self.infix(left, rbp)
+
+  def infix(self, left, rbp):
+    while not self.at_end():
+      op_type = self.peek_type()
+      if op_type not in BINARY_OPS:
+        break
+      bp, node_class = BINARY_OPS[op_type]
+      if bp <= rbp:
+        break
+      self.advance()
+      op = self.previous_token()
+      if op_type == TOK_CARET:
+        right = self.infix(self.primary(), EXPONENT_BP)
+      else:
+        right = self.expr(bp)
+      left = node_class(op, left, right, line=op.line)
+    return left
+
+
+class StreamingPrattParser(PrattParser, StreamingParser):
+  '''PrattParser over a token iterator'''
+
+class CompactPrattParser(PrattParser, CompactParser):
+  '''PrattParser over a CompactTokens stream'''
+
+
+###############################################################################
+# Parsing with explicit stacks.
+#
+# The recursive descent (and the Pratt) parser nest one Python call per level
+# of parentheses, unary operators, right-associative '^', call arguments and
+# block statements, so deeply nested programs hit the recursion limit.
+# StackParser keeps all of these pending constructs in lists on the heap.
+###############################################################################
+UNARY_FRAME  = 'UNARY_FRAME'  # (UNARY_FRAME, op, rbp)
+BINARY_FRAME = 'BINARY_FRAME' # (BINARY_FRAME, op, left, node_class, rbp)
+GROUP_FRAME  = 'GROUP_FRAME'  # (GROUP_FRAME, rbp)
+CALL_FRAME   = 'CALL_FRAME'   # (CALL_FRAME, identifier, args, rbp)
+
+LITERALS = {TOK_INTEGER, TOK_FLOAT, TOK_TRUE, TOK_FALSE, TOK_STRING}
+
+PRIMARY_BP = 9 # No binary operator binds tighter than this
+
+class StackParser(PrattParser):
+  '''
+  A parser that never recurses: expressions are parsed with the binding powers
+  of PrattParser, but the operators, groupings and calls waiting for an operand
+  are kept in an explicit stack, and so are the open if/while/for/func blocks.
+  The nesting depth of a program is then only limited by memory. It builds the
+  same nodes and reports the same errors as Parser.
+  '''
+  def primary(self):
+    return self.expr(PRIMARY_BP, primary_only=True)
+
+  def expr(self, rbp=0, primary_only=False):
+    stack = []
+    while True:
+      # Parse the beginning of an operand: a unary operator, a '(', a call or a leaf
+      token_type = None if self.at_end() else self.peek_type()
+      if token_type in UNARY_OPS and not primary_only:
+        self.advance()
+        stack.append((UNARY_FRAME, self.previous_token(), rbp))
+        rbp = UNARY_BP
+        continue
+      primary_only = False
+      if token_type == TOK_LPAREN:
+        self.advance()
+        stack.append((GROUP_FRAME, rbp))
+        rbp = 0
+        continue
+      if token_type in LITERALS:
+        left = Parser.primary(self)
+      else:
+        identifier = self.expect(TOK_IDENTIFIER)
+        if not self.match(TOK_LPAREN):
+          left = Identifier(identifier.lexeme, line=self.previous_token().line)
+        elif not self.is_next(TOK_RPAREN):
+          stack.append((CALL_FRAME, identifier, [], rbp))
+          rbp = 0
+          continue
+        else:
+          self.expect(TOK_RPAREN)
+          left = FuncCall(identifier.lexeme, [], line=self.previous_token().line)
+
+      # Fold the operand into the pending frames, until an operator or an argument needs a new operand
+      while True:
+        op_type = None if self.at_end() else self.peek_type()
+        if op_type in BINARY_OPS and BINARY_OPS[op_type][0] > rbp:
+          bp, node_class = BINARY_OPS[op_type]
+          self.advance()
+          stack.append((BINARY_FRAME, self.previous_token(), left, node_class, rbp))
+          if op_type == TOK_CARET:
+            rbp, primary_only = EXPONENT_BP, True
+          else:
+            rbp = bp
+          break
+        if not stack:
+          return left
+        frame = stack.pop()
+        if frame[0] == BINARY_FRAME:
+          _, op, frame_left, node_class, rbp = frame
+          left = node_class(op, frame_left, left, line=op.line)
+        elif frame[0] == UNARY_FRAME:
+          _, op, rbp = frame
+          left = UnOp(op, left, line=op.line)
+        elif frame[0] == GROUP_FRAME:
+          if not self.match(TOK_RPAREN):
+            parse_error(f'Error: ")" expected.', self.previous_token().line)
+          left = Grouping(left, line=self.previous_token().line)
+          rbp = frame[1]
+        else:
+          _, identifier, args, frame_rbp = frame
+          args.append(left)
+          if not self.is_next(TOK_RPAREN):
+            self.expect(TOK_COMMA)
+          if not self.is_next(TOK_RPAREN):
+            stack.append(frame)
+            rbp = 0
+            break
+          self.expect(TOK_RPAREN)
+          left = FuncCall(identifier.lexeme, args, line=self.previous_token().line)
+          rbp = frame_rbp
+
+  def stmts(self):
+    blocks = [] # The open block statements: [token type, statements of the enclosing block, header fields...]
+    stmts = []
+    while True:
+      if not self.at_end() and not self.is_next(TOK_ELSE) and not self.is_next(TOK_END):
+        token_type = self.peek_type()
+        if token_type == TOK_IF:
+          self.expect(TOK_IF)
+          test = self.expr()
+          self.expect(TOK_THEN)
+          blocks.append([TOK_IF, stmts, test, None])
+        elif token_type == TOK_WHILE:
+          self.expect(TOK_WHILE)
+          test = self.expr()
+          self.expect(TOK_DO)
+          blocks.append([TOK_WHILE, stmts, test])
+        elif token_type == TOK_FOR:
+          self.expect(TOK_FOR)
+          identifier = self.primary()
+          self.expect(TOK_ASSIGN)
+          start = self.expr()
+          self.expect(TOK_COMMA)
+          end = self.expr()
+          if self.is_next(TOK_COMMA):
+            self.advance()
+            step = self.expr()
+          else:
+            step = None
+          self.expect(TOK_DO)
+          blocks.append([TOK_FOR, stmts, identifier, start, end, step])
+        elif token_type == TOK_FUNC:
+          self.expect(TOK_FUNC)
+          name = self.expect(TOK_IDENTIFIER)
+          self.expect(TOK_LPAREN)
+          params = self.params()
+          self.expect(TOK_RPAREN)
+          blocks.append([TOK_FUNC, stmts, name, params])
+        else:
+          stmts.append(self.stmt())
+          continue
+        stmts = [] # Start the body of the new block
+        continue
+
+      # The current block is complete
+      block = Stmts(stmts, line=self.previous_token().line)
+      if not blocks:
+        return block
+      frame = blocks[-1]
+      if frame[0] == TOK_IF:
+        _, _, test, then_stmts = frame
+        if then_stmts is None and self.is_next(TOK_ELSE):
+          self.advance() # consume the else
+          frame[3] = block
+          stmts = []
+          continue
+        if then_stmts is None:
+          then_stmts, else_stmts = block, None
+        else:
+          else_stmts = block
+        self.expect(TOK_END)
+        node = IfStmt(test, then_stmts, else_stmts, line=self.previous_token().line)
+      elif frame[0] == TOK_WHILE:
+        self.expect(TOK_END)
+        node = WhileStmt(frame[2], block, line=self.previous_token().line)
+      elif frame[0] == TOK_FOR:
+        _, _, identifier, start, end, step = frame
+        self.expect(TOK_END)
+        node = ForStmt(identifier, start, end, step, block, line=self.previous_token().line)
+      else:
+        _, _, name, params = frame
+        self.expect(TOK_END)
+        node = FuncDecl(name.lexeme, params, block, line=name.line)
+      blocks.pop()
+      stmts = frame[1]
+      stmts.append(node)
+
+
+class StreamingStackParser(StackParser, StreamingParser):
+  '''StackParser over a token iterator'''
+
+class CompactStackParser(StackParser, CompactParser):
+  '''StackParser over a CompactTokens stream'''
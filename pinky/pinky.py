@@ -1,4 +1,8 @@
+import os
 import sys
+import mmap
+import argparse
+import contextlib
 from utils import *
 from tokens import *
 from lexer import *
@@ -6,43 +10,223 @@ from parser import *
 from interpreter import *
 from compiler import *
 from vm import *
+from cache import *
+from optimizer import *
+from flat import *
+from closures import *
+from untagged import *
+from pyast import *
+from resolver import *
+from memo import *
+from profiler import *
+from sampler import *
 
 VERBOSE = True
 
+LEXERS = {
+  'classic': Lexer,
+  'regex': RegexLexer,
+}
+
+# Parser classes for a token list, a token iterator and a CompactTokens stream
+PARSERS = {
+  'recursive': (Parser, StreamingParser, CompactParser),
+  'pratt': (PrattParser, StreamingPrattParser, CompactPrattParser),
+  'stack': (StackParser, StreamingStackParser, CompactStackParser),
+}
+
+# Engines that run the AST directly
+ENGINES = {
+  'tree': Interpreter,
+  'untagged': UntaggedInterpreter,
+  'closures': ClosureInterpreter,
+  'python': PythonCompiler,
+}
+
+COMPILERS = {
+  'recursive': Compiler,
+  'stack': StackCompiler,
+}
+
+# The same compilers, for a FlatAST
+FLAT_COMPILERS = {
+  'recursive': FlatCompiler,
+  'stack': FlatStackCompiler,
+}
+
 if __name__ == '__main__':
-  if len(sys.argv) != 2:
-    raise SystemExit('Usage: python3 pinky.py <filename>')
-  filename = sys.argv[1]
+  argparser = argparse.ArgumentParser(prog='pinky.py', description='Run a Pinky script.')
+  argparser.add_argument('filename')
+  argparser.add_argument('--lexer', choices=LEXERS, default='classic', help='lexing engine (default: classic)')
+  argparser.add_argument('--parser', choices=PARSERS, default='recursive', help='parsing algorithm (default: recursive)')
+  argparser.add_argument('--engine', choices=ENGINES, help='engine that runs the AST (default: tree, none with --parser stack)')
+  argparser.add_argument('--compiler', choices=COMPILERS, help='bytecode compilation algorithm (default: recursive, stack with --parser stack)')
+  argparser.add_argument('--stream', action='store_true', help='read and tokenize the file in chunks while parsing')
+  argparser.add_argument('--compact', action='store_true', help='keep the tokens in a compact array-based stream (regex lexer only)')
+  argparser.add_argument('--mmap', action='store_true', help='lex the memory-mapped file in place into a compact token stream')
+  argparser.add_argument('--no-optimize', action='store_true', help='run the AST as parsed, without the optimizer passes')
+  argparser.add_argument('--no-resolve', action='store_true', help='look all the names up by name at runtime, without resolving their slots statically')
+  argparser.add_argument('--memoize', action='store_true', help='return the value of an earlier call with the same arguments for the calls to pure functions')
+  argparser.add_argument('--memo-size', type=int, default=1024, help='number of calls kept by --memoize, the least recently used ones are evicted (default: 1024)')
+  argparser.add_argument('--profile', action='store_true', help='print the time spent in every line and function of the script')
+  argparser.add_argument('--profile-json', metavar='FILE', help='write the profile of the script to a JSON file')
+  argparser.add_argument('--sample', metavar='FILE', help='sample the Pinky call stacks of the interpreter and the VM, and write them to a file in the collapsed stack format of flamegraph')
+  argparser.add_argument('--sample-rate', type=int, default=1000, metavar='HZ', help='samples per second of CPU time taken by --sample (default: 1000)')
+  argparser.add_argument('--output', metavar='FILE', help='write what the script prints to a file instead of the standard output')
+  argparser.add_argument('--flat', action='store_true', help='run the program from a flat array-backed AST instead of node objects')
+  argparser.add_argument('--verify', action='store_true', help='check the types of all the fields of the AST after parsing and optimizing (debug)')
+  argparser.add_argument('--no-cache', action='store_true', help=f'always lex and parse the script, without reading or writing {CACHE_DIR}')
+  args = argparser.parse_args()
+  # The engines that walk the AST and the recursive compiler recurse on every level of the tree, so the
+  # trees of the stack parser, which can be deeper than the Python stack, only run in the VM
+  deep = args.parser == 'stack'
+  if deep and (args.engine or args.flat or args.memoize or args.profile or args.profile_json):
+    argparser.error('--parser stack runs the script in the VM only, without an engine that walks the AST')
+  if deep and args.compiler == 'recursive':
+    argparser.error('--parser stack can only run with --compiler stack')
+  if args.engine is None and not deep:
+    args.engine = 'tree'
+  if args.compiler is None:
+    args.compiler = 'stack' if deep else 'recursive'
+  if args.flat and args.engine != 'tree':
+    argparser.error('--flat can only run with the tree engine')
+  if args.memoize and (args.flat or args.no_resolve or args.engine not in ('tree', 'untagged')):
+    argparser.error('--memoize can only run with the tree and untagged engines, on a resolved AST')
+  if (args.profile or args.profile_json) and (args.flat or args.engine not in ('tree', 'untagged')):
+    argparser.error('--profile can only run with the tree and untagged engines')
+  if args.sample and args.engine not in ('tree', 'untagged', None):
+    argparser.error('--sample can only run with the tree and untagged engines')
+  if args.sample_rate < 1:
+    argparser.error('--sample-rate must be at least 1')
+  if args.memo_size < 1:
+    argparser.error('--memo-size must be at least 1')
+  filename = args.filename
+  list_parser, streaming_parser, compact_parser = PARSERS[args.parser]
+
+  cache = None if args.no_cache else ParseCache(filename)
+  ast = cache.load() if cache else None
+  cached = ast is not None
+
+  with open(filename, 'rb' if args.mmap else 'r') as file:
+    if cached:
+      # The script did not change since it was parsed: the lexer and the parser are skipped
+      tokens = None
+      source = file.read() if VERBOSE else None
+      if isinstance(source, bytes):
+        source = source.decode('utf-8')
+    elif args.mmap:
+      # Tokens are offsets into the mapped file and lexemes are decoded only when the parser needs them
+      source = None
+      data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size else b''
+      tokens = RegexLexer(data).tokenize_compact()
+      ast = compact_parser(tokens).parse()
+    elif args.stream:
+      # The source and the tokens are never held in memory as a whole
+      source = tokens = None
+      ast = streaming_parser(LEXERS[args.lexer](file).iter_tokens()).parse()
+    elif args.compact:
+      source = file.read()
+      tokens = RegexLexer(source).tokenize_compact()
+      ast = compact_parser(tokens).parse()
+    else:
+      source = file.read()
+      tokens = LEXERS[args.lexer](source).tokenize()
+      ast = list_parser(tokens).parse()
+
+    if args.verify:
+      verify(ast)
+
+    if cache and not cached:
+      cache.store(ast)
+
+    optimizer = None if args.no_optimize else Optimizer()
+    if optimizer:
+      ast = optimizer.optimize(ast)
+      if args.verify:
+        verify(ast)
+
+    if args.flat:
+      ast = FlatAST(ast)
+    elif not (args.no_resolve or deep): # (only the engines that walk the AST use the slots)
+      resolver = Resolver()
+      ast = resolver.resolve(ast)
 
-  with open(filename) as file:
-    source = file.read()
-    tokens = Lexer(source).tokenize()
-    ast = Parser(tokens).parse()
+    memo = MemoCache(args.memo_size) if args.memoize else None
+    pure_functions = Purity(resolver.bindings).analyze(ast) if memo else []
 
     if VERBOSE:
+      if source is not None:
+        print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
+        print(f'{Colors.GREEN}SOURCE:{Colors.WHITE}')
+        print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
+        print(source)
+
+      if tokens is not None:
+        print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
+        print(f'{Colors.GREEN}TOKENS:{Colors.WHITE}')
+        print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
+        for tok in tokens: print(tok)
+
+      print()
       print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
-      print(f'{Colors.GREEN}SOURCE:{Colors.WHITE}')
+      print(f'{Colors.GREEN}AST:{Colors.WHITE}')
       print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
-      print(source)
+      if deep:
+        print('(not printed with --parser stack, as the repr of the nodes is recursive)')
+      else:
+        print_pretty_ast(ast)
+
+      if optimizer:
+        print()
+        print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
+        print(f'{Colors.GREEN}OPTIMIZER:{Colors.WHITE}')
+        print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
+        optimizer.print_stats()
 
+      print()
       print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
-      print(f'{Colors.GREEN}TOKENS:{Colors.WHITE}')
+      print(f'{Colors.GREEN}INTERPRETER:{Colors.WHITE}')
       print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
-      for tok in tokens: print(tok)
+      if deep:
+        print('(not run with --parser stack)')
+
+    # The interpreter and the VM print to the same buffered output
+    output = Output(open(args.output, 'w')) if args.output else None
+    engine_args = {'output': output, 'memo': memo} if memo else {'output': output}
+    interpreter = FlatInterpreter(**engine_args) if args.flat else ENGINES[args.engine](**engine_args) if args.engine else None
+    profiler = Profiler(interpreter, ast) if args.profile or args.profile_json else None
+    sampler = Sampler(args.sample_rate) if args.sample else None
+    try:
+      with sampler.sampling('interpreter', interpreter_stack) if sampler else contextlib.nullcontext():
+        if interpreter:
+          interpreter.interpret_ast(ast)
+    finally:
+      if sampler:
+        sampler.dump(args.sample)
+      # The profile of a script stopped by a runtime error is written too
+      if profiler and args.profile:
+        print()
+        print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
+        print(f'{Colors.GREEN}PROFILE:{Colors.WHITE}')
+        print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
+        profiler.report(source)
+      if profiler and args.profile_json:
+        profiler.dump(args.profile_json)
 
+    if VERBOSE and isinstance(interpreter, Interpreter):
       print()
       print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
-      print(f'{Colors.GREEN}AST:{Colors.WHITE}')
+      print(f'{Colors.GREEN}INLINE CACHES:{Colors.WHITE}')
       print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
-      print_pretty_ast(ast)
+      interpreter.print_cache_stats()
 
+    if VERBOSE and memo:
       print()
       print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
-      print(f'{Colors.GREEN}INTERPRETER:{Colors.WHITE}')
+      print(f'{Colors.GREEN}MEMOIZATION:{Colors.WHITE}')
       print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
-
-    interpreter = Interpreter()
-    interpreter.interpret_ast(ast)
+      print(f'{"pure functions":24} {", ".join(decl.name for decl in pure_functions) or "none"}')
+      memo.print_stats()
 
     if VERBOSE:
       print()
@@ -50,9 +234,16 @@ if __name__ == '__main__':
       print(f'{Colors.GREEN}CODE GENERATION:{Colors.WHITE}')
       print(f'{Colors.GREEN}***************************************{Colors.WHITE}')
 
-    compiler = Compiler()
+    compiler = FLAT_COMPILERS[args.compiler]() if args.flat else COMPILERS[args.compiler]()
     code = compiler.generate_code(ast)
     compiler.print_code()
 
-    vm = VM()
-    vm.run(code)
+    vm = VM(output)
+    try:
+      with sampler.sampling('vm', lambda frame: [frame.name for frame in vm.frames]) if sampler else contextlib.nullcontext():
+        vm.run(code)
+    finally:
+      if sampler:
+        sampler.dump(args.sample)
+      if output:
+        output.close()
@@ -0,0 +1,132 @@
+###############################################################################
+# Deterministic profiler of the Interpreter.
+#
+# The Interpreter dispatches every node through the method table of its
+# class. The profiler gives one interpreter its own table, where the methods
+# of the statements and of the function bodies are wrapped to time them, so
+# an interpreter that is not profiled runs exactly the same code as before.
+#
+# Times are kept per source line (the statements of the line) and per
+# function (its body, for every call, and <main> for the whole program):
+#
+#   - count: the number of times the statements ran, or the function was called
+#   - inclusive: the time spent in them, including the nested statements and
+#     the calls (recursive calls are counted once, in the outermost one)
+#   - exclusive: the same time, without the nested statements (for lines) or
+#     the called functions (for functions)
+#
+# The times include the overhead of the profiler itself, so they are useful
+# to compare lines and functions with each other, not as absolute numbers.
+###############################################################################
+import json
+import time
+from model import *
+
+class Stats:
+  __slots__ = ('count', 'inclusive', 'exclusive', 'active')
+
+  def __init__(self):
+    self.count = 0
+    self.inclusive = 0.0
+    self.exclusive = 0.0
+    self.active = 0 # the number of runs in progress (more than 1 in recursive calls)
+
+  def as_dict(self):
+    return {'count': self.count, 'inclusive': self.inclusive, 'exclusive': self.exclusive}
+
+
+def function_bodies(node, bodies):
+  '''The FuncDecl of every function body of a program: {body_stmts: FuncDecl}'''
+  for node in walk(node):
+    if isinstance(node, FuncDecl):
+      bodies[node.body_stmts] = node
+  return bodies
+
+
+class Profiler:
+  def __init__(self, interpreter, node, clock=time.perf_counter):
+    '''Profile the runs of a program (its root node) by an interpreter'''
+    self.clock = clock
+    self.lines = {}      # line -> Stats
+    self.functions = {}  # (name, line) -> Stats
+    self.line_stack = [] # the time of the nested statements, for every statement that is running
+    self.function_stack = []
+    self.bodies = function_bodies(node, {})
+    self.root = node
+    interpreter.methods = {node_class: self.instrument(node_class, method) for node_class, method in interpreter.methods.items()}
+
+  def instrument(self, node_class, method):
+    if node_class is Stmts:
+      return self.profile_function(method)
+    if node_class is FuncCallStmt:
+      return self.profile_line(method, lambda node: node.expr.line)
+    if issubclass(node_class, Stmt):
+      return self.profile_line(method, lambda node: node.line)
+    return method
+
+  def measure(self, stats, stack, start, method, interpreter, node, env):
+    '''Run a method of the interpreter, adding its time to the stats'''
+    stats.count += 1
+    stats.active += 1
+    stack.append(0.0)
+    try:
+      return method(interpreter, node, env)
+    finally:
+      elapsed = self.clock() - start
+      nested = stack.pop()
+      if stack:
+        stack[-1] += elapsed
+      stats.exclusive += elapsed - nested
+      stats.active -= 1
+      if not stats.active:
+        stats.inclusive += elapsed
+
+  def profile_line(self, method, line_of):
+    def profiled(interpreter, node, env):
+      line = line_of(node)
+      stats = self.lines.get(line)
+      if stats is None:
+        stats = self.lines[line] = Stats()
+      return self.measure(stats, self.line_stack, self.clock(), method, interpreter, node, env)
+    return profiled
+
+  def profile_function(self, method):
+    def profiled(interpreter, node, env):
+      decl = self.bodies.get(node)
+      if decl is not None:
+        key = (decl.name, decl.line)
+      elif node is self.root:
+        key = ('<main>', 0)
+      else:
+        return method(interpreter, node, env) # a block of statements
+      stats = self.functions.get(key)
+      if stats is None:
+        stats = self.functions[key] = Stats()
+      return self.measure(stats, self.function_stack, self.clock(), method, interpreter, node, env)
+    return profiled
+
+  def report(self, source=None, limit=20):
+    '''Print the lines and the functions where the program spent the most time (exclusive)'''
+    total = sum(stats.exclusive for stats in self.lines.values()) or 1
+    source_lines = source.splitlines() if source is not None else []
+    print(f'{"line":>6} {"count":>10} {"inclusive":>12} {"exclusive":>12} {"":>8}  source')
+    for line, stats in sorted(self.lines.items(), key=lambda item: -item[1].exclusive)[:limit]:
+      text = source_lines[line - 1].strip() if 0 < line <= len(source_lines) else ''
+      print(f'{line:6} {stats.count:10} {stats.inclusive*1000:10.2f}ms {stats.exclusive*1000:10.2f}ms {stats.exclusive / total:8.2%}  {text}')
+    print()
+    total = sum(stats.exclusive for stats in self.functions.values()) or 1
+    print(f'{"function":24} {"count":>10} {"inclusive":>12} {"exclusive":>12}')
+    for (name, line), stats in sorted(self.functions.items(), key=lambda item: -item[1].exclusive)[:limit]:
+      name = f'{name} (line {line})' if line else name
+      print(f'{name:24} {stats.count:10} {stats.inclusive*1000:10.2f}ms {stats.exclusive*1000:10.2f}ms {stats.exclusive / total:8.2%}')
+
+  def as_dict(self):
+    '''The profile as JSON data (times in seconds)'''
+    return {
+      'lines': [{'line': line, **stats.as_dict()} for line, stats in sorted(self.lines.items())],
+      'functions': [{'name': name, 'line': line, **stats.as_dict()} for (name, line), stats in self.functions.items()],
+    }
+
+  def dump(self, filename):
+    with open(filename, 'w') as file:
+      json.dump(self.as_dict(), file, indent=2)
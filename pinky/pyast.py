@@ -0,0 +1,492 @@
+###############################################################################
+# Python back end: translates a Pinky program into a Python ast.Module, which
+# is compiled with compile() and run with exec(), so that CPython's own
+# bytecode interpreter runs it.
+#
+# Values are plain Python values (floats, strs and bools, whose Python type
+# tells their Pinky type) instead of (type, value) tuples. Pinky functions
+# become nested Python functions, and loops become native Python loops.
+#
+# Every variable (and function) of every scope gets its own Python local,
+# named after the scope (v_x_3 is the variable x of the scope 3, f_max_0 the
+# function max of the global scope), in the Python function that runs that
+# scope (the function body, or main() for the global scope). The Resolver
+# tells at every use of a name in which of the enclosing scopes it may be
+# bound, and in which one it is certainly bound:
+#
+#   - when only one scope is possible, the name is read and assigned directly
+#   - otherwise the scopes are checked at runtime, innermost first: the slots
+#     of the ones that may not be bound are reset to UNBOUND when the scope
+#     is entered, as a new Environment would start without them
+#
+# The types of the values every variable and every function can hold are
+# inferred, and operations whose operand types are known are translated
+# into the bare Python operations. The other ones test the common case
+# (numbers) inline and fall back to the operator handlers, with the tags of
+# the Python types of their operands.
+#
+# The type of a variable can depend on assignments later in the program
+# (loops, recursive functions), so the program is translated again until
+# what is known about every variable and function stops growing.
+###############################################################################
+import ast
+from defs import *
+from utils import *
+from model import *
+from tokens import *
+from visitor import *
+from interpreter import *
+from resolver import *
+
+# The value of the slots of names that are not bound (yet) in the current scope
+UNBOUND = object()
+
+# The prefix of the Python names of the slots of each namespace of a scope
+PREFIXES = {VARS: 'v', FUNCS: 'f'}
+
+# Inferred types, as a bit set of the Pinky types a value can have
+T_NUMBER = 1
+T_STRING = 2
+T_BOOL = 4
+T_ANY = T_NUMBER | T_STRING | T_BOOL
+TYPE_BITS = (T_NUMBER, T_STRING, T_BOOL)
+
+ARITHMETIC_OPS = {
+  TOK_PLUS: ast.Add,
+  TOK_MINUS: ast.Sub,
+  TOK_STAR: ast.Mult,
+  TOK_SLASH: ast.Div,
+  TOK_MOD: ast.Mod,
+  TOK_CARET: ast.Pow,
+}
+
+COMPARISON_OPS = {
+  TOK_GT: ast.Gt,
+  TOK_GE: ast.GtE,
+  TOK_LT: ast.Lt,
+  TOK_LE: ast.LtE,
+  TOK_EQEQ: ast.Eq,
+  TOK_NE: ast.NotEq,
+}
+
+def only(types, expected):
+  '''True if a value of these types can only be of the expected ones'''
+  return types & ~expected == 0
+
+def binop_types(op, lefttypes, righttypes):
+  '''The types of the results of an operation (as the operator handlers of the Interpreter)'''
+  result = 0
+  for left in TYPE_BITS:
+    for right in TYPE_BITS:
+      if not (left & lefttypes and right & righttypes):
+        continue
+      if op == TOK_PLUS and (left == right == T_NUMBER or T_STRING in (left, right)):
+        result |= T_STRING if T_STRING in (left, right) else T_NUMBER
+      elif op in ARITHMETIC_OPS and left == right == T_NUMBER:
+        result |= T_NUMBER
+      elif op in (TOK_EQEQ, TOK_NE) and left == right:
+        result |= T_BOOL
+      elif op in COMPARISON_OPS and left == right and left != T_BOOL:
+        result |= T_BOOL
+  return result
+
+###############################################################################
+# Runtime support of the generated code
+###############################################################################
+def arity_error(function, name, numargs, line):
+  runtime_error(f'Function {name!r} expected {function.__code__.co_argcount} params but {numargs} args were passed.', line)
+
+###############################################################################
+# Helpers to build Python AST nodes
+###############################################################################
+def load(name):
+  return ast.Name(name, ast.Load())
+
+def store(name):
+  return ast.Name(name, ast.Store())
+
+def constant(value):
+  return ast.Constant(value)
+
+def call(function, *args):
+  return ast.Call(load(function) if isinstance(function, str) else function, list(args), [])
+
+def assign(name, value):
+  return ast.Assign([store(name)], value)
+
+def is_float(value):
+  return ast.Compare(call('type', value), [ast.Is()], [load('float')])
+
+def is_bound(name):
+  return ast.Compare(load(name), [ast.IsNot()], [load('UNBOUND')])
+
+def operation(op, left, right):
+  if op in ARITHMETIC_OPS:
+    return ast.BinOp(left, ARITHMETIC_OPS[op](), right)
+  return ast.Compare(left, [COMPARISON_OPS[op]()], [right])
+
+def literal(node):
+  '''The literal node of an expression that is a literal (maybe in parentheses), or None'''
+  while isinstance(node, Grouping):
+    node = node.value
+  return node if isinstance(node, (Integer, Float, String, Bool)) else None
+
+def has_calls(node):
+  return any(isinstance(child, FuncCall) for child in walk(node))
+
+
+class PyFunction:
+  '''A Python function being generated (a Pinky function or the main program)'''
+  def __init__(self, parent=None):
+    self.parent = parent
+    self.nonlocals = set() # slots of the enclosing functions that it assigns
+    self.returns = 0       # types of the values it returns
+
+
+class PythonCompiler(Visitor):
+  prefix = 'python_'
+
+  def __init__(self, output=None):
+    self.output = output or Output() # where the print statements write
+    self.types = {}   # slot -> types of its values (of the values returned, for a function)
+    self.arities = {} # function slot -> number of params of the functions it may hold
+
+  def accumulate(self, table, key, items):
+    '''Adds what is learned about a slot, remembering if the analysis changed'''
+    if isinstance(items, int):
+      if table.get(key, 0) | items != table.get(key, 0):
+        table[key] = table.get(key, 0) | items
+        self.changed = True
+    elif not table.setdefault(key, set()).issuperset(items):
+      table[key].update(items)
+      self.changed = True
+
+  def temp(self):
+    self.temps += 1
+    return f't{self.temps}'
+
+  def node_ref(self, node):
+    '''An expression of the node object, for the error messages of the operator handlers'''
+    self.nodes.append(node)
+    return ast.Subscript(load('N'), constant(len(self.nodes) - 1), ast.Load())
+
+  def slot(self, scope, namespace, name):
+    '''The Python name of the slot of a name in a scope'''
+    return f'{PREFIXES[namespace]}_{name}_{self.scope_ids[scope]}'
+
+  def check(self, scope, namespace, name):
+    '''The Python name of a slot that is checked at runtime (it must be reset when its scope is entered)'''
+    slot = self.slot(scope, namespace, name)
+    self.inits.setdefault(scope, set()).add(slot)
+    return slot
+
+  def binding_types(self, namespace, name, checked, target):
+    '''The types of the values of the slots where a name was resolved'''
+    types = 0
+    for scope in checked + ((target,) if target else ()):
+      types |= self.types.get(self.slot(scope, namespace, name), 0)
+    return types
+
+  def lookup(self, namespace, name, checked, target, error):
+    '''The expression reading a name from the slots where it was resolved'''
+    expr = load(self.slot(target, namespace, name)) if target else error
+    for scope in reversed(checked):
+      slot = self.check(scope, namespace, name)
+      expr = ast.IfExp(is_bound(slot), load(slot), expr)
+    return expr
+
+  def assignment(self, node, name, value, types):
+    '''The statements assigning a variable, as Environment.set_var'''
+    checked, target = self.bindings[node]
+    for scope in checked + (target,):
+      slot = self.slot(scope, VARS, name)
+      self.accumulate(self.types, slot, types)
+      if self.owners[scope] is not self.function:
+        self.function.nonlocals.add(slot)
+    if not checked:
+      return [assign(self.slot(target, VARS, name), value)]
+    temp = self.temp()
+    stmts = [assign(self.slot(target, VARS, name), load(temp))]
+    for scope in reversed(checked):
+      slot = self.check(scope, VARS, name)
+      stmts = [ast.If(is_bound(slot), [assign(slot, load(temp))], stmts)]
+    return [assign(temp, value)] + stmts
+
+  def unbound(self, scope):
+    '''Statements resetting the slots of a scope that are checked at runtime, when it is entered'''
+    return [assign(slot, load('UNBOUND')) for slot in sorted(self.inits.pop(scope, ()))]
+
+  def enter(self, scope):
+    self.scope_ids[scope] = len(self.scope_ids)
+    self.owners[scope] = self.function
+
+  def block(self, node):
+    '''The statements of a block run in its scope, and the ones to run when the scope is entered'''
+    if node.scope not in self.scope_ids:
+      self.enter(node.scope)
+    self.chain.append(node.scope)
+    body = []
+    for stmt in node.stmts:
+      stmts = self.python(stmt)
+      line = getattr(stmt, 'line', None) or stmt.expr.line
+      for python_stmt in stmts:
+        if not hasattr(python_stmt, 'lineno'):
+          python_stmt.lineno = python_stmt.end_lineno = line
+          python_stmt.col_offset = python_stmt.end_col_offset = 0
+      body.extend(stmts)
+    self.chain.pop()
+    return self.unbound(node.scope), body
+
+  def python(self, node):
+    return self.methods[type(node)](self, node)
+
+  ###############################################################################
+  # Expressions: (Python expression, types of its values, whether it is pure)
+  # A pure expression cannot fail or have side effects, and can be reordered.
+  ###############################################################################
+  def python_Integer(self, node):
+    return constant(float(node.value)), T_NUMBER, True
+
+  def python_Float(self, node):
+    return constant(float(node.value)), T_NUMBER, True
+
+  def python_String(self, node):
+    return constant(str(node.value)), T_STRING, True
+
+  def python_Bool(self, node):
+    return constant(node.value), T_BOOL, True
+
+  def python_Grouping(self, node):
+    return self.python(node.value)
+
+  def python_Identifier(self, node):
+    checked, target = self.bindings[node]
+    types = self.binding_types(VARS, node.name, checked, target)
+    error = call('runtime_error', constant(f'Undeclared identifier {node.name!r}'), constant(node.line))
+    return self.lookup(VARS, node.name, checked, target, error), types, target is not None and not checked
+
+  def python_BinOp(self, node):
+    left, lefttypes, leftpure = self.python(node.left)
+    right, righttypes, rightpure = self.python(node.right)
+    op = node.op.token_type
+    types = binop_types(op, lefttypes, righttypes)
+    numbers = only(lefttypes, T_NUMBER) and only(righttypes, T_NUMBER)
+    nonzero = literal(node.right) is not None and literal(node.right).value != 0
+    if op == TOK_PLUS and (only(lefttypes, T_STRING) or only(righttypes, T_STRING)):
+      # Concatenation (if not both strings, the other operand is stringified)
+      if not only(lefttypes, T_STRING):
+        left = call('stringify', left)
+      if not only(righttypes, T_STRING):
+        right = call('stringify', right)
+      return ast.BinOp(left, ast.Add(), right), T_STRING, False
+    if (op in ARITHMETIC_OPS and numbers and (op != TOK_SLASH or nonzero)) or \
+       (op in (TOK_GT, TOK_GE, TOK_LT, TOK_LE) and (numbers or only(lefttypes | righttypes, T_STRING))) or \
+       (op in (TOK_EQEQ, TOK_NE) and any(only(lefttypes | righttypes, bit) for bit in TYPE_BITS)):
+      return operation(op, left, right), types, False
+    if not (lefttypes & T_NUMBER and righttypes & T_NUMBER):
+      return call('binop', self.node_ref(node), left, right), types, False
+    # Test the numbers inline. Operands that are already known to be numbers are
+    # not tested (the left one only if it does not depend on the right one).
+    checks = []
+    if not (only(lefttypes, T_NUMBER) and leftpure and (literal(node.left) or not has_calls(node.right))):
+      temp = self.temp()
+      checks.append(is_float(ast.NamedExpr(store(temp), left)))
+      left = load(temp)
+    if not (only(righttypes, T_NUMBER) and rightpure):
+      temp = self.temp()
+      checks.append(is_float(ast.NamedExpr(store(temp), right)))
+      right = load(temp)
+    # Both operands are always evaluated (&), so they can be used by the fallback
+    test = checks[0] if checks else None
+    for check in checks[1:]:
+      test = ast.BinOp(test, ast.BitAnd(), check)
+    if op == TOK_SLASH and not nonzero:
+      nonzero_test = ast.Compare(right, [ast.NotEq()], [constant(0)])
+      test = nonzero_test if test is None else ast.BoolOp(ast.And(), [test, nonzero_test])
+    fallback = call('binop', self.node_ref(node), left, right)
+    return ast.IfExp(test, operation(op, left, right), fallback), types, False
+
+  def python_UnOp(self, node):
+    operand, operandtypes, pure = self.python(node.operand)
+    op = node.op.token_type
+    if op == TOK_NOT:
+      types = T_BOOL if operandtypes & T_BOOL else 0
+      if only(operandtypes, T_BOOL):
+        return ast.UnaryOp(ast.Not(), operand), types, False
+    else:
+      types = T_NUMBER if operandtypes & T_NUMBER else 0
+      if only(operandtypes, T_NUMBER):
+        return (ast.UnaryOp(ast.USub(), operand) if op == TOK_MINUS else operand), types, False
+      if op == TOK_MINUS and operandtypes & T_NUMBER:
+        temp = self.temp()
+        fallback = call('unop', self.node_ref(node), load(temp))
+        return ast.IfExp(is_float(ast.NamedExpr(store(temp), operand)), ast.UnaryOp(ast.USub(), load(temp)), fallback), types, False
+    return call('unop', self.node_ref(node), operand), types, False
+
+  def python_LogicalOp(self, node):
+    # The left value if it decides the result (by its Python truthiness, as the Interpreter), the right one otherwise
+    left, lefttypes, leftpure = self.python(node.left)
+    right, righttypes, rightpure = self.python(node.right)
+    op = ast.Or() if node.op.token_type == TOK_OR else ast.And()
+    return ast.BoolOp(op, [left, right]), lefttypes | righttypes, False
+
+  def python_FuncCall(self, node):
+    checked, target = self.bindings[node]
+    error = call('runtime_error', constant(f'Function {node.name!r} not declared.'), constant(node.line))
+    function = self.lookup(FUNCS, node.name, checked, target, error)
+    types, arities = self.binding_types(FUNCS, node.name, checked, target), set()
+    for scope in checked + ((target,) if target else ()):
+      arities |= self.arities.get(self.slot(scope, FUNCS, node.name), {None})
+    if not (checked or target):
+      arities = {len(node.args)} # never called
+    args = [self.python(arg)[0] for arg in node.args]
+    if arities != {len(node.args)}:
+      # The function is looked up before the args are evaluated, and the number of params checked
+      temp = self.temp()
+      test = ast.Compare(ast.Attribute(ast.Attribute(ast.NamedExpr(store(temp), function), '__code__', ast.Load()), 'co_argcount', ast.Load()),
+                         [ast.Eq()], [constant(len(node.args))])
+      function = ast.IfExp(test, load(temp), call('arity_error', load(temp), constant(node.name), constant(len(node.args)), constant(node.line)))
+    return call(function, *args), types, False
+
+  ###############################################################################
+  # Statements: a list of Python statements
+  ###############################################################################
+  def python_Stmts(self, node):
+    inits, body = self.block(node)
+    return inits + body
+
+  def python_PrintStmt(self, node):
+    value, types, pure = self.python(node.value)
+    if not only(types, T_STRING):
+      value = call('stringify', value)
+    if node.end:
+      value = ast.BinOp(value, ast.Add(), constant(node.end))
+    return [ast.Expr(call('write', value))]
+
+  def test(self, node, message, line):
+    '''A test expression, which must be a boolean'''
+    test, types, pure = self.python(node)
+    if only(types, T_BOOL):
+      return test
+    temp = self.temp()
+    error = call('runtime_error', constant(message), constant(line))
+    return ast.IfExp(ast.Compare(call('type', ast.NamedExpr(store(temp), test)), [ast.Is()], [load('bool')]), load(temp), error)
+
+  def python_IfStmt(self, node):
+    test = self.test(node.test, 'Condition test is not a boolean expression.', node.line)
+    # The then-block and the else-block run in a new child scope
+    inits, then_stmts = self.block(node.then_stmts)
+    else_stmts = []
+    if node.else_stmts is not None:
+      else_inits, else_stmts = self.block(node.else_stmts)
+      else_stmts = else_inits + else_stmts or [ast.Pass()]
+    return [ast.If(test, inits + then_stmts or [ast.Pass()], else_stmts)]
+
+  def python_WhileStmt(self, node):
+    test = self.test(node.test, 'While test is not a boolean expression.', node.line)
+    inits, body = self.block(node.body_stmts)
+    return inits + [ast.While(test, body or [ast.Pass()], [])]
+
+  def python_ForStmt(self, node):
+    # The same steps as the Interpreter, with a single loop for both directions
+    start, starttypes, startpure = self.python(node.start)
+    end, endtypes, endpure = self.python(node.end)
+    i, end_temp, up, step_temp = self.temp(), self.temp(), self.temp(), self.temp()
+    stmts = [assign(i, start), assign(end_temp, end), assign(up, ast.Compare(load(i), [ast.Lt()], [load(end_temp)]))]
+    if node.step is None:
+      step, steptypes = ast.IfExp(load(up), constant(1), constant(-1)), T_NUMBER
+    else:
+      step, steptypes, steppure = self.python(node.step)
+    stmts.append(assign(step_temp, step))
+    types = T_NUMBER if only(starttypes | steptypes, T_NUMBER) else T_ANY
+    # The loop variable is assigned in the current scope, and the body runs in a new child scope
+    set_var = self.assignment(node.ident, node.ident.name, load(i), types)
+    inits, body = self.block(node.body_stmts)
+    test = ast.IfExp(load(up), ast.Compare(load(i), [ast.LtE()], [load(end_temp)]), ast.Compare(load(i), [ast.GtE()], [load(end_temp)]))
+    body = set_var + body + [assign(i, ast.BinOp(load(i), ast.Add(), load(step_temp)))]
+    return stmts + inits + [ast.While(test, body, [])]
+
+  def python_Assignment(self, node):
+    value, types, pure = self.python(node.right)
+    return self.assignment(node, node.left.name, value, types)
+
+  def python_LocalAssignment(self, node):
+    value, types, pure = self.python(node.right)
+    slot = self.slot(self.chain[-1], VARS, node.left.name)
+    self.accumulate(self.types, slot, types)
+    return [assign(slot, value)]
+
+  def python_FuncDecl(self, node):
+    slot = self.slot(self.chain[-1], FUNCS, node.name)
+    self.accumulate(self.arities, slot, {len(node.params)})
+    function = self.function
+    self.function = PyFunction(function)
+    scope = node.body_stmts.scope
+    self.enter(scope)
+    params = []
+    for index, param in enumerate(node.params):
+      self.accumulate(self.types, self.slot(scope, VARS, param.name), T_ANY)
+      # As in the Interpreter, the last param of the same name gets the value
+      duplicated = any(other.name == param.name for other in node.params[index + 1:])
+      params.append(ast.arg(self.temp() if duplicated else self.slot(scope, VARS, param.name)))
+    inits, body = self.block(node.body_stmts)
+    stmts = node.body_stmts.stmts
+    if not (stmts and isinstance(stmts[-1], RetStmt)):
+      body.append(ast.Return(constant(0)))
+      self.function.returns |= T_NUMBER
+    self.accumulate(self.types, slot, self.function.returns)
+    if self.function.nonlocals:
+      inits.insert(0, ast.Nonlocal(sorted(self.function.nonlocals)))
+    self.function = function
+    arguments = ast.arguments(posonlyargs=[], args=params, vararg=None, kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[])
+    return [ast.FunctionDef(slot, arguments, inits + body, [], None)]
+
+  def python_FuncCallStmt(self, node):
+    return [ast.Expr(self.python(node.expr)[0])]
+
+  def python_RetStmt(self, node):
+    value, types, pure = self.python(node.value)
+    if self.function.parent is None:
+      return [ast.Raise(call('Return', value), None)] # outside of any function, as the Interpreter
+    self.function.returns |= types
+    return [ast.Return(value)]
+
+  ###############################################################################
+  # Entry points
+  ###############################################################################
+  def translate(self, node):
+    '''One translation of the program, with what is known about it so far'''
+    self.changed = False
+    self.temps = 0
+    self.nodes, self.inits, self.chain, self.scope_ids, self.owners = [], {}, [], {}, {}
+    self.function = PyFunction()
+    inits, body = self.block(node)
+    main = ast.FunctionDef('main', ast.arguments(posonlyargs=[], args=[], vararg=None, kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[]),
+                           inits + body or [ast.Pass()], [], None)
+    return ast.Module([main], [])
+
+  def generate_module(self, node):
+    '''The Python module of a program, which defines main()'''
+    resolver = Resolver()
+    resolver.resolve(node)
+    self.bindings = resolver.bindings
+    module = self.translate(node)
+    while self.changed:
+      module = self.translate(node)
+    return ast.fix_missing_locations(module)
+
+  def compile_ast(self, node):
+    '''The Python code object of the module, and the globals to run it with'''
+    code = compile(self.generate_module(node), '<pinky>', 'exec')
+    namespace = {'UNBOUND': UNBOUND, 'N': self.nodes, 'stringify': stringify, 'runtime_error': runtime_error,
+                 'binop': untagged_binop, 'unop': untagged_unop, 'arity_error': arity_error, 'Return': Return,
+                 'write': self.output.write}
+    return code, namespace
+
+  def interpret_ast(self, node):
+    code, namespace = self.compile_ast(node)
+    exec(code, namespace)
+    try:
+      namespace['main']()
+    finally:
+      self.output.flush()
@@ -0,0 +1,206 @@
+###############################################################################
+# Static scope resolver.
+#
+# Every block of the program (the whole program, the blocks of if, while and
+# for statements and function bodies) runs in its own Environment. Looking a
+# name up walks the chain of parent environments until one has it, and
+# assigning one that is not found anywhere creates it in the current one.
+#
+# The resolver gives every block a Scope, with a slot for every name that
+# can be bound in its environments, so environments are fixed-size lists of
+# values. Then it works out, for every use of a name, in which environments
+# of the chain it may be bound, and in which one it is certainly bound:
+#
+#   - a name bound by the statements before it in the same block, or in an
+#     enclosing block before the statement that contains it, is certainly
+#     bound there (names are never unbound)
+#   - a name bound anywhere in a loop body may already be bound from the
+#     previous iterations
+#   - a function can be called at any later point of the block where it is
+#     declared, so any name of that block may be bound when its body runs
+#
+# When only one environment can have the name, the node is annotated with
+# the depth of that environment (0 for the current one, 1 for its parent...)
+# and the slot of the name. The other uses keep depth None, and the engines
+# look them up by name at runtime, as before.
+#
+# A block that binds no names at all (most if blocks, and many loop bodies)
+# has an elided scope: it runs in the environment of the enclosing block, as
+# a new one would always be empty, and it does not count in the depths.
+#
+# What may be bound in a scope depends on what is resolved later in the
+# program (loops, functions called before the names they use are bound), so
+# the program is resolved again until the scopes stop growing.
+###############################################################################
+from model import *
+from state import *
+from visitor import *
+
+VARS = 'vars'
+FUNCS = 'funcs'
+
+class Frame:
+  '''
+  What is known about the names of a scope at some point of the program: the
+  ones that are certainly bound and the ones that may be (in each namespace)
+  '''
+  def __init__(self, scope, bound=None, maybe=None):
+    self.scope = scope
+    self.bound = bound or {VARS: set(), FUNCS: set()}
+    self.maybe = maybe or {VARS: set(), FUNCS: set()}
+
+
+class Resolver(PendingVisitor):
+  prefix = 'resolve_'
+
+  def __init__(self):
+    # The scopes where a name may be found for every use of it, for the back ends that
+    # check them by themselves: {node: (checked, target)}, where checked are the scopes
+    # where it may or may not be bound (innermost first) and target the one where it is
+    # certainly bound (None if there is none), or where an assignment creates it
+    self.bindings = {}
+
+  def resolve(self, node):
+    '''Resolve a program in place, until what is known about its scopes does not change'''
+    self.changed = True
+    while self.changed:
+      self.changed = False
+      self.chain = []
+      self.run(lambda: self.block(node, loop=False, elidable=False))
+    return node
+
+  def block(self, node, loop, frame=None, elidable=True):
+    '''Resolve the statements of a block in a new scope (or in the frame of a function body)'''
+    if node.scope is None:
+      node.scope = Scope()
+    # Names are bound in a scope only on the passes before the last one, where the sizes are final
+    node.scope.elided = elidable and node.scope.size == 0
+    if frame is None:
+      frame = Frame(node.scope)
+    if loop:
+      # The scope of a loop body is the same on every iteration, and keeps the names of the previous ones
+      frame.maybe[VARS].update(node.scope.vars)
+      frame.maybe[FUNCS].update(node.scope.funcs)
+    self.chain.append(frame)
+    self.then(*node.stmts, self.chain.pop)
+
+  def bind(self, frame, namespace, name, certainly=True):
+    if certainly:
+      frame.bound[namespace].add(name)
+    frame.maybe[namespace].add(name)
+    names = getattr(frame.scope, namespace)
+    if name not in names:
+      frame.scope.add(names, name)
+      self.changed = True
+    return names[name]
+
+  def lookup(self, namespace, name):
+    '''
+    The scopes where a name may be found at runtime, as Environment.lookup:
+    (checked, final, depth), where depth is the one of the final scope
+    '''
+    checked = []
+    depth = 0
+    for frame in reversed(self.chain):
+      if name in frame.bound[namespace]:
+        return checked, frame.scope, depth
+      if name in frame.maybe[namespace]:
+        checked.append(frame.scope)
+      if not frame.scope.elided:
+        depth += 1
+    return checked, None, None
+
+  def annotate(self, node, namespace, name, checked, target, depth):
+    self.bindings[node] = (tuple(checked), target)
+    if checked or target is None:
+      node.depth = node.slot = None
+    else:
+      node.depth, node.slot = depth, getattr(target, namespace)[name]
+
+  def assignment(self, node, name):
+    '''Resolve a node that assigns a variable, as Environment.set_var'''
+    frame = self.chain[-1]
+    checked, final, depth = self.lookup(VARS, name)
+    if checked == [frame.scope] and final is None:
+      checked = [] # updated or created, it is the slot of the current scope either way
+    if final is None:
+      self.bind(frame, VARS, name, certainly=not checked)
+      final, depth = frame.scope, 0
+    self.annotate(node, VARS, name, checked, final, depth)
+
+  def local_assignment(self, node):
+    frame = self.chain[-1]
+    self.bind(frame, VARS, node.left.name)
+    self.annotate(node, VARS, node.left.name, (), frame.scope, 0)
+
+  def resolve_UnOp(self, node):
+    self.then(node.operand)
+
+  def resolve_BinOp(self, node):
+    self.then(node.left, node.right)
+
+  def resolve_LogicalOp(self, node):
+    self.then(node.left, node.right)
+
+  def resolve_Grouping(self, node):
+    self.then(node.value)
+
+  def resolve_Identifier(self, node):
+    checked, final, depth = self.lookup(VARS, node.name)
+    self.annotate(node, VARS, node.name, checked, final, depth)
+
+  def resolve_Assignment(self, node):
+    self.then(node.right, lambda: self.assignment(node, node.left.name))
+
+  def resolve_LocalAssignment(self, node):
+    self.then(node.right, lambda: self.local_assignment(node))
+
+  def resolve_PrintStmt(self, node):
+    self.then(node.value)
+
+  def resolve_IfStmt(self, node):
+    else_block = None if node.else_stmts is None else lambda: self.block(node.else_stmts, loop=False)
+    self.then(node.test, lambda: self.block(node.then_stmts, loop=False), else_block)
+
+  def resolve_WhileStmt(self, node):
+    self.then(node.test, lambda: self.block(node.body_stmts, loop=True))
+
+  def resolve_ForStmt(self, node):
+    self.then(node.start, node.end, node.step, lambda: self.for_body(node))
+
+  def for_body(self, node):
+    # The loop variable is assigned in the current scope, but only if the body runs at least once
+    frame = self.chain[-1]
+    bound = set(frame.bound[VARS])
+    self.assignment(node.ident, node.ident.name)
+    def restore():
+      frame.bound[VARS] = bound
+    self.then(lambda: self.block(node.body_stmts, loop=True), restore)
+
+  def resolve_FuncDecl(self, node):
+    frame = self.chain[-1]
+    node.slot = self.bind(frame, FUNCS, node.name)
+    # The function can be called at any later point of the block, when any of its names may be bound
+    declared = Frame(frame.scope, {namespace: set(names) for namespace, names in frame.bound.items()},
+                     {namespace: names | set(getattr(frame.scope, namespace)) for namespace, names in frame.maybe.items()})
+    chain = self.chain
+    self.chain = chain[:-1] + [declared]
+    if node.body_stmts.scope is None:
+      node.body_stmts.scope = Scope()
+    body_frame = Frame(node.body_stmts.scope)
+    for param in node.params:
+      param.slot = self.bind(body_frame, VARS, param.name)
+    def restore():
+      self.chain = chain
+    self.then(lambda: self.block(node.body_stmts, loop=False, frame=body_frame), restore)
+
+  def resolve_FuncCall(self, node):
+    checked, final, depth = self.lookup(FUNCS, node.name)
+    self.annotate(node, FUNCS, node.name, checked, final, depth)
+    self.then(*node.args)
+
+  def resolve_FuncCallStmt(self, node):
+    self.then(node.expr)
+
+  def resolve_RetStmt(self, node):
+    self.then(node.value)
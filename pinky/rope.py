@@ -0,0 +1,93 @@
+###############################################################################
+# Lazy strings for repeated concatenations.
+#
+# A Python string is immutable, so every + copies both operands, and a loop
+# that appends to a string (s := s + x) copies all of it on every iteration.
+# Concatenating strings in the Interpreter and the VM builds a Rope instead,
+# once the result is long enough for the copies to matter: the list of its
+# pieces, which is joined into a Python string only when the text is needed
+# (to print it, compare it or measure it).
+#
+# Appending to a rope adds the new piece to the same list, and the new rope
+# counts one more piece than the old one. The old one is still the text it
+# was, as it only reads its own count of pieces (appending to it again copies
+# them to a new list):
+#
+#   s := a + b    -->  Rope([a, b], count=2)
+#   t := s + c    -->  Rope([a, b, c], count=3)    (the same list as s)
+#   u := s + d    -->  Rope([a, b, d], count=3)    (a copy of the pieces of s)
+#
+# A Rope compares and hashes as its text, so the operations that do not build
+# strings take it as they take Python strings.
+###############################################################################
+from utils import *
+
+# The length under which a concatenation of Python strings is a Python string
+ROPE_THRESHOLD = 256
+
+class Rope:
+  __slots__ = ('pieces', 'count', 'length', 'text')
+
+  def __init__(self, pieces, count, length):
+    self.pieces = pieces # the list of the pieces (Python strings), shared with the ropes built by appending to this one
+    self.count = count   # the number of pieces of this rope, at the start of the list
+    self.length = length
+    self.text = None     # the joined text, once it was needed
+
+  def append(self, text):
+    '''A new rope with a Python string at the end of this one'''
+    if self.text is not None:
+      pieces = [self.text] # it was already joined
+    elif len(self.pieces) == self.count:
+      pieces = self.pieces
+    else:
+      pieces = self.pieces[:self.count] # another rope was built by appending to this one
+    pieces.append(text)
+    return Rope(pieces, len(pieces), self.length + len(text))
+
+  def __str__(self):
+    if self.text is None:
+      self.text = ''.join(self.pieces[:self.count] if len(self.pieces) != self.count else self.pieces)
+    return self.text
+
+  def __repr__(self):
+    return repr(str(self))
+
+  def __len__(self):
+    return self.length
+
+  def __hash__(self):
+    return hash(str(self))
+
+  def __eq__(self, other):
+    return str(self) == str(other) if isinstance(other, (str, Rope)) else NotImplemented
+
+  def __ne__(self, other):
+    return str(self) != str(other) if isinstance(other, (str, Rope)) else NotImplemented
+
+  def __lt__(self, other):
+    return str(self) < str(other) if isinstance(other, (str, Rope)) else NotImplemented
+
+  def __le__(self, other):
+    return str(self) <= str(other) if isinstance(other, (str, Rope)) else NotImplemented
+
+  def __gt__(self, other):
+    return str(self) > str(other) if isinstance(other, (str, Rope)) else NotImplemented
+
+  def __ge__(self, other):
+    return str(self) >= str(other) if isinstance(other, (str, Rope)) else NotImplemented
+
+
+def concat(left, right):
+  '''The concatenation of two strings (Python strings or Ropes)'''
+  if type(right) is Rope:
+    right = str(right)
+  if type(left) is Rope:
+    return left.append(right)
+  if len(left) + len(right) < ROPE_THRESHOLD:
+    return left + right
+  return Rope([left, right], 2, len(left) + len(right))
+
+def concat_values(left, right):
+  '''The concatenation of two values where at least one is a string, stringifying the other one'''
+  return concat(left if type(left) is Rope else stringify(left), stringify(right))
@@ -0,0 +1,60 @@
+###############################################################################
+# Sampling profiler of the Pinky call stacks.
+#
+# The deterministic Profiler times every statement, which slows the tight
+# loops down more than the rest. The Sampler lets the program run as it is,
+# and a timer (signal.setitimer, on the CPU time of the process) interrupts
+# it at a fixed rate to record the stack of the Pinky functions it is in:
+#
+#   - in the Interpreter, from the Python frames of interpret_FuncCall that
+#     are running, each with the FuncDecl of its call
+#   - in the VM, from its list of call frames
+#
+# The samples are written in the collapsed stack format of the flamegraph
+# tools, one line per stack, outermost function first, and its count:
+#
+#   interpreter;dragon;dragon;cos 12
+###############################################################################
+import signal
+import contextlib
+from collections import Counter
+from interpreter import *
+
+def interpreter_stack(frame):
+  '''The names of the functions of the Interpreter calls that are running in a Python frame and its callers'''
+  names = []
+  while frame is not None:
+    if frame.f_code is Interpreter.interpret_FuncCall.__code__:
+      func_decl = frame.f_locals.get('func_decl')
+      if func_decl is not None: # (not yet when the function itself is being looked up)
+        names.append(func_decl.name)
+    frame = frame.f_back
+  names.reverse()
+  return names
+
+
+class Sampler:
+  def __init__(self, rate=1000):
+    self.interval = 1 / rate # seconds of CPU time between two samples
+    self.samples = Counter() # (root, names...) -> number of samples
+
+  @contextlib.contextmanager
+  def sampling(self, root, stack):
+    '''Sample the stacks returned by stack(frame) while the block runs, under a root name'''
+    def sample(signum, frame):
+      self.samples[(root, *stack(frame))] += 1
+    previous = signal.signal(signal.SIGPROF, sample)
+    signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+    try:
+      yield self
+    finally:
+      signal.setitimer(signal.ITIMER_PROF, 0)
+      signal.signal(signal.SIGPROF, previous)
+
+  def collapsed(self):
+    '''The samples in the collapsed stack format'''
+    return ''.join(f'{";".join(names)} {count}\n' for names, count in sorted(self.samples.items()))
+
+  def dump(self, filename):
+    with open(filename, 'w') as file:
+      file.write(self.collapsed())
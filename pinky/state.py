@@ -1,58 +1,100 @@
+class Scope:
+  '''
+  The names of the variables and functions that can be bound in the environments of a block,
+  and the slots of their values (the resolver computes one for each block of the program)
+  '''
+  __slots__ = ('vars', 'funcs', 'size', 'elided')
+
+  def __init__(self):
+    self.vars = {}  # variable name -> slot
+    self.funcs = {} # function name -> slot
+    self.size = 0
+    self.elided = False # the block binds no names, so it runs in the environment of the enclosing one
+
+  def add(self, names, name):
+    '''The slot of a name in one of the dictionaries, giving it the next one if it has none'''
+    slot = names.get(name)
+    if slot is None:
+      slot = names[name] = self.size
+      self.size += 1
+    return slot
+
+
 class Environment:
-  def __init__(self, parent=None):
-    self.vars = {}       # A dictionary to store variable names and their values
-    self.funcs = {}      # A dictionary to store the functions
+  __slots__ = ('scope', 'values', 'parent')
+
+  def __init__(self, parent=None, scope=None):
+    self.scope = scope # without a resolved scope, names get slots as they are bound (in a scope created by the first one)
+    self.values = [None] * scope.size if scope else [] # The values of the variables and functions (None if not bound)
     self.parent = parent # Parent environemt (optional)
 
-  def get_var(self, name):
+  def ancestor(self, depth):
+    '''The environment depth levels above this one (the resolver computes the depth of every static name)'''
+    while depth:
+      self = self.parent
+      depth -= 1
+    return self
+
+  def lookup(self, names, name):
     '''
-    Search the current environment and all parent environments for a variable name (return None if we dont find any)
+    Search the current environment and all parent environments for a name in one of
+    the dictionaries of the scopes (vars or funcs), returning None if we dont find any
     '''
     while self:
-      value = self.vars.get(name)
-      if value is not None:
-        return value
-      else:
-        self = self.parent # Look in parent environments to see if variable is defined "above"
+      if self.scope is not None:
+        slot = getattr(self.scope, names).get(name)
+        if slot is not None and self.values[slot] is not None:
+          return self.values[slot]
+      self = self.parent # Look in parent environments to see if the name is defined "above"
     return None
 
+  def bind(self, names, name, value):
+    '''Bind a name in this environment, giving it a slot if it is not from a resolved scope'''
+    if self.scope is None:
+      self.scope = Scope()
+    slot = self.scope.add(getattr(self.scope, names), name)
+    if slot == len(self.values):
+      self.values.append(None)
+    self.values[slot] = value
+
+  def get_var(self, name):
+    '''
+    Search the current environment and all parent environments for a variable name (return None if we dont find any)
+    '''
+    return self.lookup('vars', name)
+
   def set_var(self, name, value):
     '''
-    Store a value in the environment (dynamically updating an existing name or creating a new entry in the dictionary)
+    Store a value in the environment (dynamically updating an existing name or creating a new entry)
     '''
     original_env = self
     while self:
-      if name in self.vars:
-        self.vars[name] = value
+      slot = self.scope.vars.get(name) if self.scope is not None else None
+      if slot is not None and self.values[slot] is not None:
+        self.values[slot] = value
         return value
       self = self.parent
     # If we did not find the variable in the environments above, we create it in the original one
-    original_env.vars[name] = value
+    original_env.bind('vars', name, value)
 
   def set_local(self, name, value):
-    self.vars[name] = value
+    self.bind('vars', name, value)
 
   def get_func(self, name):
     '''
     Searches the current environment and all parent environments for a function name (returns None if it does not find any)
     '''
-    while self:
-      value = self.funcs.get(name)
-      if value is not None:
-        return value
-      else:
-        self = self.parent # Look in parent environments to see if the function is defined "above"
-    return None
+    return self.lookup('funcs', name)
 
   def set_func(self, name, value):
     '''
     Declares a function (also stores the environment in which it was declared)
     '''
-    self.funcs[name] = value
+    self.bind('funcs', name, value)
 
-  def new_env(self):
+  def new_env(self, scope=None):
     '''
     Return a new environment that is a child of the current one.
     This is used to create a new nested scope (while, funcs, etc.)
     '''
-    return Environment(parent=self)
+    return Environment(parent=self, scope=scope)
@@ -0,0 +1,58 @@
+###############################################################################
+# Helpers shared by the unit tests (tests-*.py).
+#
+# Most engines are tested the same way: a program must print the same thing
+# (up to the same runtime error) with the engine as with the Interpreter, on
+# a few versions of its AST. A test case with the SameOutput mixin defines
+# outputs(), the pairs of outputs that must be equal for a program, and gets
+# assertSameOutput() and a test of all the scripts.
+###############################################################################
+import io
+import glob
+import contextlib
+from lexer import *
+from parser import *
+from optimizer import *
+from resolver import *
+
+def parse(source):
+  return Parser(Lexer(source).tokenize()).parse()
+
+def optimized(source):
+  return Optimizer().optimize(parse(source))
+
+def resolved(source):
+  return Resolver().resolve(Optimizer().optimize(parse(source)))
+
+def output(run):
+  '''What a function prints, with the message of the runtime error that stops it'''
+  output = io.StringIO()
+  try:
+    with contextlib.redirect_stdout(output):
+      run()
+  except SystemExit:
+    pass
+  return output.getvalue()
+
+def interpreter_output(interpreter, ast):
+  return output(lambda: interpreter.interpret_ast(ast))
+
+
+class SameOutput:
+  '''A mixin of unittest.TestCase (not a test case itself, so it is not run on its own)'''
+  skipped_scripts = ('mandel',) # too slow for a unit test
+  script_options = {}           # the options of assertSameOutput for the scripts
+
+  def outputs(self, source, **options):
+    '''The pairs (output of the engine, expected output) of a program'''
+    raise NotImplementedError
+
+  def assertSameOutput(self, source, **options):
+    for actual, expected in self.outputs(source, **options):
+      self.assertEqual(actual, expected, source)
+
+  def test_scripts(self):
+    for filename in glob.glob('scripts/*.pinky'):
+      if not any(name in filename for name in self.skipped_scripts):
+        with open(filename) as file:
+          self.assertSameOutput(file.read(), **self.script_options)
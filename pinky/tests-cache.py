@@ -0,0 +1,55 @@
+import os
+import unittest
+import tempfile
+from lexer import *
+from parser import *
+from cache import *
+
+class TestParseCache(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.filename = os.path.join(self.directory.name, 'test.pinky')
+    self.write('x := 1 + 2\nprintln x\n')
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def write(self, source):
+    with open(self.filename, 'w') as file:
+      file.write(source)
+    return Parser(Lexer(source).tokenize()).parse()
+
+  def entries(self):
+    return os.listdir(os.path.join(self.directory.name, CACHE_DIR))
+
+  def test_hit(self):
+    self.assertIsNone(ParseCache(self.filename).load())
+    ast = Parser(Lexer('x := 1 + 2\nprintln x\n').tokenize()).parse()
+    ParseCache(self.filename).store(ast)
+    self.assertEqual(repr(ParseCache(self.filename).load()), repr(ast))
+
+  def test_changed_source_replaces_the_entry(self):
+    ParseCache(self.filename).store(self.write('x := 1'))
+    ast = self.write('x := 2')
+    self.assertIsNone(ParseCache(self.filename).load())
+    ParseCache(self.filename).store(ast)
+    self.assertEqual(repr(ParseCache(self.filename).load()), repr(ast))
+    self.assertEqual(len(self.entries()), 1)
+
+  def test_corrupted_entry_is_a_miss(self):
+    cache = ParseCache(self.filename)
+    cache.store(self.write('x := 1'))
+    for data in [b'', b'garbage', open(cache.path, 'rb').read()[:-5]]:
+      with open(cache.path, 'wb') as file:
+        file.write(data)
+      self.assertIsNone(ParseCache(self.filename).load())
+
+  def test_entry_of_another_key_is_a_miss(self):
+    cache = ParseCache(self.filename)
+    cache.store(self.write('x := 1'))
+    other = ParseCache(self.filename)
+    other.key = 'another format version'
+    self.assertIsNone(other.load())
+
+if __name__ == "__main__":
+  unittest.main()
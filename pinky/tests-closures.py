@@ -0,0 +1,64 @@
+import unittest
+from utils import *
+from tokens import *
+from interpreter import *
+from closures import *
+from testing import *
+
+class TestClosureInterpreter(SameOutput, unittest.TestCase):
+  def outputs(self, source):
+    for ast in [parse(source), optimized(source), resolved(source)]:
+      yield interpreter_output(ClosureInterpreter(), ast), interpreter_output(Interpreter(), ast)
+
+  def test_specialized_operations(self):
+    for expression in ['x + 1', '1 + x', 'x / 2', '2 / x', 'x / 0', '-x * -x', '(x + 1) ^ (x - 1)', 'x % 2 == 1',
+                       '1 < x', 's + 1', '1 + s', 's * 2', '2 - s', 's < "t"', 's / 1', '1 / s', '-s', '~b', 'b == true']:
+      for value in ['0', '3', '"str"', 'true']:
+        self.assertSameOutput(f'x := {value}\ns := "s"\nb := false\nprintln {expression}')
+
+  def test_logical_operators(self):
+    self.assertSameOutput('x := 0 println x or "a" println 1 and "b" println false and 1 println 2 or 3')
+
+  def test_scopes_and_functions(self):
+    self.assertSameOutput('''
+      x := 1
+      func f(a)
+        local x := a
+        if a > 0 then
+          x := x + f(a - 1)
+        end
+        ret x
+      end
+      func g() println "g" end
+      println f(4)
+      println g()
+      for i := 1, 3 do y := i println x + y end
+      println y
+      println f(1, 2)
+    ''')
+
+  def test_returns(self):
+    # A ret ends the loops and blocks it is in, and a call without a ret is 0
+    source = '''
+      func f(n)
+        for i := 1, 10 do
+          while true do
+            if i == n then ret i * 10 else i := i + 1 end
+          end
+        end
+      end
+      func g() x := 1 end
+      println f(3)
+      println g()
+      f(2)
+    '''
+    self.assertEqual(interpreter_output(Interpreter(), parse(source)), '30\n0\n')
+    self.assertSameOutput(source)
+    self.assertRaises(Return, ClosureInterpreter().interpret_ast, parse('println 1 ret 2 println 3'))
+
+  def test_runtime_errors(self):
+    for source in ['println z', 'if 1 then println 1 end', 'while "a" do end', 'println h()', 'x := 1 println -"a" + x']:
+      self.assertSameOutput(source)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,81 @@
+import io
+import glob
+import unittest
+import contextlib
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+from compiler import *
+from vm import *
+from optimizer import *
+from flat import *
+
+def parse(source):
+  return Parser(Lexer(source).tokenize()).parse()
+
+def output(func):
+  output = io.StringIO()
+  try:
+    with contextlib.redirect_stdout(output):
+      func()
+  except SystemExit:
+    pass
+  return output.getvalue()
+
+class TestFlatAST(unittest.TestCase):
+  def test_round_trip(self):
+    for filename in glob.glob('scripts/*.pinky'):
+      with open(filename) as file:
+        source = file.read()
+      for ast in [parse(source), Optimizer().optimize(parse(source))]:
+        flat_ast = FlatAST(ast)
+        self.assertEqual(repr(flat_ast.to_model()), repr(ast), filename)
+        verify(flat_ast.to_model())
+
+  def test_literals_are_kept_apart(self):
+    ast = Optimizer().optimize(parse('println 1\nprintln 1.0\nprintln -0.0\nprintln 0.0\nprintln "1"\nx := true'))
+    flat_ast = FlatAST(ast)
+    self.assertEqual(repr(flat_ast.to_model()), repr(ast))
+    self.assertEqual(flat_ast.line(len(flat_ast) - 1), 6)
+
+  def test_same_output_and_code(self):
+    for filename in glob.glob('scripts/*.pinky'):
+      with open(filename) as file:
+        ast = parse(file.read())
+      flat_ast = FlatAST(ast)
+      if 'mandel' not in filename: # too slow for a unit test
+        self.assertEqual(output(lambda: FlatInterpreter().interpret_ast(flat_ast)), output(lambda: Interpreter().interpret_ast(ast)), filename)
+      code = Compiler().generate_code(ast)
+      self.assertEqual(FlatCompiler().generate_code(flat_ast), code, filename)
+      self.assertEqual(FlatStackCompiler().generate_code(flat_ast), code, filename)
+
+  def test_runtime_errors(self):
+    source = 'func f(a, b) ret a / b end\nprintln f(1, 2)\nprintln f(1, 0)'
+    ast = parse(source)
+    expected = output(lambda: Interpreter().interpret_ast(ast))
+    self.assertIn('Division by zero', expected)
+    self.assertEqual(output(lambda: FlatInterpreter().interpret_ast(FlatAST(ast))), expected)
+    for source in ('x := 1\nprintln y', 'x := 1\nprintln x + true', 'println f()'):
+      ast = parse(source)
+      self.assertEqual(output(lambda: FlatInterpreter().interpret_ast(FlatAST(ast))), output(lambda: Interpreter().interpret_ast(ast)), source)
+
+  def test_hot_nodes_are_read_from_the_arrays(self):
+    # Only the nodes without a method of their own are materialized, and the BinOps for their inline caches
+    interpreter = FlatInterpreter()
+    self.assertEqual(output(lambda: interpreter.interpret_ast(FlatAST(parse('i := 0 while i < 100 do i := i + 1 end println i')))), '100\n')
+    materialized = [type(node).__name__ for node in interpreter.nodes.nodes if node is not None]
+    self.assertEqual(sorted(materialized), ['BinOp', 'BinOp', 'PrintStmt', 'WhileStmt'])
+    self.assertEqual((interpreter.cache_hits, interpreter.cache_misses), (199, 2))
+
+  def test_deep_tree(self):
+    depth = 100_000
+    ast = StackParser(Lexer('x := ' + '(' * depth + '1' + ')' * depth + ' println x').tokenize()).parse()
+    flat_ast = FlatAST(ast)
+    self.assertEqual(len(flat_ast), depth + 6)
+    self.assertEqual(output(lambda: VM().run(FlatStackCompiler().generate_code(flat_ast))), '1\n')
+    self.assertIsInstance(flat_ast.to_model(), Stmts)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,71 @@
+import io
+import unittest
+import contextlib
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+
+def parse(source):
+  return Parser(Lexer(source).tokenize()).parse()
+
+def run(source):
+  interpreter, output = Interpreter(), io.StringIO()
+  try:
+    with contextlib.redirect_stdout(output):
+      interpreter.interpret_ast(parse(source))
+  except SystemExit:
+    pass
+  return interpreter, output.getvalue()
+
+class TestInlineCaches(unittest.TestCase):
+  def test_hits_and_misses(self):
+    interpreter, output = run('x := 0 for i := 1, 10 do x := i * 2 + 1 end println x')
+    self.assertEqual(output, '21\n')
+    # The two operations are specialized on their first run, and hit their cache on the 9 other ones
+    self.assertEqual((interpreter.cache_hits, interpreter.cache_misses), (18, 2))
+
+  def test_respecialization(self):
+    # The same node sees numbers, then strings, then numbers again, then types it does not support
+    interpreter, output = run('''
+      func add(a, b) ret a + b end
+      println add(1, 2)
+      println add("a", "b")
+      println add("a", 1)
+      println add(true, "b")
+      println add(3, 4)
+      println add(5, 6)
+      println add(true, 1)
+    ''')
+    self.assertEqual(output.splitlines()[:6], ['3', 'ab', 'a1', 'trueb', '7', '11'])
+    self.assertIn("Unsupported operator '+' between TYPE_BOOL and TYPE_NUMBER", output.splitlines()[6])
+    self.assertEqual((interpreter.cache_hits, interpreter.cache_misses), (1, 6))
+
+  def test_specialized_errors(self):
+    for source, message in [('x := 0 println 1 / x', 'Division by zero'), ('println "a" - "b"', 'Unsupported operator'),
+                            ('println true < false', 'Unsupported operator')]:
+      self.assertIn(message, run(source)[1])
+
+class TestForLoops(unittest.TestCase):
+  def test_loop_values(self):
+    # The end is included, the loop goes down when the start is above the end
+    self.assertEqual(list(loop_values(1.0, 4.0, 1, True)), [1.0, 2.0, 3.0, 4.0])
+    self.assertEqual(list(loop_values(4.0, 1.5, -1, False)), [4.0, 3.0, 2.0])
+    self.assertEqual(list(loop_values(0.0, 10.0, 3.0, True)), [0.0, 3.0, 6.0, 9.0])
+    self.assertEqual(list(loop_values(0.0, 1.0, 0.25, True)), [0.0, 0.25, 0.5, 0.75, 1.0])
+    self.assertEqual(list(loop_values(2.0, 2.0, -1, False)), [2.0])
+    self.assertEqual(list(loop_values(1.0, 0.0, 1, True)), [])
+    self.assertTrue(all(type(value) is float for value in loop_values(1.0, 4.0, 1, True)))
+
+  def test_loop_variable(self):
+    interpreter, output = run('''
+      for i := 1, 3 do i := i * 10 println i end
+      println i
+      for j := 3, 1 do end
+      println j
+    ''')
+    self.assertEqual(output, '10\n20\n30\n30\n1\n')
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,101 @@
+import io
+import time
+import glob
+import unittest
+import contextlib
+from utils import *
+from tokens import *
+from lexer import *
+
+def lex(lexer_class, source):
+  output = io.StringIO()
+  try:
+    with contextlib.redirect_stdout(output):
+      return repr(lexer_class(source).tokenize())
+  except SystemExit:
+    return output.getvalue()
+
+class TestRegexLexer(unittest.TestCase):
+  def test_scripts(self):
+    for filename in glob.glob('scripts/*.*'):
+      with open(filename) as file:
+        source = file.read()
+      self.assertEqual(lex(RegexLexer, source), lex(Lexer, source), filename)
+
+  def test_lines_and_comments(self):
+    source = '''x := 1 -- comment := 2\n\n  \r\n\ty ~= 2.5 <= 'a\nb'\nz'''
+    self.assertEqual(lex(RegexLexer, source), lex(Lexer, source))
+
+  def test_unicode(self):
+    source = '''café := 12² + ٣ * é_1\nprint "ünïcode"'''
+    self.assertEqual(lex(RegexLexer, source), lex(Lexer, source))
+
+  def test_errors(self):
+    for source in ['x := 1\ny := $', 'println "unterminated\n', 'x := \'a']:
+      self.assertEqual(lex(RegexLexer, source), lex(Lexer, source))
+
+def best_time(run):
+  '''The best time of 3 runs of a function, in seconds'''
+  times = []
+  for _ in range(3):
+    start = time.perf_counter()
+    run()
+    times.append(time.perf_counter() - start)
+  return min(times)
+
+class TestCompactTokens(unittest.TestCase):
+  def test_scripts(self):
+    for filename in glob.glob('scripts/*.*'):
+      with open(filename) as file:
+        source = file.read()
+      self.assertEqual(repr(RegexLexer(source).tokenize_compact()), lex(Lexer, source), filename)
+
+  def test_unicode(self):
+    source = '''café := 12² + ٣ * é_1\nprint "ünïcode"'''
+    tokens = RegexLexer(source).tokenize_compact()
+    self.assertEqual(repr(tokens), lex(Lexer, source))
+    self.assertEqual(tokens.lexeme(0), 'café')
+
+  def test_bytes_source(self):
+    sources = ['''café := 12² + ٣ * é_1\nprint "ünïcode"''', 'x := 1\ny := $', 'println "unterminated\n', 'caf\u00e9\nx := 1.5']
+    for filename in glob.glob('scripts/*.*'):
+      with open(filename) as file:
+        sources.append(file.read())
+    for source in sources:
+      expected = lex(Lexer, source)
+      output = io.StringIO()
+      try:
+        with contextlib.redirect_stdout(output):
+          actual = repr(RegexLexer(memoryview(source.encode('utf-8'))).tokenize_compact())
+      except SystemExit:
+        actual = output.getvalue()
+      self.assertEqual(actual, expected, source[:40])
+
+  def test_non_ascii_names_scale(self):
+    # Every name starting with a non-ASCII letter goes through scan_token, and the matching goes on after it:
+    # the regex lexers must stay linear, within a few times the time of the character-by-character Lexer
+    source = ''.join(f'x := "a" + éa{i}\n' for i in range(8000))
+    reference = best_time(lambda: Lexer(source).tokenize())
+    for tokenize in (lambda: RegexLexer(source).tokenize(), lambda: RegexLexer(source).tokenize_compact()):
+      self.assertLess(best_time(tokenize), 5 * reference)
+    self.assertEqual(repr(RegexLexer(source).tokenize_compact()), lex(Lexer, source))
+
+class TestStreamingLexer(unittest.TestCase):
+  def test_chunk_boundaries(self):
+    source = '''x := 12.75 ~= 3 -- comment\ny := "multi\nline" <= 'str'\nprint x\n'''
+    expected = repr(Lexer(source).tokenize())
+    for chunk_size in range(1, len(source) + 1):
+      for lexer_class in (Lexer, RegexLexer):
+        tokens = lexer_class(io.StringIO(source)).iter_tokens(chunk_size)
+        self.assertEqual(repr(list(tokens)), expected, chunk_size)
+
+  def test_long_strings_and_lines_scale(self):
+    # A string open across many chunks is not lexed again on every chunk, and a line longer
+    # than a chunk is not joined again on every chunk: streaming stays within a few times tokenize()
+    for source in ['x := "' + 'abcdefghi\n' * 20000 + '"\nprint x\n', 'x := 1 ' * 30000 + '\n']:
+      reference = best_time(lambda: Lexer(source).tokenize())
+      self.assertLess(best_time(lambda: list(Lexer(io.StringIO(source)).iter_tokens(4096))), 3 * reference)
+      self.assertEqual(repr(list(Lexer(io.StringIO(source)).iter_tokens(4096))), repr(Lexer(source).tokenize()))
+
+if __name__ == "__main__":
+  unittest.main()
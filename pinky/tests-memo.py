@@ -0,0 +1,99 @@
+import unittest
+from utils import *
+from tokens import *
+from interpreter import *
+from untagged import *
+from memo import *
+from testing import *
+
+def analyze(source):
+  '''A resolved program, and the names of its pure functions'''
+  resolver = Resolver()
+  ast = resolver.resolve(parse(source))
+  return ast, [decl.name for decl in Purity(resolver.bindings).analyze(ast)]
+
+class TestMemoization(SameOutput, unittest.TestCase):
+  script_options = {'size': 16}
+
+  def outputs(self, source, size=2):
+    ast, pure = analyze(source)
+    for interpreter_class in (Interpreter, UntaggedInterpreter):
+      yield interpreter_output(interpreter_class(MemoCache(size)), ast), interpreter_output(interpreter_class(), ast)
+
+  def test_purity(self):
+    ast, pure = analyze('''
+      x := 1
+      func square(a) ret a * a end
+      func fib(n)
+        if n < 2 then ret n end
+        ret fib(n - 1) + fib(n - 2)
+      end
+      func even(n) if n == 0 then ret true end ret odd(n - 1) end
+      func odd(n) if n == 0 then ret false end ret even(n - 1) end
+      func sum(n)
+        local total := 0
+        for i := 1, n do total := total + square(i) end
+        ret total
+      end
+      func global() ret x end
+      func setter() x := 2 end
+      func printer(a) println a end
+      func caller(a) ret global() + a end
+      func logger(a) printer(a) ret a end
+      func outer(a)
+        func inner(b) ret a + b end
+        ret inner(1)
+      end
+    ''')
+    self.assertEqual(pure, ['square', 'fib', 'even', 'odd', 'sum'])
+
+  def test_redeclared_functions(self):
+    # f may call either g, so it is not pure, even if both of them are
+    ast, pure = analyze('''
+      func g() ret 1 end
+      func f() ret g() end
+      println f()
+      func g() ret 2 end
+      println f()
+    ''')
+    self.assertEqual(pure, ['g', 'g'])
+    self.assertSameOutput('func g() ret 1 end func f() ret g() end println f() func g() ret 2 end println f()')
+
+  def test_deep_trees(self):
+    source = 'func f(n) ' + 'if true then ' * 20_000 + 'ret ' + '(' * 20_000 + 'n' + ')' * 20_000 + ' end' * 20_000 + ' ret 0 end'
+    resolver = Resolver()
+    ast = resolver.resolve(StackParser(Lexer(source).tokenize()).parse())
+    self.assertEqual([decl.name for decl in Purity(resolver.bindings).analyze(ast)], ['f'])
+
+  def test_stats(self):
+    ast, pure = analyze('''
+      func fib(n)
+        if n < 2 then ret n end
+        ret fib(n - 1) + fib(n - 2)
+      end
+      println fib(30)
+    ''')
+    # Every fib(n) runs once when the cache keeps the last 3 calls, and the calls are evicted as fib(n + 3) runs
+    for size, stats in [(100, (28, 31, 0, 31)), (3, (28, 31, 28, 3)), (2, (8656, 41641, 41639, 2))]:
+      memo = MemoCache(size)
+      self.assertEqual(interpreter_output(Interpreter(memo), ast), '832040\n')
+      self.assertEqual((memo.hits, memo.misses, memo.evictions, len(memo.entries)), stats)
+
+  def test_arguments(self):
+    # The arguments of the same calls are equal values of different types, or zeros of different signs
+    self.assertSameOutput('''
+      func f(a) ret a end
+      func g() end
+      println f(1)
+      println f(true)
+      println f(1 == 1)
+      println f(0)
+      println f(-0)
+      println f(g())
+      println f(0)
+      println f("") + f("0")
+      println f(0 / 0)
+    ''')
+
+if __name__ == "__main__":
+  unittest.main()
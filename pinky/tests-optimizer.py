@@ -0,0 +1,92 @@
+import io
+import glob
+import unittest
+import contextlib
+from utils import *
+from lexer import *
+from parser import *
+from interpreter import *
+from compiler import *
+from vm import *
+from optimizer import *
+
+def parse(source):
+  return Parser(Lexer(source).tokenize()).parse()
+
+def optimize(source):
+  return optimize_tree(parse(source))
+
+def optimize_tree(ast):
+  optimizer = Optimizer()
+  return optimizer.optimize(ast), optimizer
+
+def run(ast):
+  interpreter_output, vm_output = io.StringIO(), io.StringIO()
+  with contextlib.redirect_stdout(interpreter_output):
+    try:
+      Interpreter().interpret_ast(ast)
+    except SystemExit:
+      pass
+  with contextlib.redirect_stdout(vm_output):
+    try:
+      VM().run(Compiler().generate_code(ast))
+    except SystemExit:
+      pass
+  return interpreter_output.getvalue(), vm_output.getvalue()
+
+class TestOptimizer(unittest.TestCase):
+  def assertOptimizesTo(self, source, expected):
+    ast, _ = optimize(source)
+    self.assertEqual(repr(ast), repr(parse(expected)), source)
+
+  def test_constant_folding(self):
+    self.assertOptimizesTo('x := (1 + 2) * 3 - 2 ^ 3 % 5', 'x := 6.0')
+    self.assertOptimizesTo('x := "n=" + (4 / 2) + true', 'x := "n=2true"')
+    self.assertOptimizesTo('x := ~(1 < 2) or "a" == "a"', 'x := true')
+    self.assertEqual(repr(optimize('x := -(3)')[0].stmts[0].right), 'Float[-3.0]')
+
+  def test_errors_are_left_to_the_runtime(self):
+    for source in ['x := 1 / 0', 'x := 1 % 0', 'x := 1 - "a"', 'x := ~1', 'x := 1 < true', 'x := 1 or 2', 'x := 10 ^ 400']:
+      ast, _ = optimize(source)
+      self.assertEqual(repr(ast), repr(parse(source)), source)
+
+  def test_identities_only_for_numbers(self):
+    self.assertOptimizesTo('x := (a * b) * 1 + 0', 'x := a * b')
+    self.assertOptimizesTo('x := 0 + (a - b) ^ 1', 'x := a - b')
+    for source in ['x := a + 0', 'x := a * 1', 'x := 1 * +a', 'x := 0 + f(a)']:
+      ast, _ = optimize(source)
+      self.assertEqual(repr(ast), repr(parse(source)), source)
+
+  def test_dead_branches(self):
+    self.assertOptimizesTo('if 1 < 2 then println 1 else println 2 end', 'println 1')
+    self.assertOptimizesTo('if false then println 1 end while 1 > 2 do println 2 end println 3', 'println 3')
+    # A block with new names is still a scope, so only the branch that does not run is dropped
+    self.assertOptimizesTo('if false then println 1 else z := 2 end', 'if true then z := 2 end')
+
+  def test_stats(self):
+    _, optimizer = optimize('x := ((1 + 2)) if false then println x end')
+    stats = {optimizer_pass.name: (optimizer_pass.rewrites, optimizer_pass.removed) for optimizer_pass in optimizer.passes}
+    self.assertEqual(stats['grouping removal'], (2, 2))
+    self.assertEqual(stats['constant folding'], (1, 2))
+    self.assertEqual(stats['dead branch removal'], (1, 5))
+
+  def test_deep_trees(self):
+    # The passes do not recurse, so they take trees deeper than the Python stack
+    source = 'x := ' + '-(' * 5000 + '2 * 1' + ')' * 5000 + ' if x == 2 then y := x end'
+    ast, optimizer = optimize_tree(StackParser(Lexer(source).tokenize()).parse())
+    self.assertEqual(repr(ast.stmts[0]), "Assignment(Identifier['x'], Float[2.0])")
+    stats = {optimizer_pass.name: (optimizer_pass.rewrites, optimizer_pass.removed) for optimizer_pass in optimizer.passes}
+    self.assertEqual(stats['grouping removal'], (5000, 5000))
+    self.assertEqual(stats['constant folding'], (5001, 5002))
+
+  def test_same_output(self):
+    sources = ['if true then z := 1 end println z', 'x := 1 println "a" + x * 1 + 0 println (x - 1) * 1']
+    for filename in glob.glob('scripts/*.pinky'):
+      if 'mandel' not in filename: # too slow for a unit test
+        with open(filename) as file:
+          sources.append(file.read())
+    for source in sources:
+      self.assertEqual(run(optimize(source)[0]), run(parse(source)), source[:40])
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,76 @@
+import io
+import unittest
+import contextlib
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+from resolver import *
+from untagged import *
+from closures import *
+from pyast import *
+from compiler import *
+from vm import *
+
+def parse(source):
+  return Parser(Lexer(source).tokenize()).parse()
+
+SOURCE = '''
+i := 0
+while i < 3 do
+  print "x" + i
+  println i
+  i := i + 1
+end
+'''
+
+class TestOutput(unittest.TestCase):
+  def test_buffer(self):
+    file = io.StringIO()
+    output = Output(file, size=4)
+    output.write('ab')
+    output.write('c')
+    self.assertEqual(file.getvalue(), '')
+    output.write('d') # the buffer is full
+    self.assertEqual(file.getvalue(), 'abcd')
+    output.write('e')
+    output.flush()
+    self.assertEqual(file.getvalue(), 'abcde')
+
+  def test_standard_output(self):
+    # The output is written to the sys.stdout of the time it is flushed
+    output = Output()
+    output.write('text')
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+      output.flush()
+    self.assertEqual(stdout.getvalue(), 'text')
+
+  def test_engines(self):
+    ast = Resolver().resolve(parse(SOURCE))
+    runs = [
+      lambda output: Interpreter(output=output).interpret_ast(ast),
+      lambda output: UntaggedInterpreter(output=output).interpret_ast(ast),
+      lambda output: ClosureInterpreter(output).interpret_ast(ast),
+      lambda output: PythonCompiler(output).interpret_ast(ast),
+      lambda output: VM(output).run(Compiler().generate_code(parse(SOURCE))),
+    ]
+    for run in runs:
+      output = Output(capture=True)
+      stdout = io.StringIO()
+      with contextlib.redirect_stdout(stdout):
+        run(output)
+      self.assertEqual((output.getvalue(), stdout.getvalue()), ('x00\nx11\nx22\n', ''))
+
+  def test_errors(self):
+    # What the program printed is flushed before the error message
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+      with self.assertRaises(SystemExit):
+        Interpreter().interpret_ast(parse('println "before" println 1 / 0'))
+    self.assertTrue(stdout.getvalue().startswith('before\n'), stdout.getvalue())
+    self.assertIn('Division by zero', stdout.getvalue())
+
+if __name__ == "__main__":
+  unittest.main()
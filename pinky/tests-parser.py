@@ -0,0 +1,143 @@
+import io
+import os
+import sys
+import glob
+import tempfile
+import subprocess
+import unittest
+import contextlib
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from model import *
+from interpreter import *
+from compiler import *
+from vm import *
+
+def parse(source):
+  return Parser(Lexer(source).tokenize()).parse()
+
+def run(source):
+  interpreter_output, vm_output = io.StringIO(), io.StringIO()
+  ast = parse(source)
+  with contextlib.redirect_stdout(interpreter_output):
+    Interpreter().interpret_ast(ast)
+  with contextlib.redirect_stdout(vm_output):
+    VM().run(Compiler().generate_code(ast))
+  return interpreter_output.getvalue(), vm_output.getvalue()
+
+class TestStringLiterals(unittest.TestCase):
+  def test_escapes_are_decoded_by_the_parser(self):
+    ast = parse(r'''print "a\tb\n \\ é"''')
+    self.assertEqual(ast.stmts[0].value.value, 'a\tb\n \\ é')
+
+  def test_invalid_escapes_are_kept(self):
+    ast = parse('print "trailing \\"')
+    self.assertEqual(ast.stmts[0].value.value, 'trailing \\')
+
+  def test_comparisons(self):
+    # The decoded text is compared (a tab is before "0", a backslash would be after it)
+    for output in run(r'''println "\t" < "0" println "\t" == "	" println "a\n" > "a\\"'''):
+      self.assertEqual(output, 'true\ntrue\nfalse\n')
+
+  def test_print(self):
+    for output in run(r'''println "x\ty" print 'é\n' println 1.0 println 2 > 1'''):
+      self.assertEqual(output, 'x\ty\né\n1\ntrue\n')
+
+class TestPrattParser(unittest.TestCase):
+  def assertSameTree(self, source, parser_class=PrattParser):
+    expected = repr(Parser(Lexer(source).tokenize()).parse())
+    self.assertEqual(repr(parser_class(Lexer(source).tokenize()).parse()), expected, source)
+
+  def test_scripts(self):
+    for filename in glob.glob('scripts/*.pinky'):
+      with open(filename) as file:
+        self.assertSameTree(file.read())
+
+  def test_precedence_and_associativity(self):
+    for expression in ['a or b and c == d < e + f * g % -h ^ i ^ j', 'a - b - c / d / e % f % g',
+                       '- a ^ b', '~ ~ x == y', 'a ^ (- b) * + c', 'f(a + 1, g(b) ^ 2) <= (a or b)']:
+      self.assertSameTree(f'x := {expression}')
+
+  def test_token_sources(self):
+    source = 'x := -a ^ 2 + f(b % 3, c) * 4 ~= 5 and d\nprintln x >= 1 or ~y'
+    expected = repr(Parser(Lexer(source).tokenize()).parse())
+    self.assertEqual(repr(CompactPrattParser(RegexLexer(source).tokenize_compact()).parse()), expected)
+    self.assertEqual(repr(StreamingPrattParser(Lexer(io.StringIO(source)).iter_tokens()).parse()), expected)
+
+class TestVerify(unittest.TestCase):
+  def test_scripts(self):
+    for filename in glob.glob('scripts/*.pinky'):
+      with open(filename) as file:
+        source = file.read()
+      for parser_class in (Parser, PrattParser, StackParser):
+        verify(parser_class(Lexer(source).tokenize()).parse())
+
+  def test_invalid_trees(self):
+    line = 1
+    plus = Token(TOK_PLUS, '+', line)
+    for ast in [Stmts([Integer(1, line)], line),
+                Stmts([PrintStmt(BinOp(plus, Integer(1, line), None, line), '', line)], line),
+                Stmts([IfStmt(Bool(True, line), Stmts([], line), [], line)], line),
+                Stmts([FuncCallStmt(FuncCall('f', [Integer(1, line), Stmts([], line)], line))], line)]:
+      with self.assertRaises(TypeError):
+        verify(ast)
+
+  def test_deep_tree(self):
+    for source, _ in nested_programs(10_000):
+      verify(StackParser(Lexer(source).tokenize()).parse())
+
+  def test_nodes_have_no_dict(self):
+    for node in walk(parse('func f(a) ret -a end for i := 1, 2 do println f(i) + 1 end')):
+      self.assertFalse(hasattr(node, '__dict__'), node)
+
+def nested_programs(depth):
+  '''Programs that nest depth levels of each construct, with their expected output'''
+  else_ifs = ''.join(f'if x == {i} then println {i} else ' for i in range(depth)) + 'println -1' + ' end' * depth
+  return [
+    ('x := ' + '(' * depth + '1' + ')' * depth + ' println x', '1\n'),
+    ('x := ' + '- ' * depth + '1 println x', '1\n' if depth % 2 == 0 else '-1\n'),
+    ('x := ' + '~ ' * depth + 'true println x', 'true\n' if depth % 2 == 0 else 'false\n'),
+    ('x := ' + '1 ^ ' * depth + '2 println x', '1\n'),
+    ('x := 1' + ' + 1' * depth + ' println x', f'{depth + 1}\n'),
+    ('func f(a) ret a + 1 end x := ' + 'f(' * depth + '0' + ')' * depth + ' println x', f'{depth}\n'),
+    ('if true then ' * depth + 'println 1' + ' end' * depth, '1\n'),
+    ('while false do ' * depth + 'println 1' + ' end' * depth + ' println 2', '2\n'),
+    (f'x := {depth - 1} ' + else_ifs, f'{depth - 1}\n'),
+  ]
+
+class TestDeepNesting(unittest.TestCase):
+  def compile_and_run(self, source, parser_class):
+    ast = parser_class(Lexer(source).tokenize()).parse()
+    code = StackCompiler().generate_code(ast)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+      VM().run(code)
+    return output.getvalue()
+
+  def test_same_code_as_recursive_front_end(self):
+    for source, expected in nested_programs(50):
+      ast = StackParser(Lexer(source).tokenize()).parse()
+      self.assertEqual(repr(ast), repr(Parser(Lexer(source).tokenize()).parse()))
+      self.assertEqual(StackCompiler().generate_code(ast), Compiler().generate_code(ast))
+      self.assertEqual(self.compile_and_run(source, StackParser), expected, source[:40])
+
+  def test_100k_levels(self):
+    for source, expected in nested_programs(100_000):
+      self.assertEqual(self.compile_and_run(source, StackParser), expected, source[:40])
+
+  def test_pinky_script(self):
+    # Every stage that pinky.py runs with --parser stack takes deep trees (with and without the optimizer)
+    with tempfile.TemporaryDirectory() as directory:
+      for i, (source, expected) in enumerate(nested_programs(3000)):
+        filename = os.path.join(directory, f'nested{i}.pinky')
+        with open(filename, 'w') as file:
+          file.write(source)
+        for flags in ([], ['--no-optimize']): # (the second run loads the AST from the cache, when it could be stored)
+          result = subprocess.run([sys.executable, 'pinky.py', filename, '--parser', 'stack'] + flags, capture_output=True, text=True)
+          self.assertEqual((result.returncode, result.stderr), (0, ''), source[:40])
+          self.assertTrue(result.stdout.endswith('\n' + expected), source[:40])
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,64 @@
+import io
+import json
+import unittest
+import itertools
+import contextlib
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+from resolver import *
+from untagged import *
+from profiler import *
+
+def parse(source):
+  return Parser(Lexer(source).tokenize()).parse()
+
+def profile(interpreter, ast, clock):
+  profiler = Profiler(interpreter, ast, clock)
+  with contextlib.redirect_stdout(io.StringIO()):
+    interpreter.interpret_ast(ast)
+  return profiler
+
+SOURCE = '''func fact(n)
+  if n <= 1 then ret 1 end
+  ret n * fact(n - 1)
+end
+x := 0
+for i := 1, 3 do
+  x := x + fact(i)
+end
+println x
+'''
+
+class TestProfiler(unittest.TestCase):
+  def test_counts(self):
+    for interpreter_class in (Interpreter, UntaggedInterpreter):
+      for ast in (parse(SOURCE), Resolver().resolve(parse(SOURCE))):
+        profiler = profile(interpreter_class(), ast, itertools.count().__next__)
+        data = profiler.as_dict()
+        self.assertEqual({item['line']: item['count'] for item in data['lines']}, {1: 1, 2: 9, 3: 3, 5: 1, 8: 1, 7: 3, 9: 1})
+        self.assertEqual({item['name']: item['count'] for item in data['functions']}, {'<main>': 1, 'fact': 6})
+
+  def test_times(self):
+    # A clock that ticks once every time it is read
+    profiler = profile(Interpreter(), parse(SOURCE), itertools.count().__next__)
+    fact, main = profiler.functions['fact', 1], profiler.functions['<main>', 0]
+    # The exclusive times add up to the time of the whole program, and of its statements (lines 1, 5, 8 and 9)
+    self.assertEqual(main.inclusive, sum(stats.exclusive for stats in profiler.functions.values()))
+    self.assertEqual(sum(profiler.lines[line].inclusive for line in (1, 5, 8, 9)), sum(stats.exclusive for stats in profiler.lines.values()))
+    # The recursive calls are included once (fact only calls itself, so its time is all exclusive)
+    self.assertEqual(fact.inclusive, fact.exclusive)
+    self.assertLess(fact.inclusive, main.inclusive)
+    self.assertEqual(json.loads(json.dumps(profiler.as_dict())), profiler.as_dict())
+
+  def test_unprofiled_interpreter(self):
+    # Profiling swaps the methods of one interpreter only
+    interpreter = Interpreter()
+    profile(Interpreter(), parse(SOURCE), itertools.count().__next__)
+    self.assertIs(interpreter.methods, Interpreter.methods)
+    self.assertIs(interpreter.methods[Stmts], Interpreter.interpret_Stmts)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,78 @@
+import ast
+import unittest
+from utils import *
+from tokens import *
+from interpreter import *
+from pyast import *
+from testing import *
+
+class TestPythonCompiler(SameOutput, unittest.TestCase):
+  skipped_scripts = () # (conformance with the Interpreter on every script)
+
+  def outputs(self, source):
+    for ast in [parse(source), optimized(source)]:
+      yield interpreter_output(PythonCompiler(), ast), interpreter_output(Interpreter(), ast)
+
+  def test_specialized_operations(self):
+    for expression in ['x + 1', '1 + x', 'x / 2', '2 / x', 'x / 0', '-x * -x', '(x + 1) ^ (x - 1)', 'x % 2 == 1', 'f() + 1',
+                       '1 < x', 's + 1', '1 + s', 's * 2', '2 - s', 's < "t"', 's / 1', '1 / s', '-s', '~b', 'b == true']:
+      for value in ['0', '3', '"str"', 'true', 'f()']:
+        self.assertSameOutput(f'func f() end\nx := {value}\ns := "s"\nb := false\nprintln {expression}')
+
+  def test_operands_are_evaluated_in_order(self):
+    self.assertSameOutput('x := 1 func f() x := 10 ret 2 end println x + f() println x * f() println x / f()')
+
+  def test_scopes(self):
+    self.assertSameOutput('''
+      n := 0
+      while n < 3 do
+        n := n + 1
+        if n > 1 then println y end
+        if n == 2 then y := n end
+        z := n
+        println z
+      end
+      if true then w := 1 end
+      println w
+    ''')
+    self.assertSameOutput('''
+      x := 1
+      func f(a)
+        local x := a
+        if a > 0 then
+          x := x + f(a - 1)
+        end
+        ret x
+      end
+      func g() println "g" end
+      println f(4)
+      println g()
+      for i := 1, 3 do y := i println x + y end
+      println i
+      println y
+    ''')
+
+  def test_functions(self):
+    self.assertSameOutput('''
+      func f() ret g() end
+      func g() ret h(1) end
+      if true then func h(a) ret a end println f() end
+      func h(a, b) ret b end
+      println f()
+      func g() ret 2 end
+      println f()
+    ''')
+    for call in ['f(1)', 'f(1, 2)', 'g()', 'f(1, 2, 3)']:
+      self.assertSameOutput(f'func f(a, b) ret a + b end\nfunc f(a) ret a end\nprintln {call}')
+
+  def test_runtime_errors(self):
+    for source in ['println z', 'if 1 then println 1 end', 'while "a" do end', 'println h()', 'x := 1 println -"a" + x']:
+      self.assertSameOutput(source)
+
+  def test_known_types_are_not_checked(self):
+    module = PythonCompiler().generate_module(parse('x := 1 y := "a" while x < 10 do x := x * 2 + 1 y := y + x end println y'))
+    self.assertNotIn('binop', ast.unparse(module))
+    self.assertNotIn('type(', ast.unparse(module))
+
+if __name__ == "__main__":
+  unittest.main()
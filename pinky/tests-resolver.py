@@ -0,0 +1,143 @@
+import unittest
+from utils import *
+from tokens import *
+from interpreter import *
+from testing import *
+
+def uses(node, name):
+  '''The nodes that read or assign a variable, in the order of the source'''
+  found = []
+  def walk(node):
+    if isinstance(node, (Assignment, LocalAssignment)):
+      walk(node.right)
+      if node.left.name == name:
+        found.append(node)
+    elif isinstance(node, Identifier) and node.name == name:
+      found.append(node)
+    elif isinstance(node, Node):
+      for field in node.__slots__:
+        walk(getattr(node, field, None))
+    elif isinstance(node, list):
+      for item in node:
+        walk(item)
+  walk(node)
+  return found
+
+class TestResolver(SameOutput, unittest.TestCase):
+  def outputs(self, source):
+    for optimize in (False, True):
+      plain, resolved = parse(source), parse(source)
+      if optimize:
+        plain, resolved = Optimizer().optimize(plain), Optimizer().optimize(resolved)
+      yield interpreter_output(Interpreter(), Resolver().resolve(resolved)), interpreter_output(Interpreter(), plain)
+
+  def test_static_names(self):
+    ast = Resolver().resolve(parse('''
+      x := 1
+      y := 2
+      if x > 0 then
+        z := x + y
+        println z
+      end
+    '''))
+    self.assertEqual(ast.scope.vars, {'x': 0, 'y': 1})
+    self.assertEqual(ast.stmts[2].then_stmts.scope.vars, {'z': 0})
+    self.assertEqual([(node.depth, node.slot) for node in uses(ast, 'x')], [(0, 0), (0, 0), (1, 0)])
+    self.assertEqual([(node.depth, node.slot) for node in uses(ast, 'y')], [(0, 1), (1, 1)])
+    self.assertEqual([(node.depth, node.slot) for node in uses(ast, 'z')], [(0, 0), (0, 0)])
+
+  def test_dynamic_names(self):
+    # y is bound in the loop body only from the second iteration on, x only if the body runs
+    ast = Resolver().resolve(parse('''
+      while true do
+        println y
+        y := 1
+      end
+      if true then x := 1 end
+      println x
+    '''))
+    self.assertEqual([node.depth for node in uses(ast, 'y')], [None, 0])
+    self.assertEqual([node.depth for node in uses(ast, 'x')], [0, None])
+
+  def test_functions(self):
+    ast = Resolver().resolve(parse('''
+      func f(a, b)
+        ret a + g(b)
+      end
+      func g(a) ret a * 2 end
+      println f(1, 2)
+    '''))
+    f, g, call = ast.stmts
+    self.assertEqual((f.slot, g.slot), (0, 1))
+    self.assertEqual([param.slot for param in f.params], [0, 1])
+    self.assertEqual(f.body_stmts.scope.size, 2)
+    # g is declared after f, but before f can be called
+    self.assertEqual((f.body_stmts.stmts[0].value.right.depth, call.value.depth), (None, 0))
+
+  def test_scopes_and_functions(self):
+    self.assertSameOutput('''
+      x := 1
+      func f(a)
+        local x := a
+        if a > 0 then
+          x := x + f(a - 1)
+        end
+        ret x
+      end
+      func g() println y end
+      println f(4)
+      println g()
+      y := "global"
+      println g()
+      for i := 1, 3 do y := i println x + y end
+      println i
+      for j := 3, 1 do end
+      println j
+      func h(a, a) ret a end
+      println h(1, 2)
+      println f(1, 2)
+    ''')
+
+  def test_elided_scopes(self):
+    # Blocks that bind no names run in the environment of the enclosing block, and do not count in the depths
+    ast = Resolver().resolve(parse('''
+      x := 0
+      func f() println x end
+      while x < 3 do
+        if x > 1 then
+          println x
+        else
+          local y := x
+        end
+        x := x + 1
+      end
+    '''))
+    func, loop = ast.stmts[1], ast.stmts[2]
+    if_stmt = loop.body_stmts.stmts[0]
+    self.assertFalse(ast.scope.elided)
+    self.assertEqual((func.body_stmts.scope.elided, loop.body_stmts.scope.elided), (True, True))
+    self.assertEqual((if_stmt.then_stmts.scope.elided, if_stmt.else_stmts.scope.elided), (True, False))
+    self.assertEqual([(node.depth, node.slot) for node in uses(ast, 'x')], [(0, 0), (0, 0), (0, 0), (0, 0), (0, 0), (1, 0), (0, 0), (0, 0)])
+    self.assertSameOutput('x := 0 func f() println x end while x < 3 do if x > 1 then f() else local y := x end x := x + 1 end')
+
+  def test_deep_trees(self):
+    # The resolver does not recurse, so it takes the trees of the StackParser, deeper than the Python stack
+    depth = 20_000
+    ast = StackParser(Lexer('x := 1 ' + 'if true then ' * depth + 'y := ' + '(' * depth + 'x' + ')' * depth + ' end' * depth).tokenize()).parse()
+    Resolver().resolve(ast)
+    assignments = [node for node in walk(ast) if isinstance(node, Assignment)]
+    read = assignments[-1].right
+    while isinstance(read, Grouping):
+      read = read.value
+    self.assertEqual([(node.depth, node.slot) for node in assignments + [read]], [(0, 0), (0, 0), (1, 0)]) # the scopes of the ifs around y are elided
+
+  def test_unresolved_environments(self):
+    env = Environment()
+    env.set_var('x', (TYPE_NUMBER, 1))
+    env.new_env().set_var('x', (TYPE_NUMBER, 2))
+    env.new_env().set_local('x', (TYPE_NUMBER, 3))
+    self.assertEqual(env.get_var('x'), (TYPE_NUMBER, 2))
+    self.assertEqual((env.scope.vars, env.scope.size), ({'x': 0}, 1))
+
+if __name__ == "__main__":
+  unittest.main()
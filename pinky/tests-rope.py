@@ -0,0 +1,69 @@
+import unittest
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+from compiler import *
+from vm import *
+import rope
+from rope import *
+from testing import *
+
+class TestRopes(unittest.TestCase):
+  def test_appends(self):
+    s = concat('a' * 200, 'b' * 100)
+    t = concat(s, 'c')
+    u = concat(s, 'd') # s was appended to already
+    v = concat(t, u)
+    self.assertEqual((type(s), type(t), type(u), type(v)), (Rope, Rope, Rope, Rope))
+    self.assertIs(s.pieces, t.pieces)
+    self.assertEqual((str(s), str(t), str(u)), ('a' * 200 + 'b' * 100, str(s) + 'c', str(s) + 'd'))
+    self.assertEqual(str(v), str(t) + str(u))
+    self.assertEqual(str(concat(v, 'e')), str(v) + 'e') # appended after it was joined
+    self.assertEqual([len(rope) for rope in (s, t, u, v)], [300, 301, 301, 602])
+    self.assertEqual(concat('short', ' string'), 'short string')
+    self.assertEqual(type(concat('short', s)), Rope)
+
+  def test_comparisons(self):
+    s = concat('a' * 300, 'b')
+    text = 'a' * 300 + 'b'
+    self.assertTrue(s == text and text == s and s == concat('a' * 300, 'b'))
+    self.assertFalse(s != text or text != s)
+    self.assertTrue(s > 'a' and 'b' > s and s >= text and s <= text and s < 'b')
+    self.assertFalse(s == 1 or s == True)
+    self.assertEqual({s: 1}[text], 1)
+    self.assertEqual((stringify(s), repr(s)), (text, repr(text)))
+
+  def test_programs(self):
+    # Every concatenation builds a rope, with the same output as with Python strings
+    source = '''
+      s := ""
+      t := "x"
+      i := 0
+      while i < 20 do
+        s := s + i
+        if i == 10 then t := s end
+        if i % 3 == 0 then s := true + s end
+        i := i + 1
+      end
+      println s
+      println t + s
+      println s == t
+      println t < s
+      println (t + "") == t
+      println "[" + t + "]"
+    '''
+    outputs = []
+    for threshold in (0, 1000):
+      saved, rope.ROPE_THRESHOLD = rope.ROPE_THRESHOLD, threshold
+      try:
+        outputs.append(output(lambda: Interpreter().interpret_ast(parse(source))))
+        outputs.append(output(lambda: VM().run(Compiler().generate_code(parse(source)))))
+      finally:
+        rope.ROPE_THRESHOLD = saved
+    self.assertEqual(outputs, [outputs[0]] * 4)
+    self.assertEqual(outputs[0].splitlines()[2:], ['false', 'true', 'true', '[' + 'true' * 4 + '012345678910]'])
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,67 @@
+import io
+import sys
+import unittest
+import contextlib
+from utils import *
+from tokens import *
+from lexer import *
+from parser import *
+from interpreter import *
+from resolver import *
+from compiler import *
+from vm import *
+from sampler import *
+
+def parse(source):
+  return Parser(Lexer(source).tokenize()).parse()
+
+SOURCE = '''
+func g(n)
+  println n
+  ret n
+end
+func f(n)
+  if n > 0 then ret f(n - 1) end
+  ret g(n)
+end
+println f(2)
+'''
+
+class StackRecorder(Interpreter):
+  '''Records the Pinky stack every time something is printed'''
+  def __init__(self):
+    super().__init__()
+    self.stacks = []
+
+  def interpret_PrintStmt(self, node, env):
+    self.stacks.append(interpreter_stack(sys._getframe()))
+    return super().interpret_PrintStmt(node, env)
+
+class TestSampler(unittest.TestCase):
+  def test_interpreter_stack(self):
+    for ast in (parse(SOURCE), Resolver().resolve(parse(SOURCE))):
+      interpreter = StackRecorder()
+      with contextlib.redirect_stdout(io.StringIO()):
+        interpreter.interpret_ast(ast)
+      self.assertEqual(interpreter.stacks, [[], ['f', 'f', 'f', 'g']]) # (the outer println runs first)
+
+  def test_collapsed_stacks(self):
+    sampler = Sampler(rate=10000)
+    source = 'func fib(n) if n < 2 then ret n end ret fib(n - 1) + fib(n - 2) end println fib(18)'
+    with contextlib.redirect_stdout(io.StringIO()):
+      with sampler.sampling('interpreter', interpreter_stack):
+        Interpreter().interpret_ast(parse(source))
+      code = Compiler().generate_code(parse(source))
+      vm = VM()
+      with sampler.sampling('vm', lambda frame: [frame.name for frame in vm.frames]):
+        vm.run(code)
+    self.assertGreater(len(sampler.samples), 1)
+    for line in sampler.collapsed().splitlines():
+      stack, count = line.rsplit(' ', 1)
+      root, *names = stack.split(';')
+      self.assertIn(root, ('interpreter', 'vm'))
+      self.assertEqual(set(names) - {'fib'}, set())
+      self.assertGreater(int(count), 0)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+from utils import *
+from tokens import *
+from interpreter import *
+from untagged import *
+from testing import *
+
+class TestUntaggedInterpreter(SameOutput, unittest.TestCase):
+  def outputs(self, source):
+    for ast in [parse(source), resolved(source)]:
+      yield interpreter_output(UntaggedInterpreter(), ast), interpreter_output(Interpreter(), ast)
+
+  def test_operations(self):
+    for expression in ['x + 1', '1 + x', 'x / 2', '2 / x', 'x / 0', '-x', '~x', '+x', 'x ^ 0.5', 'x % 2 == 1', 'x < "t"',
+                       'x == 0', 'x == false', 'x ~= true', 'x * 2', 'x - 1', 'x + "s"', 'x or 1', 'x and 1']:
+      for value in ['0', '3', '-8', '"str"', 'true', 'false', 'f()']:
+        self.assertSameOutput(f'func f() end\nx := {value}\nprintln {expression}')
+
+  def test_bools_are_not_numbers(self):
+    self.assertIn('Unsupported operator', interpreter_output(UntaggedInterpreter(), parse('println true == 1')))
+    self.assertIn('Unsupported operator', interpreter_output(UntaggedInterpreter(), parse('println 1 + true')))
+    self.assertIn('not a boolean', interpreter_output(UntaggedInterpreter(), parse('if 1 then println 1 end')))
+    self.assertEqual(interpreter_output(UntaggedInterpreter(), parse('println (1 < 2) == true')), 'true\n')
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from model import *
+from visitor import *
+from interpreter import *
+from compiler import *
+
+class Counter(Visitor):
+  prefix = 'count_'
+
+  def count_Expr(self, node):
+    return 'expr'
+
+  def count_BinOp(self, node):
+    return 'binop'
+
+class TestVisitor(unittest.TestCase):
+  def test_every_node_class_has_an_entry(self):
+    for walker in (Interpreter, Compiler, Counter):
+      for node_class in node_classes():
+        self.assertIn(node_class, walker.methods)
+
+  def test_closest_base_class_method(self):
+    self.assertEqual(Counter.methods[BinOp], Counter.count_BinOp)
+    self.assertEqual(Counter.methods[Integer], Counter.count_Expr)
+    self.assertEqual(Counter.methods[PrintStmt], Counter.ignore)
+
+  def test_subclass_gets_its_own_table(self):
+    class Override(Counter):
+      def count_Integer(self, node):
+        return 'integer'
+    self.assertEqual(Override.methods[Integer], Override.count_Integer)
+    self.assertEqual(Override.methods[BinOp], Counter.count_BinOp)
+    self.assertEqual(Counter.methods[Integer], Counter.count_Expr)
+
+  def test_operator_tables(self):
+    # The parser can build an operation node for any of these tokens
+    for token_type in (TOK_PLUS, TOK_MINUS, TOK_STAR, TOK_SLASH, TOK_MOD, TOK_CARET, TOK_GT, TOK_GE, TOK_LT, TOK_LE, TOK_EQEQ, TOK_NE):
+      self.assertIn(token_type, BINOPS)
+      self.assertIn(token_type, BINOP_CODE)
+    for token_type in (TOK_MINUS, TOK_PLUS, TOK_NOT):
+      self.assertIn(token_type, UNOPS)
+      self.assertIn(token_type, UNOP_CODE)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,3 +1,6 @@
+from array import array
+from enum import IntEnum
+
 ###############################################################################
 # Constants for different token types
 ###############################################################################
@@ -55,6 +58,15 @@ TOK_PRINT      = 'TOK_PRINT'
 TOK_PRINTLN    = 'TOK_PRINTLN'
 TOK_RET        = 'TOK_RET'
 
+###############################################################################
+# Small integer kinds for the token types (used by the compact token stream)
+###############################################################################
+TOKEN_TYPES = [value for name, value in list(globals().items()) if name.startswith('TOK_')]
+
+TokenKind = IntEnum('TokenKind', TOKEN_TYPES, start=0)
+
+TOKEN_KINDS = {token_type: TokenKind[token_type].value for token_type in TOKEN_TYPES}
+
 ###############################################################################
 # Dictionary mapping keywords and their token types
 ###############################################################################
@@ -88,3 +100,48 @@ class Token:
     self.line = line
   def __repr__(self):
     return f'({self.token_type}, {self.lexeme!r}, {self.line})'
+
+
+###############################################################################
+# Compact token stream
+###############################################################################
+class CompactTokens:
+  '''
+  A token stream stored as parallel arrays instead of one Token object per token:
+  the token kinds as small ints (see TokenKind), the start/end offsets of each
+  lexeme in the source, and the line numbers. Lexemes are only sliced out of the
+  source (and Token objects only created) when someone asks for them.
+  '''
+  def __init__(self, source):
+    self.source = source # A str, or a bytes-like object (bytes, memoryview, mmap) with UTF-8 text
+    self.decode = not isinstance(source, str)
+    self.kinds = array('B')
+    self.starts = array('I')
+    self.ends = array('I')
+    self.lines = array('I')
+
+  def add(self, kind, start, end, line):
+    self.kinds.append(kind)
+    self.starts.append(start)
+    self.ends.append(end)
+    self.lines.append(line)
+
+  def token_type(self, i):
+    return TOKEN_TYPES[self.kinds[i]]
+
+  def lexeme(self, i):
+    text = self.source[self.starts[i]:self.ends[i]]
+    return bytes(text).decode('utf-8') if self.decode else text
+
+  def __len__(self):
+    return len(self.kinds)
+
+  def __getitem__(self, i):
+    return Token(TOKEN_TYPES[self.kinds[i]], self.lexeme(i), self.lines[i])
+
+  def __iter__(self):
+    for i in range(len(self.kinds)):
+      yield self[i]
+
+  def __repr__(self):
+    return repr(list(self))
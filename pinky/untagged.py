@@ -0,0 +1,137 @@
+###############################################################################
+# Interpreter on untagged values.
+#
+# The Interpreter represents every runtime value as a (type, value) tuple, so
+# every operation allocates a tuple for its result on top of the value, and
+# checks the types of its operands by comparing the tags. This interpreter
+# walks the same tree with the values themselves:
+#
+#   (TYPE_NUMBER, 3.0)  -->  3.0
+#   (TYPE_STRING, 'a')  -->  'a'
+#   (TYPE_BOOL, True)   -->  True
+#
+# and checks their types with the Python type (type(x) is float, never
+# isinstance(), as bool is a subclass of int and true is not a number). The
+# operations on numbers are done inline, the other ones are given to the
+# operator handlers with the tag of the Python type.
+###############################################################################
+from defs import *
+from utils import *
+from model import *
+from tokens import *
+from state import *
+from interpreter import *
+
+# The Python operation of each arithmetic/comparison operator when both operands are numbers
+OPERATIONS = {op: operation for op, (resulttype, operation) in NUMBER_OPS.items()}
+
+class UntaggedInterpreter(Interpreter):
+  nothing = 0
+
+  def interpret_Integer(self, node, env):
+    return float(node.value)
+
+  def interpret_Float(self, node, env):
+    return float(node.value)
+
+  def interpret_String(self, node, env):
+    return str(node.value)
+
+  def interpret_Bool(self, node, env):
+    return node.value
+
+  def interpret_Identifier(self, node, env):
+    if node.depth is None:
+      value = env.get_var(node.name) # resolved at runtime
+    else:
+      value = env.ancestor(node.depth).values[node.slot]
+    if value is None:
+      runtime_error(f'Undeclared identifier {node.name!r}', node.line)
+    return value
+
+  def interpret_Assignment(self, node, env):
+    value = self.interpret(node.right, env)
+    if node.depth is None:
+      env.set_var(node.left.name, value)
+    else:
+      env.ancestor(node.depth).values[node.slot] = value
+
+  def interpret_LocalAssignment(self, node, env):
+    value = self.interpret(node.right, env)
+    if node.slot is None:
+      env.set_local(node.left.name, value)
+    else:
+      env.values[node.slot] = value
+
+  def interpret_BinOp(self, node, env):
+    leftval = self.interpret(node.left, env)
+    rightval = self.interpret(node.right, env)
+    if type(leftval) is float and type(rightval) is float and (rightval or node.op.token_type != TOK_SLASH):
+      return OPERATIONS[node.op.token_type](leftval, rightval) # (the handler reports the division by zero)
+    return untagged_binop(node, leftval, rightval)
+
+  def interpret_UnOp(self, node, env):
+    operandval = self.interpret(node.operand, env)
+    if node.op.token_type == TOK_MINUS and type(operandval) is float:
+      return -operandval
+    return untagged_unop(node, operandval)
+
+  def interpret_LogicalOp(self, node, env):
+    leftval = self.interpret(node.left, env)
+    if node.op.token_type == TOK_OR:
+      if leftval:
+        return leftval
+    elif node.op.token_type == TOK_AND:
+      if not leftval:
+        return leftval
+    return self.interpret(node.right, env)
+
+  def memo_key(self, func_decl, args):
+    # true and 1.0 are equal, so the types are part of the key
+    for argval in args:
+      if not memoizable(argval):
+        return None
+    return (func_decl, *args, *map(type, args))
+
+  def interpret_PrintStmt(self, node, env):
+    self.output.write(stringify(self.interpret(node.value, env)) + node.end)
+
+  def interpret_IfStmt(self, node, env):
+    testval = self.interpret(node.test, env)
+    if type(testval) is not bool:
+      runtime_error("Condition test is not a boolean expression.", node.line)
+    if testval:
+      return self.interpret(node.then_stmts, self.block_env(node.then_stmts, env))
+    elif node.else_stmts is not None:
+      return self.interpret(node.else_stmts, self.block_env(node.else_stmts, env))
+
+  def interpret_WhileStmt(self, node, env):
+    new_env = self.block_env(node.body_stmts, env)
+    while True:
+      testval = self.interpret(node.test, env)
+      if type(testval) is not bool:
+        runtime_error(f'While test is not a boolean expression.', node.line)
+      if not testval:
+        break
+      result = self.interpret(node.body_stmts, new_env)
+      if result is not None:
+        return result
+
+  def interpret_ForStmt(self, node, env):
+    i = self.interpret(node.start, env)
+    end = self.interpret(node.end, env)
+    block_new_env = self.block_env(node.body_stmts, env)
+    up = i < end
+    if node.step is None:
+      step = 1 if up else -1
+    else:
+      step = self.interpret(node.step, env)
+    values, slot = loop_slot(env, node.ident)
+    for value in loop_values(i, end, step, up):
+      if values is None:
+        env.set_var(node.ident.name, value)
+      else:
+        values[slot] = value
+      result = self.interpret(node.body_stmts, block_new_env)
+      if result is not None:
+        return result
@@ -1,3 +1,6 @@
+import codecs
+from output import *
+
 def print_pretty_ast(ast_text):
   i = 0
   newline = False
@@ -35,27 +38,45 @@ def stringify(val):
     return str(int(val))
   return str(val)
 
+def decode_escapes(text):
+  '''
+  Resolve the escape sequences (\\n, \\t, \\", ...) of a string literal.
+  This is done once when the String node is built, so printing does not have to.
+  Text that is not a valid escape sequence (e.g. a trailing backslash) is kept as is.
+  As the value of the string is the decoded text, comparisons see it too: "\\t" < "0"
+  compares a tab (before it compared a backslash).
+  '''
+  try:
+    return codecs.escape_decode(bytes(text, "utf-8"))[0].decode("utf-8")
+  except (ValueError, UnicodeDecodeError):
+    return text
+
 def lexing_error(message, lineno):
+  flush_outputs() # what the program printed comes first
   print(f'{Colors.RED}[Line {lineno}]: {message} {Colors.WHITE}')
   import sys
   sys.exit(1)
 
 def parse_error(message, lineno):
+  flush_outputs() # what the program printed comes first
   print(f'{Colors.RED}[Line {lineno}]: {message} {Colors.WHITE}')
   import sys
   sys.exit(1)
 
 def runtime_error(message, lineno):
+  flush_outputs() # what the program printed comes first
   print(f'{Colors.RED}[Line {lineno}]: {message} {Colors.WHITE}')
   import sys
   sys.exit(1)
 
 def compile_error(message, lineno):
+  flush_outputs() # what the program printed comes first
   print(f'{Colors.RED}[Line {lineno}]: {message} {Colors.WHITE}')
   import sys
   sys.exit(1)
 
 def vm_error(message, pc):
+  flush_outputs()
   print(f'{Colors.RED}[PC: {pc}]: {message} {Colors.WHITE}')
   import sys
   sys.exit(1)
@@ -0,0 +1,77 @@
+###############################################################################
+# Shared dispatch infrastructure for the tree walkers (Interpreter, Compiler,
+# LLVMGenerator).
+#
+# Instead of testing the node against a long chain of isinstance checks on
+# every visit, a walker defines one method per node class, named after it
+# with a prefix (interpret_BinOp, compile_IfStmt, generate_WhileStmt, ...),
+# and dispatches with a single dict lookup on type(node):
+#
+#   self.methods[type(node)](self, node, ...)
+#
+# The table is built once per walker class, when the class is created. Each
+# node class gets the method of its closest base class that has one (so a
+# method can handle a whole family of nodes), and node classes without any
+# method get ignore(), which does nothing, as the isinstance chains did.
+#
+# The analyses that run on every program before it runs (Resolver, Purity)
+# are PendingVisitors, which do not recurse, so they take trees deeper than
+# the Python stack (the ones of the StackParser). Their methods do what they
+# can right away, and leave the children of the node, and what comes after
+# them (as functions), to be done next with then().
+###############################################################################
+from model import *
+
+def node_classes():
+  '''Every concrete and abstract node class of the model'''
+  classes, pending = [], [Node]
+  while pending:
+    node_class = pending.pop()
+    classes.append(node_class)
+    pending.extend(node_class.__subclasses__())
+  return classes
+
+class Visitor:
+  prefix = None
+
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+    if cls.prefix is not None:
+      cls.methods = cls.dispatch_table()
+
+  @classmethod
+  def dispatch_table(cls):
+    '''The table {node class: function} of this walker class'''
+    table = {}
+    for node_class in node_classes():
+      table[node_class] = cls.ignore
+      for base in node_class.__mro__:
+        method = getattr(cls, cls.prefix + base.__name__, None)
+        if method is not None:
+          table[node_class] = method
+          break
+    return table
+
+  def ignore(self, node, *args):
+    return None
+
+
+class PendingVisitor(Visitor):
+  def run(self, *items):
+    '''Visit nodes and call functions, in order, and everything they leave to do'''
+    self.pending = []
+    self.then(*items)
+    pending = self.pending
+    while pending:
+      item = pending.pop()
+      if isinstance(item, Node):
+        self.methods[type(item)](self, item)
+      elif item is not None:
+        item()
+
+  def then(self, *items):
+    '''
+    Visit nodes and call functions (None is skipped), in order, before what
+    was pending. A method calls it once, as the items of a later call come first.
+    '''
+    self.pending.extend(reversed(items))
@@ -58,7 +58,7 @@
 
 from defs import *
 from utils import *
-import codecs
+from rope import *
 
 class Frame:
   def __init__(self, name, ret_pc, fp):
@@ -67,7 +67,8 @@ class Frame:
     self.fp = fp
 
 class VM:
-  def __init__(self):
+  def __init__(self, output=None):
+    self.output = output or Output() # where PRINT and PRINTLN write
     self.stack = []
     self.frames = []
     self.labels = {}
@@ -93,10 +94,13 @@ class VM:
     # Generate a dict with label names and their corresponding PC positions/addresses in the code
     self.create_label_table(instructions)
 
-    while self.is_running:
-      opcode, *args = instructions[self.pc]
-      self.pc = self.pc + 1
-      getattr(self, opcode)(*args) #--> invoke the method that matches the opcode name
+    try:
+      while self.is_running:
+        opcode, *args = instructions[self.pc]
+        self.pc = self.pc + 1
+        getattr(self, opcode)(*args) #--> invoke the method that matches the opcode name
+    finally:
+      self.output.flush()
 
   def PUSH(self, value):
     self.stack.append(value)
@@ -112,7 +116,7 @@ class VM:
     if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
       self.PUSH((TYPE_NUMBER, leftval + rightval))
     elif lefttype == TYPE_STRING or righttype == TYPE_STRING:
-      self.PUSH((TYPE_STRING, stringify(leftval) + stringify(rightval)))
+      self.PUSH((TYPE_STRING, concat_values(leftval, rightval))) # (long strings are Ropes)
     else:
       vm_error(f'Error on ADD between {lefttype} and {righttype}.', self.pc - 1)
 
@@ -259,11 +263,11 @@ class VM:
 
   def PRINT(self):
     valtype, val = self.POP()
-    print(codecs.escape_decode(bytes(stringify(val), "utf-8"))[0].decode("utf-8"), end='')
+    self.output.write(stringify(val))
 
   def PRINTLN(self):
     valtype, val = self.POP()
-    print(codecs.escape_decode(bytes(stringify(val), "utf-8"))[0].decode("utf-8"), end='\n')
+    self.output.write(stringify(val) + '\n')
 
   def LABEL(self, name):
     pass